@@ -7,6 +7,7 @@ class Migration(migrations.Migration):
 
     dependencies = [
         ("accounts", "0002_alter_user_username"),
+        ("products", "0001_initial"),
     ]
 
     operations = [
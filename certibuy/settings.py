@@ -46,6 +46,79 @@ CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_BROKER_CONNECTION_RETRY = True
 CELERY_BROKER_CONNECTION_MAX_RETRIES = 3  # Limit retries
 CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'  # Sync mode for testing
+# Broker health is cached per process (orders.services.broker) instead of pinged per notification
+CELERY_BROKER_HEALTH_TTL = float(os.environ.get('CELERY_BROKER_HEALTH_TTL', '15'))
+CELERY_BROKER_HEALTH_TIMEOUT = float(os.environ.get('CELERY_BROKER_HEALTH_TIMEOUT', '0.5'))
+# Queues: transactional (receipts, payments, refunds), bulk (backfills, replays) and reconciliation
+# (periodic sweeps). A plain `celery worker` consumes all three; in production run one worker per
+# queue so a bulk run cannot starve receipts, e.g.
+#   celery -A certibuy worker -Q transactional -c 8
+#   celery -A certibuy worker -Q bulk -c 2
+#   celery -A certibuy worker -Q reconciliation -c 2
+CELERY_TASK_QUEUES = {
+    'transactional': {'routing_key': 'transactional'},
+    'bulk': {'routing_key': 'bulk'},
+    'reconciliation': {'routing_key': 'reconciliation'},
+}
+CELERY_TASK_DEFAULT_QUEUE = 'transactional'
+CELERY_TASK_ROUTES = {
+    'orders.tasks.deliver_bulk_notifications': {'queue': 'bulk'},
+    'orders.tasks.release_expired_stock_reservations': {'queue': 'reconciliation'},
+    'orders.tasks.process_due_refunds': {'queue': 'reconciliation'},
+    'orders.tasks.reconcile_*': {'queue': 'reconciliation'},
+    'orders.tasks.archive_notification_logs': {'queue': 'reconciliation'},
+    'core.tasks.*': {'queue': 'reconciliation'},
+}
+CELERY_TASK_ANNOTATIONS = {
+    # Each run sends one NOTIFICATION_BULK_BATCH_SIZE batch
+    'orders.tasks.deliver_bulk_notifications': {
+        'rate_limit': os.environ.get('NOTIFICATION_BULK_RATE_LIMIT', '12/m'),
+    },
+}
+# Take one task at a time so a worker never sits on a prefetched backlog
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-stock-reservations': {
+        'task': 'orders.tasks.release_expired_stock_reservations',
+        'schedule': 60.0,  # every minute
+    },
+    'reconcile-admin-summary-counters': {
+        'task': 'core.tasks.reconcile_admin_summary_counters',
+        'schedule': 300.0,  # every 5 minutes
+    },
+    'refresh-admin-dashboard-snapshot': {
+        'task': 'core.tasks.refresh_dashboard_snapshot',
+        'schedule': 120.0,  # every 2 minutes
+    },
+    'process-payment-webhooks': {
+        'task': 'orders.tasks.process_payment_webhooks',
+        'schedule': 30.0,  # safety net; the webhook view also queues a run
+    },
+    'process-due-refunds': {
+        'task': 'orders.tasks.process_due_refunds',
+        'schedule': 60.0,  # every minute
+    },
+    'reconcile-refund-statuses': {
+        'task': 'orders.tasks.reconcile_refund_statuses',
+        'schedule': 600.0,  # every 10 minutes
+    },
+    'reconcile-pending-payments': {
+        'task': 'orders.tasks.reconcile_pending_payments',
+        'schedule': 900.0,  # every 15 minutes
+    },
+    'deliver-pending-notifications': {
+        'task': 'orders.tasks.deliver_pending_notifications',
+        'schedule': 60.0,  # safety net and retries; notify() also queues a run
+    },
+    'deliver-bulk-notifications': {
+        'task': 'orders.tasks.deliver_bulk_notifications',
+        'schedule': 300.0,  # every 5 minutes
+    },
+    'archive-notification-logs': {
+        'task': 'orders.tasks.archive_notification_logs',
+        'schedule': 86400.0,  # daily
+    },
+}
 
 # SMS Configuration (MSG91)
 MSG91_API_KEY = os.environ.get('MSG91_API_KEY', '')
@@ -58,6 +131,30 @@ FAST2SMS_SENDER_ID = os.environ.get('FAST2SMS_SENDER_ID', 'CERTBY')
 
 # SMS Provider Selection ('msg91' or 'fast2sms')
 SMS_PROVIDER = os.environ.get('SMS_PROVIDER', 'msg91')
+# SMS dispatcher (orders.services.sms_service): pooled sessions, batching, health tracking
+MSG91_BASE_URL = os.environ.get('MSG91_BASE_URL', 'https://api.msg91.com')
+FAST2SMS_BASE_URL = os.environ.get('FAST2SMS_BASE_URL', 'https://www.fast2sms.com')
+SMS_CONNECT_TIMEOUT = float(os.environ.get('SMS_CONNECT_TIMEOUT', '3'))
+SMS_READ_TIMEOUT = float(os.environ.get('SMS_READ_TIMEOUT', '10'))
+SMS_POOL_SIZE = int(os.environ.get('SMS_POOL_SIZE', '10'))
+SMS_BATCH_SIZE = int(os.environ.get('SMS_BATCH_SIZE', '100'))
+SMS_RATE_LIMIT_PER_SECOND = float(os.environ.get('SMS_RATE_LIMIT_PER_SECOND', '20'))  # per provider
+SMS_PROVIDER_FAILURE_THRESHOLD = int(os.environ.get('SMS_PROVIDER_FAILURE_THRESHOLD', '3'))
+SMS_PROVIDER_COOLDOWN = float(os.environ.get('SMS_PROVIDER_COOLDOWN', '60'))
+# Customer emails/SMS delivered per batch (orders.services.notifications); one SMTP connection per batch
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', '200'))
+# Events of one order raised within this many seconds go out as one email and one SMS
+NOTIFICATION_COALESCE_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_SECONDS', '10'))
+NOTIFICATION_BULK_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BULK_BATCH_SIZE', '100'))
+# Failed sends are retried with exponential backoff and jitter, then kept as dead letters ('failed')
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '5'))
+NOTIFICATION_RETRY_BASE_SECONDS = int(os.environ.get('NOTIFICATION_RETRY_BASE_SECONDS', '30'))
+NOTIFICATION_RESPONSE_LOG_CHARS = int(os.environ.get('NOTIFICATION_RESPONSE_LOG_CHARS', '500'))
+# A claimed batch is hidden from other workers this long; rows of a worker that died are retried after it
+NOTIFICATION_LEASE_SECONDS = int(os.environ.get('NOTIFICATION_LEASE_SECONDS', '300'))
+# Sent/failed logs older than this are moved to monthly .jsonl.gz files (archive_notifications)
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '90'))
+NOTIFICATION_ARCHIVE_DIR = os.environ.get('NOTIFICATION_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'notifications'))
 
 if DEBUG:
     ALLOWED_HOSTS = ['*']
@@ -168,13 +265,27 @@ LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
-# Caching for login throttling
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-certibuy',
+# Caching for login throttling and the admin summary counters. Set CACHE_URL (Redis)
+# in production so every web worker and the Celery worker share one cache.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-certibuy',
+        }
+    }
+
+# Seconds a cached admin summary counter is trusted before it is recounted. Bounds the
+# drift of per-process caches; with a shared cache it only backs up reconcile().
+ADMIN_SUMMARY_COUNTER_TTL = int(os.environ.get('ADMIN_SUMMARY_COUNTER_TTL', '60'))
 
 # Session Security
 SESSION_COOKIE_HTTPONLY = True
@@ -383,7 +494,50 @@ JAZZMIN_UI_TWEAKS = {
 # Replace these with your actual test credentials
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_SAMPLE_KEY_ID_REPLACE_ME')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'SAMPLE_SECRET_KEY_REPLACE_ME')
+# Gateway adapter (orders.services.payment_gateway): one pooled client per process
+RAZORPAY_BASE_URL = os.environ.get('RAZORPAY_BASE_URL') or None  # None = api.razorpay.com
+RAZORPAY_CONNECT_TIMEOUT = float(os.environ.get('RAZORPAY_CONNECT_TIMEOUT', '3'))
+RAZORPAY_READ_TIMEOUT = float(os.environ.get('RAZORPAY_READ_TIMEOUT', '10'))
+RAZORPAY_POOL_SIZE = int(os.environ.get('RAZORPAY_POOL_SIZE', '10'))
+RAZORPAY_MAX_RETRIES = int(os.environ.get('RAZORPAY_MAX_RETRIES', '2'))  # idempotent calls only
+RAZORPAY_BREAKER_THRESHOLD = int(os.environ.get('RAZORPAY_BREAKER_THRESHOLD', '5'))
+RAZORPAY_BREAKER_COOLDOWN = float(os.environ.get('RAZORPAY_BREAKER_COOLDOWN', '30'))
+# Webhooks (orders.services.webhooks): when set, the checkout callback only checks the signature and the
+# payment.captured webhook confirms the order after checking the amount
+RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+PAYMENT_WEBHOOK_BATCH_SIZE = int(os.environ.get('PAYMENT_WEBHOOK_BATCH_SIZE', '100'))
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_WEBHOOK_MAX_ATTEMPTS', '5'))
+# Seconds before the first retry of a webhook whose order is not there yet; doubles per attempt
+PAYMENT_WEBHOOK_RETRY_SECONDS = int(os.environ.get('PAYMENT_WEBHOOK_RETRY_SECONDS', '30'))
+# Refund queue (orders.services.refunds)
+REFUND_MAX_ATTEMPTS = int(os.environ.get('REFUND_MAX_ATTEMPTS', '8'))
+REFUND_RETRY_BASE_SECONDS = int(os.environ.get('REFUND_RETRY_BASE_SECONDS', '30'))
+REFUND_LEASE_SECONDS = int(os.environ.get('REFUND_LEASE_SECONDS', '300'))
+REFUND_RECONCILE_BATCH_SIZE = int(os.environ.get('REFUND_RECONCILE_BATCH_SIZE', '100'))
+# Pending payment reconciliation (orders.services.reconciliation)
+PAYMENT_RECONCILE_AFTER_MINUTES = int(os.environ.get('PAYMENT_RECONCILE_AFTER_MINUTES', '30'))
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.environ.get('PAYMENT_RECONCILE_BATCH_SIZE', '200'))
+PAYMENT_RECONCILE_CONCURRENCY = int(os.environ.get('PAYMENT_RECONCILE_CONCURRENCY', '8'))  # keep <= RAZORPAY_POOL_SIZE
 
 # Order Configuration
 ORDER_DELIVERY_DAYS = 5
 ORDER_RETURN_WINDOW_DAYS = 7
+# Minutes an unpaid checkout holds its stock before it is returned to the shelf
+STOCK_RESERVATION_MINUTES = int(os.environ.get('STOCK_RESERVATION_MINUTES', '15'))
+
+# Shop search: seconds before the in-process product index is rebuilt (non-PostgreSQL only)
+PRODUCT_SEARCH_INDEX_TTL = int(os.environ.get('PRODUCT_SEARCH_INDEX_TTL', '300'))
+
+# Admin dashboard notifications: identical events within this many seconds are stored once (0 disables)
+ADMIN_NOTIFICATION_DEDUP_SECONDS = int(os.environ.get('ADMIN_NOTIFICATION_DEDUP_SECONDS', '300'))
+
+# Admin dashboard KPIs are served from a snapshot at most this many seconds old
+ADMIN_DASHBOARD_SNAPSHOT_MAX_AGE = int(os.environ.get('ADMIN_DASHBOARD_SNAPSHOT_MAX_AGE', '300'))
+
+# Live admin notification stream (SSE, needs an ASGI server). Events are fanned out
+# through this Redis channel when it answers, otherwise only within the publishing process.
+ADMIN_EVENTS_REDIS_URL = os.environ.get('ADMIN_EVENTS_REDIS_URL', '')
+# Seconds between keep-alive comments on an idle stream
+ADMIN_EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('ADMIN_EVENTS_KEEPALIVE_SECONDS', '15'))
+# Counter changes within this many seconds are pushed to the dashboards as one summary
+ADMIN_EVENTS_SUMMARY_DELAY = float(os.environ.get('ADMIN_EVENTS_SUMMARY_DELAY', '1'))
@@ -6,3 +6,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "certibuy.settings")
 
 application = get_wsgi_application()
+
+# Start building the in-memory search indexes in the background, so the first shop
+# request and keystroke find them ready
+from products import autocomplete, search  # noqa: E402
+
+search.warm_up()
+autocomplete.warm_up()
@@ -0,0 +1,118 @@
+"""
+Cached counters for the admin notification dashboard summary cards.
+
+Each metric lives in the cache and is adjusted incrementally by the
+order, product and notification write paths (after commit), so serving
+the cards costs no aggregate queries. Metrics missing from the cache are
+recounted on demand, and reconcile() recounts everything periodically to
+correct drift from writes that bypass signals (queryset updates).
+
+Every value expires after ADMIN_SUMMARY_COUNTER_TTL seconds and is then
+recounted. That is what keeps a local-memory cache honest: each process
+has its own copy, never sees increments made by the others, and is not
+touched by reconcile() running in the Celery worker. Configure a shared
+cache (CACHE_URL) so increments and reconcile() reach every process.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'admin_summary'
+METRICS = (
+    'new_orders_today',
+    'pending_refunds',
+    'failed_payments',
+    'unread_notifications',
+    'low_stock_alerts',
+)
+REFUND_DONE_STATUSES = ('processed', 'success', 'completed')
+
+
+def _ttl():
+    return getattr(settings, 'ADMIN_SUMMARY_COUNTER_TTL', 60)
+
+
+def _key(metric, day=None):
+    if metric == 'new_orders_today':
+        # Keyed by date so the counter starts over at midnight
+        return f'{KEY_PREFIX}:{metric}:{(day or timezone.localdate()).isoformat()}'
+    return f'{KEY_PREFIX}:{metric}'
+
+
+def _count(metric):
+    from orders.models import Order
+    from products.models import Product
+    from .models import Notification
+
+    if metric == 'new_orders_today':
+        return Order.objects.filter(created_at__date=timezone.localdate()).count()
+    if metric == 'pending_refunds':
+        return Order.objects.filter(refund_id__isnull=False).exclude(
+            refund_status__in=REFUND_DONE_STATUSES
+        ).count()
+    if metric == 'failed_payments':
+        return Order.objects.filter(payment_status='failed').count()
+    if metric == 'unread_notifications':
+        return Notification.objects.filter(is_read=False).count()
+    if metric == 'low_stock_alerts':
+        return Product.objects.filter(stock_quantity__lte=F('low_stock_threshold')).count()
+    raise ValueError(f"Unknown summary metric: {metric}")
+
+
+def get_summary():
+    """Current value of every metric, recounting only those missing from the cache"""
+    keys = {metric: _key(metric) for metric in METRICS}
+    cached = cache.get_many(keys.values())
+    summary = {}
+    missing = {}
+    for metric, key in keys.items():
+        if key in cached:
+            summary[metric] = cached[key]
+        else:
+            summary[metric] = missing[key] = _count(metric)
+    if missing:
+        cache.set_many(missing, timeout=_ttl())
+    return summary
+
+
+def reconcile():
+    """Recount every metric from the database and overwrite the cache"""
+    values = {_key(metric): _count(metric) for metric in METRICS}
+    cache.set_many(values, timeout=_ttl())
+    logger.info("Admin summary counters reconciled")
+    return {metric: values[_key(metric)] for metric in METRICS}
+
+
+def _apply(key, delta):
+    from . import live
+
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Not cached yet: the next read recounts it
+        pass
+    live.schedule_summary()
+
+
+def adjust(metric, delta, day=None):
+    """Add delta to a metric once the current transaction commits"""
+    if not delta:
+        return
+    key = _key(metric, day)
+    transaction.on_commit(lambda: _apply(key, delta))
+
+
+# ----- transition helpers used by core.signals -----
+
+def refund_pending(refund_id, refund_status):
+    return refund_id is not None and refund_status not in REFUND_DONE_STATUSES
+
+
+def is_low_stock(stock_quantity, low_stock_threshold):
+    return stock_quantity <= low_stock_threshold
@@ -0,0 +1,93 @@
+"""
+Materialized KPIs for the admin dashboard.
+
+compute_stats() gathers every counter with one grouped aggregate per table
+(users by role, products, orders + revenue, submissions, inspections);
+refresh_snapshot() stores the result in DashboardSnapshot. The dashboard
+reads the stored snapshot and only recomputes it when it is older than
+ADMIN_DASHBOARD_SNAPSHOT_MAX_AGE seconds.
+"""
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import DashboardSnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'admin'
+USER_ROLES = ('customer', 'seller', 'inspector')
+
+
+def compute_stats():
+    from inspections.models import Inspection
+    from orders.models import Order
+    from products.models import Product
+    from sellers.models import SellerSubmission
+
+    by_role = dict(
+        get_user_model().objects.order_by().values_list('role').annotate(total=Count('id'))
+    )
+    products = Product.objects.aggregate(
+        total=Count('id'),
+        certified=Count('id', filter=Q(certification_status='certified')),
+    )
+    orders = Order.objects.aggregate(total=Count('id'), revenue=Sum('total_amount'))
+    submissions = SellerSubmission.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+    )
+    inspections = Inspection.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+    )
+
+    stats = {
+        'total_users': sum(by_role.values()),
+        'total_products': products['total'],
+        'certified_products': products['certified'],
+        'total_orders': orders['total'],
+        # JSON has no decimal type; restored by get_stats()
+        'total_revenue': str((orders['revenue'] or Decimal('0')).quantize(Decimal('0.01'))),
+        'total_submissions': submissions['total'],
+        'pending_submissions': submissions['pending'],
+        'total_inspections': inspections['total'],
+        'pending_inspections': inspections['pending'],
+    }
+    for role in USER_ROLES:
+        stats[f'{role}s'] = by_role.get(role, 0)
+    return stats
+
+
+def refresh_snapshot():
+    started = time.perf_counter()
+    stats = compute_stats()
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    snapshot, _ = DashboardSnapshot.objects.update_or_create(
+        name=SNAPSHOT_NAME,
+        defaults={'data': stats, 'computed_at': timezone.now(), 'duration_ms': duration_ms},
+    )
+    logger.info(f"Admin dashboard snapshot refreshed in {duration_ms}ms")
+    return snapshot
+
+
+def get_snapshot(max_age=None):
+    """The stored snapshot, recomputed first if missing or older than max_age seconds"""
+    if max_age is None:
+        max_age = getattr(settings, 'ADMIN_DASHBOARD_SNAPSHOT_MAX_AGE', 300)
+    snapshot = DashboardSnapshot.objects.filter(name=SNAPSHOT_NAME).first()
+    if snapshot is None or snapshot.computed_at < timezone.now() - timedelta(seconds=max_age):
+        snapshot = refresh_snapshot()
+    return snapshot
+
+
+def get_stats(snapshot):
+    stats = dict(snapshot.data)
+    stats['total_revenue'] = Decimal(stats.get('total_revenue') or 0)
+    return stats
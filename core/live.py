@@ -0,0 +1,286 @@
+"""
+Live updates for the admin notification dashboard over server-sent events.
+
+Open dashboards used to poll admin-notification-data every few seconds, each
+poll costing a request and a query. Now each ASGI process keeps one
+in-process hub: a stream subscribes an asyncio queue to it and sleeps until
+something is published. Nothing touches the database while the dashboards
+are idle.
+
+Writers call publish_notifications() after commit. Counter changes call
+schedule_summary(), which publishes the summary from a timer thread at most
+once per ADMIN_EVENTS_SUMMARY_DELAY, so a burst of writes costs one recount
+and one publish, none of it on the request path.
+When the Redis server at ADMIN_EVENTS_REDIS_URL answers, events go through
+one Redis channel. A single listener thread per ASGI process feeds that
+channel into the local hub, so a fleet of open dashboards costs one
+subscription per process. Without Redis, events reach only the streams of
+the process that published them. Clients also resync through the delta
+feed (since_id) whenever they reconnect, so nothing is lost for good.
+
+Settings (all optional):
+    ADMIN_EVENTS_REDIS_URL          Redis URL of the channel; empty means in-process only
+    ADMIN_EVENTS_KEEPALIVE_SECONDS  seconds between keep-alive comments, default 15
+    ADMIN_EVENTS_SUMMARY_DELAY      seconds counter changes are gathered before one summary
+                                    is published, default 1; 0 publishes immediately
+    CELERY_BROKER_HEALTH_TTL        seconds a failed Redis check is trusted, default 15
+    CELERY_BROKER_HEALTH_TIMEOUT    Redis connect timeout in seconds, default 0.5
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+from . import counters, feed
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'certibuy:admin-notifications'
+# Events a slow stream may fall behind by before it is told to resync
+QUEUE_SIZE = 100
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Hub:
+    """Fans events out to the streams connected to this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def dispatch(self, event):
+        """Deliver an event to every subscriber; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, event)
+            except RuntimeError:
+                # Its event loop has closed; the stream is gone
+                self.unsubscribe(subscriber)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+hub = Hub()
+
+_lock = threading.Lock()
+_redis = {'url': None, 'client': None, 'down_until': 0.0, 'listener': None}
+_summary = {'timer': None}
+
+
+def _redis_url():
+    url = getattr(settings, 'ADMIN_EVENTS_REDIS_URL', '') or ''
+    return url if url.startswith(('redis://', 'rediss://', 'unix://')) else ''
+
+
+def _client(url):
+    """Shared Redis client for publishing, or None while Redis is marked down"""
+    if time.monotonic() < _redis['down_until']:
+        return None
+    with _lock:
+        if _redis['url'] != url or _redis['client'] is None:
+            import redis
+
+            timeout = float(getattr(settings, 'CELERY_BROKER_HEALTH_TIMEOUT', 0.5))
+            _redis['client'] = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+            _redis['url'] = url
+        return _redis['client']
+
+
+def _mark_down():
+    ttl = float(getattr(settings, 'CELERY_BROKER_HEALTH_TTL', 15))
+    with _lock:
+        _redis['down_until'] = time.monotonic() + ttl
+
+
+def publish(event):
+    """Send an event to every connected dashboard; never raises"""
+    url = _redis_url()
+    client = _client(url) if url else None
+    if client is not None:
+        try:
+            client.publish(CHANNEL, json.dumps(event, cls=DjangoJSONEncoder))
+            return
+        except Exception as exc:
+            logger.warning(f"Admin event channel unavailable, publishing in-process only: {str(exc)[:100]}")
+            _mark_down()
+    hub.dispatch(event)
+
+
+def _listen(url):
+    import redis
+
+    retry = float(getattr(settings, 'CELERY_BROKER_HEALTH_TTL', 15))
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(url).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            logger.info(f"Listening for admin events on {CHANNEL}")
+            for message in pubsub.listen():
+                hub.dispatch(json.loads(message['data']))
+        except Exception as exc:
+            logger.warning(f"Admin event listener disconnected: {str(exc)[:100]}")
+        # Anything published meanwhile is picked up by the clients' since_id resync
+        hub.dispatch({'event': 'resync'})
+        time.sleep(retry)
+
+
+def _ensure_listener():
+    url = _redis_url()
+    if not url:
+        return
+    with _lock:
+        listener = _redis['listener']
+        if listener is None or not listener.is_alive():
+            listener = threading.Thread(target=_listen, args=(url,), name='admin-events', daemon=True)
+            listener.start()
+            _redis['listener'] = listener
+
+
+def reset():
+    """Forget the cached Redis client and its health (tests, or after reconfiguring)"""
+    with _lock:
+        _redis.update(url=None, client=None, down_until=0.0)
+        _summary['timer'] = None
+
+
+# ----- publishers, called after commit -----
+
+def publish_notifications(notifications):
+    """Push newly created Notification rows (one order lookup for the lot); never raises"""
+    from orders.models import Order
+    from .models import Notification
+
+    notifications = [item for item in notifications if item.pk is not None]
+    if not notifications:
+        return
+    try:
+        missing = {
+            item.related_order_id for item in notifications
+            if item.related_order_id and not Notification.related_order.is_cached(item)
+        }
+        orders = Order.objects.only('id', 'order_number').order_by().in_bulk(missing) if missing else {}
+        for item in notifications:
+            if item.related_order_id in orders:
+                item.related_order = orders[item.related_order_id]
+        publish({'event': 'notifications', 'notifications': [feed.serialize(item) for item in notifications]})
+    except Exception as exc:
+        logger.error(f"Failed to publish admin notifications: {str(exc)}")
+
+
+def publish_summary():
+    """Push the current summary counters; never raises"""
+    try:
+        publish({'event': 'summary', 'summary': counters.get_summary()})
+    except Exception as exc:
+        logger.error(f"Failed to publish admin summary: {str(exc)}")
+
+
+def _publish_scheduled_summary():
+    with _lock:
+        _summary['timer'] = None
+    try:
+        publish_summary()
+    finally:
+        # The recount may have opened a connection for this thread
+        connection.close()
+
+
+def schedule_summary():
+    """Publish the summary shortly, once for all the changes made meanwhile; never blocks"""
+    if not _redis_url() and not len(hub):
+        # In-process only and no dashboard connected here: nobody would hear it
+        return
+    delay = float(getattr(settings, 'ADMIN_EVENTS_SUMMARY_DELAY', 1))
+    if delay <= 0:
+        publish_summary()
+        return
+    with _lock:
+        if _summary['timer'] is not None:
+            return
+        timer = threading.Timer(delay, _publish_scheduled_summary)
+        timer.daemon = True
+        _summary['timer'] = timer
+    timer.start()
+
+
+# ----- the stream -----
+
+def _message(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _drain(subscriber, first):
+    """The pending events, with runs of summary updates collapsed into the newest"""
+    events = [first]
+    while True:
+        try:
+            events.append(subscriber.queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    summaries = [event for event in events if event.get('event') == 'summary']
+    return [event for event in events if event.get('event') != 'summary'] + summaries[-1:]
+
+
+async def stream(filters):
+    """SSE text for one dashboard: the summary now, then notifications and counters as they change"""
+    keepalive = getattr(settings, 'ADMIN_EVENTS_KEEPALIVE_SECONDS', 15)
+    _ensure_listener()
+    subscriber = hub.subscribe()
+    try:
+        yield 'retry: 3000\n\n'
+        yield _message('summary', await sync_to_async(counters.get_summary)())
+        while True:
+            try:
+                first = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if subscriber.overflowed:
+                # Events were dropped; the client refetches the delta instead
+                subscriber.overflowed = False
+                yield _message('resync', {})
+            for event in _drain(subscriber, first):
+                kind = event.get('event')
+                if kind == 'notifications':
+                    items = [item for item in event['notifications'] if feed.matches(item, filters)]
+                    if items:
+                        yield _message('notifications', items, event_id=max(item['id'] for item in items))
+                elif kind in ('summary', 'resync'):
+                    yield _message(kind, event.get('summary', {}))
+    finally:
+        hub.unsubscribe(subscriber)
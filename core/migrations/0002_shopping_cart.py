@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-17 23:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_notification'),
+        ('orders', '0005_warrantyplan_order_warranty_charge_and_more'),
+        ('products', '0007_productimage_ordering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(blank=True, max_length=32, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('warranty_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.RenameIndex(
+            model_name='notification',
+            new_name='core_notifi_type_fd747d_idx',
+            old_name='core_noti_type_priority_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='notification',
+            new_name='core_notifi_is_read_57486b_idx',
+            old_name='core_noti_is_read_created_at_idx',
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='cart',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.shoppingcart'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='warranty_plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.warrantyplan'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='core_cart_item_unique_product'),
+        ),
+    ]
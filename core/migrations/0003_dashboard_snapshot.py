@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_shopping_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(default='admin', max_length=50, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField()),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dashboard_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='related_object',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.db import models
 from django.conf import settings
 
+from .tracking import TrackedFieldsMixin
+
+
+class Notification(TrackedFieldsMixin, models.Model):
+	# Read by core.signals to keep the unread counter in step
+	tracked_fields = ('is_read',)
 
-class Notification(models.Model):
 	TYPE_CHOICES = [
 		('order', 'Order'),
 		('payment', 'Payment'),
@@ -33,6 +38,8 @@ class Notification(models.Model):
 		blank=True,
 		related_name='admin_notifications'
 	)
+	# 'model:pk' of the object a non-order event is about, e.g. 'product:42' (part of the dedup key)
+	related_object = models.CharField(max_length=50, blank=True, default='')
 	priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
 	is_read = models.BooleanField(default=False)
 	created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -47,3 +54,56 @@ class Notification(models.Model):
 
 	def __str__(self):
 		return f"{self.get_type_display()} - {self.title}"
+
+
+class ShoppingCart(models.Model):
+	"""Server-side cart owned by a user or, before login, an anonymous token"""
+
+	user = models.OneToOneField(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		null=True,
+		blank=True,
+		related_name='shopping_cart'
+	)
+	token = models.CharField(max_length=32, unique=True, null=True, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+	def __str__(self):
+		owner = self.user_id and f"user #{self.user_id}" or f"guest {self.token}"
+		return f"Cart for {owner}"
+
+
+class ShoppingCartItem(models.Model):
+	cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name='items')
+	product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='+')
+	quantity = models.PositiveIntegerField(default=1)
+	price = models.DecimalField(max_digits=10, decimal_places=2)
+	warranty_plan = models.ForeignKey(
+		'orders.WarrantyPlan',
+		on_delete=models.SET_NULL,
+		null=True,
+		blank=True,
+		related_name='+'
+	)
+	warranty_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['cart', 'product'], name='core_cart_item_unique_product'),
+		]
+
+	def __str__(self):
+		return f"{self.quantity}x product #{self.product_id}"
+
+
+class DashboardSnapshot(models.Model):
+	"""Precomputed admin dashboard KPIs, refreshed by core.dashboard"""
+	name = models.CharField(max_length=50, unique=True, default='admin')
+	data = models.JSONField(default=dict)
+	computed_at = models.DateTimeField()
+	duration_ms = models.PositiveIntegerField(default=0)
+
+	def __str__(self):
+		return f"{self.name} snapshot @ {self.computed_at:%Y-%m-%d %H:%M}"
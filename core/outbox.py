@@ -0,0 +1,134 @@
+"""
+Outbox for admin dashboard notifications.
+
+Signal handlers queue lightweight events instead of inserting Notification
+rows inside the transaction that triggered them. Events queued in one
+transaction are written with a single bulk_create once it commits, and
+are dropped if it rolls back. Identical events (same title, message,
+order and related object) already stored within
+ADMIN_NOTIFICATION_DEDUP_SECONDS are skipped, so a retried payment
+callback does not flood the dashboard.
+
+The first event queued in a transaction starts a batch, which registers
+a single transaction.on_commit callback; later events are appended to it
+and the callback writes them all. The thread holds the batch weakly, so
+once the callback has run or was discarded by a rollback the next event
+starts a new batch. A savepoint rollback drops the batch only if the batch
+was started inside that savepoint.
+"""
+import logging
+import threading
+import weakref
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, live
+
+logger = logging.getLogger(__name__)
+
+NotificationEvent = namedtuple(
+    'NotificationEvent',
+    ['title', 'message', 'type', 'priority', 'related_order_id', 'related_object', 'created_by'],
+)
+
+_local = threading.local()
+
+
+class _Batch:
+    """Events queued by one thread in one transaction, written by a single on_commit callback"""
+
+    def __init__(self):
+        self.events = []
+        # The pending callback is the only strong reference to the batch
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        if _current_batch(create=False) is self:
+            _local.batch = None
+        events, self.events = self.events, []
+        write_notifications(events)
+
+
+def _current_batch(create=True):
+    """The batch of the transaction in progress"""
+    ref = getattr(_local, 'batch', None)
+    batch = ref() if ref is not None else None
+    if batch is None and create:
+        batch = _Batch()
+        _local.batch = weakref.ref(batch)
+    return batch
+
+
+def reset():
+    """Start a new batch with the next event (tests: TestCase never commits setUpTestData's transaction)"""
+    _local.batch = None
+
+
+def queue_notification(title, message, notif_type, priority='medium', related_order=None, created_by='system',
+                       related_object=''):
+    """Queue an admin notification for after commit
+
+    related_object ('product:42') names the object an event is about when it
+    is not an order, so alerts for different objects are never deduplicated.
+    """
+    event = NotificationEvent(
+        title=title,
+        message=message,
+        type=notif_type,
+        priority=priority,
+        related_order_id=getattr(related_order, 'pk', related_order),
+        related_object=related_object,
+        created_by=created_by,
+    )
+    if not transaction.get_connection().in_atomic_block:
+        write_notifications([event])
+        return
+    _current_batch().events.append(event)
+
+
+def _recent_keys(events, window):
+    from .models import Notification
+
+    cutoff = timezone.now() - timedelta(seconds=window)
+    return set(
+        Notification.objects.filter(
+            created_at__gte=cutoff,
+            title__in={event.title for event in events},
+        ).values_list('title', 'message', 'related_order_id', 'related_object')
+    )
+
+
+def _key(event):
+    return event.title, event.message, event.related_order_id, event.related_object
+
+
+def write_notifications(events):
+    """Insert events with one bulk_create, skipping duplicates; never raises"""
+    from .models import Notification
+
+    if not events:
+        return 0
+    try:
+        window = getattr(settings, 'ADMIN_NOTIFICATION_DEDUP_SECONDS', 300)
+        seen = _recent_keys(events, window) if window else set()
+        rows = []
+        for event in events:
+            key = _key(event)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(Notification(**event._asdict()))
+        Notification.objects.bulk_create(rows)
+        # bulk_create sends no post_save, so keep the unread counter in step here
+        counters.adjust('unread_notifications', len(rows))
+        live.publish_notifications(rows)
+        if len(rows) < len(events):
+            logger.info(f"Skipped {len(events) - len(rows)} duplicate admin notification(s)")
+        return len(rows)
+    except Exception as exc:
+        logger.error("Failed to create notifications: %s", str(exc))
+        return 0
@@ -0,0 +1,169 @@
+"""
+Keyset (seek) pagination for long listings.
+
+Paginator pages with COUNT(*) and OFFSET: every page counts the whole result
+and scans past all the rows before it, so deep pages get slower and
+?page=5000 is a cheap way to keep the database busy. KeysetPaginator
+remembers where a page ended instead. The sort values of its last row go
+into an opaque, signed cursor, and the next page continues past them
+(WHERE price > %s OR (price = %s AND id > %s)). Every page costs the same
+indexed read, however deep it is.
+
+Orderings must end in a unique column, usually pk, so rows with equal sort
+values keep a stable order between pages. Cursors are tied to the ordering
+they were made for; an unknown, tampered or stale cursor yields the first
+page. Counts are approximate: without an exact figure from the caller, at
+most COUNT_LIMIT rows are counted.
+
+Besides querysets, any sequence with len(), slicing and position(pk) (see
+products.search.ProductResults) can be paged. Its cursors carry the pk of
+the boundary row.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q, QuerySet
+
+COUNT_LIMIT = 1000
+_SALT = 'core.pagination'
+
+
+def _dump(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _value(obj, field):
+    name = field.lstrip('-')
+    return obj.pk if name == 'pk' else getattr(obj, name)
+
+
+def _seek(ordering, values, backwards):
+    """Rows after (or, backwards, before) the row with these sort values"""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != backwards
+        ties = {prior.lstrip('-'): value for prior, value in zip(ordering[:i], values[:i])}
+        condition |= Q(**ties, **{f'{name}__lt' if descending else f'{name}__gt': values[i]})
+    return condition
+
+
+def _reverse(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator"""
+
+    def __init__(self, object_list, count, count_is_estimate, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    def __init__(self, object_list, ordering, per_page, count=None):
+        self.object_list = object_list
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self._count = count
+
+    def _signature(self):
+        return ','.join(self.ordering)
+
+    def _cursor(self, obj, backwards):
+        if isinstance(self.object_list, QuerySet):
+            key = [_dump(_value(obj, field)) for field in self.ordering]
+        else:
+            key = [obj.pk]
+        payload = {'o': self._signature(), 'k': key}
+        if backwards:
+            payload['b'] = 1
+        return signing.dumps(payload, salt=_SALT, compress=True)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            payload = signing.loads(cursor, salt=_SALT)
+        except signing.BadSignature:
+            return None, False
+        if not isinstance(payload, dict) or payload.get('o') != self._signature():
+            return None, False
+        key = payload.get('k')
+        size = len(self.ordering) if isinstance(self.object_list, QuerySet) else 1
+        if not isinstance(key, list) or len(key) != size:
+            return None, False
+        return key, bool(payload.get('b'))
+
+    def count(self):
+        """(count, is_estimate)"""
+        if self._count is not None:
+            return self._count, False
+        if isinstance(self.object_list, QuerySet):
+            # COUNT over a LIMITed subquery: bounded cost, "1000+" past the limit
+            count = self.object_list.order_by()[:COUNT_LIMIT + 1].count()
+            return min(count, COUNT_LIMIT), count > COUNT_LIMIT
+        return len(self.object_list), False
+
+    def _rows(self, key, backwards):
+        """Up to per_page + 1 rows past the key, in page order; the extra row only signals more"""
+        if isinstance(self.object_list, QuerySet):
+            rows = self.object_list
+            if key is not None:
+                rows = rows.filter(_seek(self.ordering, key, backwards))
+            rows = rows.order_by(*(_reverse(self.ordering) if backwards else self.ordering))
+            return list(rows[:self.per_page + 1])
+
+        if key is None:
+            return list(self.object_list[:self.per_page + 1])
+        position = self.object_list.position(key[0])
+        if backwards:
+            start = max(position - self.per_page - 1, 0)
+            return list(self.object_list[start:position])[::-1]
+        return list(self.object_list[position + 1:position + self.per_page + 2])
+
+    def get_page(self, cursor=None):
+        key, backwards = self._decode(cursor)
+        if key is not None and not isinstance(self.object_list, QuerySet) and self.object_list.position(key[0]) is None:
+            # The boundary row has left the result
+            key, backwards = None, False
+        rows = self._rows(key, backwards)
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            # Coming back from a later page means there is a next one
+            if more or backwards:
+                next_cursor = self._cursor(rows[-1], backwards=False)
+            if key is not None and (more or not backwards):
+                previous_cursor = self._cursor(rows[0], backwards=True)
+        count, estimate = self.count()
+        return KeysetPage(rows, count, estimate, next_cursor, previous_cursor)
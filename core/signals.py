@@ -1,9 +1,15 @@
 import logging
 
-from django.db.models.signals import post_save, pre_save
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
+from . import counters, live
 from .models import Notification
+from .outbox import queue_notification
+from .utils import merge_anonymous_cart
 from orders.models import Order
 from inspections.models import Inspection
 from products.models import Product
@@ -11,29 +17,13 @@ from products.models import Product
 logger = logging.getLogger(__name__)
 
 
-def _create_notification(title, message, notif_type, priority='medium', related_order=None, created_by='system'):
+def _create_notification(title, message, notif_type, priority='medium', related_order=None, created_by='system',
+                         related_object=''):
+    # Written in bulk once the surrounding transaction commits (see core.outbox)
     try:
-        Notification.objects.create(
-            title=title,
-            message=message,
-            type=notif_type,
-            priority=priority,
-            related_order=related_order,
-            created_by=created_by,
-        )
+        queue_notification(title, message, notif_type, priority, related_order, created_by, related_object)
     except Exception as exc:
-        logger.error("Failed to create notification: %s", str(exc))
-
-
-@receiver(pre_save, sender=Order)
-def _cache_order_previous_state(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._previous_state = None
-        return
-    try:
-        instance._previous_state = Order.objects.get(pk=instance.pk)
-    except Order.DoesNotExist:
-        instance._previous_state = None
+        logger.error("Failed to queue notification: %s", str(exc))
 
 
 @receiver(post_save, sender=Order)
@@ -43,13 +33,18 @@ def _order_notifications(sender, instance, created, **kwargs):
         order_ref = instance.order_number or f"#{instance.id}"
         message = f"A new order was placed: {order_ref}."
         _create_notification(title, message, 'order', 'medium', instance)
+        # Checkout may create an order that is already paid (test-mode payments)
+        if instance.payment_status == 'success':
+            title = "Payment Successful"
+            message = f"Payment succeeded for order {order_ref}."
+            _create_notification(title, message, 'payment', 'medium', instance)
         return
 
-    previous = getattr(instance, '_previous_state', None)
-    if not previous:
+    changes = instance.changed_fields
+    if not changes:
         return
 
-    if previous.payment_status != instance.payment_status:
+    if 'payment_status' in changes:
         if instance.payment_status == 'success':
             title = "Payment Successful"
             message = f"Payment succeeded for order {instance.order_number or instance.id}."
@@ -63,7 +58,7 @@ def _order_notifications(sender, instance, created, **kwargs):
             message = f"Refund processed for order {instance.order_number or instance.id}."
             _create_notification(title, message, 'refund', 'medium', instance)
 
-    if previous.status != instance.status:
+    if 'status' in changes:
         if instance.status == 'cancelled':
             title = "Order Cancelled"
             message = f"Order {instance.order_number or instance.id} was cancelled."
@@ -77,66 +72,129 @@ def _order_notifications(sender, instance, created, **kwargs):
             message = f"Order {instance.order_number or instance.id} was shipped."
             _create_notification(title, message, 'order', 'medium', instance)
 
-    if previous.refund_id is None and instance.refund_id:
+    if 'refund_id' in changes and changes['refund_id'] is None and instance.refund_id:
         title = "Refund Requested"
         message = f"Refund requested for order {instance.order_number or instance.id}."
         _create_notification(title, message, 'refund', 'medium', instance)
 
-    if previous.refund_status != instance.refund_status and instance.refund_status:
+    if 'refund_status' in changes and instance.refund_status:
         if instance.refund_status in {'processed', 'success', 'completed'}:
             title = "Refund Processed"
             message = f"Refund processed for order {instance.order_number or instance.id}."
             _create_notification(title, message, 'refund', 'medium', instance)
 
 
-@receiver(pre_save, sender=Inspection)
-def _cache_inspection_previous_state(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._previous_state = None
-        return
-    try:
-        instance._previous_state = Inspection.objects.get(pk=instance.pk)
-    except Inspection.DoesNotExist:
-        instance._previous_state = None
-
-
 @receiver(post_save, sender=Inspection)
 def _inspection_notifications(sender, instance, created, **kwargs):
-    previous = getattr(instance, '_previous_state', None)
-    if previous and previous.status == instance.status:
+    if not created and 'status' not in instance.changed_fields:
         return
 
     if instance.status == 'completed':
         title = "Inspection Report Submitted"
         subject = instance.submission.product_name
         message = f"Inspection report submitted for {subject}."
-        _create_notification(title, message, 'inspection', 'medium')
-
-
-@receiver(pre_save, sender=Product)
-def _cache_product_previous_state(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._previous_state = None
-        return
-    try:
-        instance._previous_state = Product.objects.get(pk=instance.pk)
-    except Product.DoesNotExist:
-        instance._previous_state = None
+        _create_notification(title, message, 'inspection', 'medium', related_object=f'inspection:{instance.pk}')
 
 
 @receiver(post_save, sender=Product)
 def _product_stock_notifications(sender, instance, created, **kwargs):
-    previous = getattr(instance, '_previous_state', None)
     threshold = instance.low_stock_threshold
 
     if created:
         if instance.stock_quantity <= threshold:
             title = "Low Stock Detected"
             message = f"Low stock for {instance.name} (qty: {instance.stock_quantity})."
-            _create_notification(title, message, 'inventory', 'high')
+            _create_notification(title, message, 'inventory', 'high', related_object=f'product:{instance.pk}')
         return
 
-    if previous and previous.stock_quantity > threshold and instance.stock_quantity <= threshold:
+    previous_quantity = instance.changed_fields.get('stock_quantity')
+    if previous_quantity is not None and previous_quantity > threshold and instance.stock_quantity <= threshold:
         title = "Low Stock Detected"
         message = f"Low stock for {instance.name} (qty: {instance.stock_quantity})."
-        _create_notification(title, message, 'inventory', 'high')
+        _create_notification(title, message, 'inventory', 'high', related_object=f'product:{instance.pk}')
+
+
+# ----- admin summary counters (see core.counters) -----
+
+def _order_counter_state(order, values=None):
+    values = values or {}
+    payment_status = values.get('payment_status', order.payment_status)
+    refund_id = values.get('refund_id', order.refund_id)
+    refund_status = values.get('refund_status', order.refund_status)
+    return (
+        int(payment_status == 'failed'),
+        int(counters.refund_pending(refund_id, refund_status)),
+    )
+
+
+@receiver(post_save, sender=Order)
+def _order_summary_counters(sender, instance, created, **kwargs):
+    failed, refund = _order_counter_state(instance)
+    if created:
+        counters.adjust('new_orders_today', 1, day=timezone.localdate(instance.created_at))
+        counters.adjust('failed_payments', failed)
+        counters.adjust('pending_refunds', refund)
+        return
+    changes = instance.changed_fields
+    if changes:
+        was_failed, was_refund = _order_counter_state(instance, changes)
+        counters.adjust('failed_payments', failed - was_failed)
+        counters.adjust('pending_refunds', refund - was_refund)
+
+
+@receiver(post_delete, sender=Order)
+def _order_deleted_summary_counters(sender, instance, **kwargs):
+    failed, refund = _order_counter_state(instance, instance.__dict__.get('_loaded_values'))
+    counters.adjust('new_orders_today', -1, day=timezone.localdate(instance.created_at))
+    counters.adjust('failed_payments', -failed)
+    counters.adjust('pending_refunds', -refund)
+
+
+@receiver(post_save, sender=Product)
+def _product_summary_counters(sender, instance, created, **kwargs):
+    low = counters.is_low_stock(instance.stock_quantity, instance.low_stock_threshold)
+    if created:
+        counters.adjust('low_stock_alerts', int(low))
+        return
+    changes = instance.changed_fields
+    if changes:
+        was_low = counters.is_low_stock(
+            changes.get('stock_quantity', instance.stock_quantity),
+            changes.get('low_stock_threshold', instance.low_stock_threshold),
+        )
+        counters.adjust('low_stock_alerts', int(low) - int(was_low))
+
+
+@receiver(post_delete, sender=Product)
+def _product_deleted_summary_counters(sender, instance, **kwargs):
+    loaded = instance.__dict__.get('_loaded_values', {})
+    was_low = counters.is_low_stock(
+        loaded.get('stock_quantity', instance.stock_quantity),
+        loaded.get('low_stock_threshold', instance.low_stock_threshold),
+    )
+    counters.adjust('low_stock_alerts', -int(was_low))
+
+
+@receiver(post_save, sender=Notification)
+def _notification_summary_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust('unread_notifications', int(not instance.is_read))
+        transaction.on_commit(lambda: live.publish_notifications([instance]))
+    elif 'is_read' in instance.changed_fields:
+        counters.adjust('unread_notifications', -1 if instance.is_read else 1)
+
+
+@receiver(post_delete, sender=Notification)
+def _notification_deleted_summary_counters(sender, instance, **kwargs):
+    if not instance.__dict__.get('_loaded_values', {}).get('is_read', instance.is_read):
+        counters.adjust('unread_notifications', -1)
+
+
+@receiver(user_logged_in)
+def _merge_guest_cart(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    try:
+        merge_anonymous_cart(request, user)
+    except Exception as exc:
+        logger.error("Failed to merge guest cart for user %s: %s", user.pk, str(exc))
@@ -0,0 +1,16 @@
+from celery import shared_task
+
+from . import counters
+from .dashboard import refresh_snapshot
+
+
+@shared_task
+def reconcile_admin_summary_counters():
+    """Recount the admin dashboard summary cards to correct any drift (run by celery beat)"""
+    return counters.reconcile()
+
+
+@shared_task
+def refresh_dashboard_snapshot():
+    """Recompute the materialized admin dashboard KPIs (run by celery beat)"""
+    return refresh_snapshot().data
@@ -1,3 +1,772 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from orders.models import Order, OrderAddress, OrderItem, OrderStatusHistory, WarrantyPlan
+from products.autocomplete import suggestion_index
+from products.models import Product, ProductImage
+from products.search import SORT_ORDERING, InMemorySearchBackend
+from . import counters, feed, live
+from .models import DashboardSnapshot, Notification, ShoppingCart, ShoppingCartItem
+from . import outbox
+from .outbox import _Batch, queue_notification
+from .pagination import KeysetPaginator
+
+
+class CartQueryCountTests(TestCase):
+    """Rendering the cart must not issue queries per cart line"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='buyer', email='buyer@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Test Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        cls.plan = WarrantyPlan.objects.create(name='Extended', duration_months=6, price='49.99')
+        cls.products = []
+        for i in range(12):
+            product = Product.objects.create(
+                name=f'Phone {i}', category='phones', price='1000.00', condition_grade='good',
+                description='Refurbished phone', certification_status='certified', stock_quantity=10,
+            )
+            ProductImage.objects.create(product=product, image=f'products/{product.id}/front.jpg')
+            cls.products.append(product)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _fill_cart(self, lines):
+        cart, _ = ShoppingCart.objects.get_or_create(user=self.user)
+        cart.items.all().delete()
+        ShoppingCartItem.objects.bulk_create(
+            ShoppingCartItem(
+                cart=cart, product=product, quantity=2, price=product.price,
+                warranty_plan=self.plan, warranty_price=self.plan.price,
+            )
+            for product in self.products[:lines]
+        )
+        session = self.client.session
+        session['checkout_address_id'] = self.address.id
+        session['checkout_payment_method'] = 'cod'
+        session.save()
+
+    def _count_queries(self, url, lines):
+        self._fill_cart(lines)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        small = self._count_queries(url, 2)
+        large = self._count_queries(url, 12)
+        self.assertEqual(small, large, f"{url} issues queries per cart line")
+
+    def test_cart_page(self):
+        self.assertConstantQueries(reverse('core:cart'))
+
+    def test_checkout_step2_payment(self):
+        self.assertConstantQueries(reverse('orders:checkout_step2_payment'))
+
+    def test_checkout_step3_review(self):
+        self.assertConstantQueries(reverse('orders:checkout_step3_review'))
+
+    def test_cart_total_is_decimal(self):
+        self._fill_cart(3)
+        response = self.client.get(reverse('core:cart'))
+        self.assertEqual(str(response.context['cart_total']), '6299.94')
+        line = response.context['cart_items'][0]
+        self.assertEqual(line.warranty_plan, self.plan)
+        self.assertEqual(str(line.total_price), '2099.98')
+
+
+class CartStoreTests(TestCase):
+    """The cart lives in ShoppingCartItem rows rather than the session"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='shopper', email='shopper@test.com', password='Test123!@#', role='customer'
+        )
+        cls.phone = Product.objects.create(
+            name='Phone', category='phones', price='500.00', condition_grade='good',
+            description='Refurbished phone', certification_status='certified',
+        )
+        cls.laptop = Product.objects.create(
+            name='Laptop', category='laptops', price='900.00', condition_grade='good',
+            description='Refurbished laptop', certification_status='certified',
+        )
+
+    def test_guest_cart_merges_on_login(self):
+        self.client.post(reverse('core:add_to_cart'), {'product_id': self.phone.id, 'quantity': 1})
+        self.assertNotIn('cart', self.client.session)
+        self.assertIsNotNone(self.client.session.get('cart_token'))
+
+        user_cart = ShoppingCart.objects.create(user=self.user)
+        ShoppingCartItem.objects.create(cart=user_cart, product=self.phone, quantity=2, price='500.00')
+        ShoppingCartItem.objects.create(cart=user_cart, product=self.laptop, quantity=1, price='900.00')
+
+        self.client.login(username='shopper', password='Test123!@#')
+
+        quantities = dict(user_cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.phone.id: 3, self.laptop.id: 1})
+        self.assertFalse(ShoppingCart.objects.filter(user__isnull=True).exists())
+        self.assertEqual(self.client.session['cart_count'], 4)
+
+    def test_update_writes_only_changed_line(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('core:add_to_cart'), {'product_id': self.phone.id})
+        self.client.post(reverse('core:add_to_cart'), {'product_id': self.laptop.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('core:update_cart'), {'product_id': self.laptop.id, 'quantity': 3})
+        writes = [q['sql'] for q in queries if 'core_shoppingcartitem' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+        # a single VALUES row: the untouched phone line is not rewritten
+        self.assertNotIn('), (', writes[0])
+
+
+class ChangeTrackingTests(TestCase):
+    """Notification signals detect transitions without re-reading the row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username='tracker', email='tracker@test.com', password='Test123!@#', role='customer'
+        )
+        cls.order = Order.objects.create(user=user, order_number='ORD-TRACK-1', total_amount='100.00')
+
+    def setUp(self):
+        outbox.reset()
+
+    def test_save_without_transition_is_one_query(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.courier_name = 'BlueDart'
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_transition_is_detected(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'shipped'
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):  # the notification is written after commit
+                order.save()
+        self.assertTrue(Notification.objects.filter(title='Order Shipped', related_order=order).exists())
+
+        # saved state becomes the new baseline
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_refresh_resets_baseline(self):
+        order = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=order.pk).update(status='shipped')
+        order.refresh_from_db()
+        self.assertEqual(order.changed_fields, {})
+        order.status = 'delivered'
+        self.assertEqual(order.changed_fields, {'status': 'shipped'})
+
+
+class NotificationOutboxTests(TestCase):
+    """Admin notifications are written in one batch after commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username='outbox', email='outbox@test.com', password='Test123!@#', role='customer'
+        )
+        cls.order = Order.objects.create(
+            user=user, order_number='ORD-OUTBOX-1', total_amount='100.00', payment_method='online',
+        )
+
+    def setUp(self):
+        outbox.reset()
+
+    def test_events_are_batched_on_commit(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'cancelled'
+        order.refund_id = 'rfnd_1'
+        with self.captureOnCommitCallbacks() as callbacks:
+            order.save()
+        batches = [callback.__self__ for callback in callbacks if getattr(callback, '__func__', None) is _Batch.flush]
+        # One callback for the whole transaction; the cancellation and the refund id both raise 'Refund Requested'
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(len(batches[0].events), 3)
+        self.assertFalse(Notification.objects.filter(related_order=order).exists())
+
+        with self.assertNumQueries(3):  # duplicate lookup, one bulk INSERT, order numbers for the live stream
+            for callback in callbacks:
+                callback()
+        self.assertEqual(
+            sorted(Notification.objects.filter(related_order=order).values_list('title', flat=True)),
+            ['Order Cancelled', 'Refund Requested'],
+        )
+
+    def test_rolled_back_events_are_dropped(self):
+        order = Order.objects.get(pk=self.order.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    order.status = 'shipped'
+                    order.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            Order.objects.get(pk=order.pk).save()
+        self.assertFalse(Notification.objects.filter(related_order=order).exists())
+
+    def test_alerts_for_different_products_are_not_deduplicated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                Product.objects.create(
+                    name='Pixel 7', category='phones', price='100.00', condition_grade='good',
+                    description='Refurbished phone', certification_status='certified', stock_quantity=1,
+                )
+        self.assertEqual(Notification.objects.filter(title='Low Stock Detected').count(), 2)
+
+    def test_repeated_events_are_deduplicated(self):
+        for _ in range(3):
+            order = Order.objects.get(pk=self.order.pk)
+            order.payment_status = 'failed'
+            with self.captureOnCommitCallbacks(execute=True):
+                order.save()
+            Order.objects.filter(pk=order.pk).update(payment_status='pending')
+        self.assertEqual(Notification.objects.filter(title='Payment Failed', related_order=self.order).count(), 1)
+
+
+class NotificationOutboxCommitTests(TransactionTestCase):
+    """The outbox against real commits and savepoint rollbacks"""
+
+    def test_rolled_back_batches_are_not_reused(self):
+        try:
+            with transaction.atomic():
+                queue_notification('Dropped', 'Rolled back', 'system')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    queue_notification('Dropped too', 'Started the batch inside the savepoint', 'system')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            queue_notification('Kept', 'Queued after the savepoint', 'system')
+        self.assertEqual(list(Notification.objects.values_list('title', flat=True)), ['Kept'])
+
+        with self.assertNumQueries(6):  # BEGIN/COMMIT, then the duplicate lookup and one INSERT in its own
+            with transaction.atomic():
+                queue_notification('First', 'One transaction', 'system')
+                queue_notification('Second', 'One transaction', 'system')
+        self.assertEqual(Notification.objects.count(), 3)
+
+
+class SummaryCounterTests(TestCase):
+    """Dashboard summary cards are served from incrementally maintained counters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='counter-admin', email='counter-admin@test.com', password='Test123!@#', is_staff=True
+        )
+        cls.customer = get_user_model().objects.create_user(
+            username='counter-buyer', email='counter-buyer@test.com', password='Test123!@#', role='customer'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _poll(self):
+        return self.client.get(reverse('core:admin-notification-data')).json()['summary']
+
+    def test_poll_runs_no_aggregate_queries_when_warm(self):
+        self.client.force_login(self.admin)
+        self._poll()
+        with CaptureQueriesContext(connection) as queries:
+            self._poll()
+        counts = [q['sql'] for q in queries if 'COUNT(' in q['sql']]
+        # The feed is cut by id, so not even a page count remains
+        self.assertEqual(counts, [])
+
+    def test_counters_follow_writes(self):
+        counters.get_summary()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.customer, order_number='ORD-COUNT-1', total_amount='10.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.payment_status = 'failed'
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Scarce', category='phones', price='1.00', condition_grade='good',
+                description='Low', certification_status='certified', stock_quantity=1,
+            )
+
+        summary = counters.get_summary()
+        self.assertEqual(summary, counters.reconcile())
+        self.assertEqual(summary['failed_payments'], 1)
+        self.assertEqual(summary['new_orders_today'], 1)
+
+    def test_counters_expire_and_are_recounted(self):
+        order = Order.objects.create(user=self.customer, order_number='ORD-COUNT-2', total_amount='10.00')
+        with override_settings(ADMIN_SUMMARY_COUNTER_TTL=1):
+            self.assertEqual(counters.get_summary()['failed_payments'], 0)
+        # A queryset update bypasses the signals; only expiry brings it in
+        Order.objects.filter(pk=order.pk).update(payment_status='failed')
+        self.assertEqual(counters.get_summary()['failed_payments'], 0)
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertEqual(counters.get_summary()['failed_payments'], 1)
+
+
+class DashboardSnapshotTests(TestCase):
+    """The admin dashboard reads materialized KPIs instead of counting on every load"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='snap-admin', email='snap-admin@test.com', password='Test123!@#', is_staff=True
+        )
+        customer = get_user_model().objects.create_user(
+            username='snap-buyer', email='snap-buyer@test.com', password='Test123!@#', role='customer'
+        )
+        Order.objects.create(user=customer, order_number='ORD-SNAP-1', total_amount='250.50')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_snapshot_is_reused_until_stale(self):
+        response = self.client.get(reverse('core:admin-dashboard'))
+        self.assertEqual(response.context['total_users'], 2)
+        self.assertEqual(str(response.context['total_revenue']), '250.50')
+        computed_at = DashboardSnapshot.objects.get().computed_at
+
+        Order.objects.create(user=self.admin, order_number='ORD-SNAP-2', total_amount='100.00')
+        response = self.client.get(reverse('core:admin-dashboard'))
+        self.assertEqual(response.context['total_orders'], 1)
+        self.assertEqual(DashboardSnapshot.objects.get().computed_at, computed_at)
+
+        self.client.post(reverse('core:admin-dashboard-refresh'))
+        response = self.client.get(reverse('core:admin-dashboard'))
+        self.assertEqual(response.context['total_orders'], 2)
+
+
+class NotificationFeedTests(TestCase):
+    """The admin feed answers polls with deltas, keyset pages and 304s"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='feed-admin', email='feed-admin@test.com', password='Test123!@#', is_staff=True
+        )
+        Notification.objects.bulk_create([
+            Notification(title=f'Alert {i}', message='Stock low', type='inventory' if i % 2 else 'order')
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('core:admin-notification-data')
+
+    def test_keyset_pages_and_delta(self):
+        first = self.client.get(self.url).json()
+        ids = [item['id'] for item in first['notifications']]
+        self.assertEqual(len(ids), 50)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertTrue(first['pagination']['has_more'])
+
+        older = self.client.get(self.url, {'before': first['pagination']['next_cursor']}).json()
+        self.assertEqual(len(older['notifications']), 10)
+        self.assertFalse(older['pagination']['has_more'])
+        self.assertEqual(older['notifications'][0]['id'], ids[-1] - 1)
+
+        newest = first['latest_id']
+        Notification.objects.create(title='New order', message='ORD-1', type='order')
+        delta = self.client.get(self.url, {'since_id': newest, 'type': 'order'}).json()
+        self.assertEqual([item['title'] for item in delta['notifications']], ['New order'])
+        self.assertEqual(delta['latest_id'], delta['notifications'][0]['id'])
+
+    def test_unchanged_feed_is_not_modified(self):
+        response = self.client.get(self.url, {'type': 'inventory'})
+        etag = response['ETag']
+        latest = response.json()['latest_id']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'type': 'inventory', 'since_id': latest}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Only the newest-id lookup runs; no rows are fetched
+        feed_queries = [q['sql'] for q in queries if 'core_notification' in q['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertIn('LIMIT 1', feed_queries[0])
+
+        Notification.objects.create(title='Another', message='Low', type='inventory')
+        response = self.client.get(self.url, {'type': 'inventory', 'since_id': latest}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['notifications']), 1)
+
+
+class NotificationTriageTests(TestCase):
+    """Backlogs are cleared with chunked UPDATEs and one counter adjustment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='triage-admin', email='triage-admin@test.com', password='Test123!@#', is_staff=True
+        )
+        Notification.objects.bulk_create([
+            Notification(title=f'Alert {i}', message='Check', type='payment' if i % 2 else 'inventory')
+            for i in range(10)
+        ])
+        cls.ids = list(Notification.objects.order_by('id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('core:admin-notification-bulk-mark-read')
+
+    def test_mark_read_in_chunks(self):
+        payment = Notification.objects.filter(type='payment')
+        # Two chunks of two, then the rest in one statement: a bound SELECT and an UPDATE each
+        with self.assertNumQueries(6):
+            self.assertEqual(feed.mark_read(payment, chunk_size=2), 5)
+        with self.assertNumQueries(2):
+            self.assertEqual(feed.mark_read(Notification.objects.all(), ids=self.ids[:4], chunk_size=2), 2)
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 3)
+
+    def test_bulk_endpoint_scopes(self):
+        self.assertEqual(counters.get_summary()['unread_notifications'], 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'scope': 'ids', 'ids': f'{self.ids[0]},{self.ids[1]}'})
+        self.assertEqual(response.json(), {'success': True, 'updated': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'scope': 'filter', 'type': 'inventory', 'before': self.ids[6]})
+        # Inventory alerts are the even ones; ids[0] is already read
+        self.assertEqual(response.json()['updated'], 2)
+
+        self.assertEqual(counters.get_summary()['unread_notifications'], 6)
+        self.assertEqual(counters.get_summary(), counters.reconcile())
+        self.assertEqual(self.client.post(self.url, {'scope': 'ids', 'ids': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+
+
+@override_settings(ADMIN_EVENTS_REDIS_URL='', ADMIN_EVENTS_SUMMARY_DELAY=0)
+class NotificationStreamTests(TestCase):
+    """Admin dashboards receive notifications and counters over server-sent events"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_user(
+            username='stream-admin', email='stream-admin@test.com', password='Test123!@#', is_staff=True
+        )
+        cls.order = Order.objects.create(user=cls.admin, order_number='ORD-LIVE-1', total_amount='10.00')
+
+    def setUp(self):
+        cache.clear()
+        outbox.reset()
+        self.url = reverse('core:admin-notification-stream')
+
+    def test_wsgi_requests_fall_back_to_polling(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+
+    def test_new_notifications_are_published_after_commit(self):
+        with mock.patch.object(live, 'publish') as publish, mock.patch.object(live, '_redis_url', return_value='redis://events'):
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_notification('Payment failed', 'ORD-LIVE-1', 'payment', 'high', related_order=self.order)
+                queue_notification('Low stock', 'Phone', 'inventory')
+                publish.assert_not_called()
+
+        events = [call.args[0] for call in publish.call_args_list]
+        notifications = [event for event in events if event['event'] == 'notifications']
+        self.assertEqual(len(notifications), 1)
+        items = notifications[0]['notifications']
+        self.assertEqual([item['title'] for item in items], ['Payment failed', 'Low stock'])
+        self.assertEqual(items[0]['related_order_number'], 'ORD-LIVE-1')
+        self.assertEqual(events[-1], {'event': 'summary', 'summary': counters.get_summary()})
+
+    @override_settings(ADMIN_EVENTS_SUMMARY_DELAY=1)
+    def test_counter_changes_are_published_as_one_summary(self):
+        live.reset()
+        with mock.patch.object(live.threading, 'Timer') as timer, mock.patch.object(live, 'publish') as publish, \
+                mock.patch.object(live, '_redis_url', return_value='redis://events'):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    queue_notification(f'Low stock {i}', f'Phone {i}', 'inventory')
+            publish.reset_mock()
+            self.assertEqual(timer.call_count, 1)
+            timer.return_value.start.assert_called_once()
+
+            with mock.patch.object(live.connection, 'close'):
+                timer.call_args.args[1]()
+        publish.assert_called_once_with({'event': 'summary', 'summary': counters.get_summary()})
+        self.assertIsNone(live._summary['timer'])
+
+    async def test_stream_pushes_matching_events(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(self.url, {'type': 'order'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+
+        async def next_chunk():
+            chunk = await asyncio.wait_for(anext(chunks), timeout=2)
+            return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+        self.assertEqual(await next_chunk(), 'retry: 3000\n\n')
+        self.assertTrue((await next_chunk()).startswith('event: summary\n'))
+
+        item = {'id': 7, 'type': 'inventory', 'priority': 'low', 'created_at_display': '2026-01-01 10:00'}
+        live.publish({'event': 'notifications', 'notifications': [item, {**item, 'id': 8, 'type': 'order'}]})
+        live.publish({'event': 'summary', 'summary': {'unread_notifications': 1}})
+        live.publish({'event': 'summary', 'summary': {'unread_notifications': 2}})
+
+        self.assertEqual(await next_chunk(), f'event: notifications\nid: 8\ndata: {json.dumps([{**item, "id": 8, "type": "order"}])}\n\n')
+        # Queued counter updates collapse into the newest
+        self.assertEqual(await next_chunk(), 'event: summary\ndata: {"unread_notifications": 2}\n\n')
+        await chunks.aclose()
+
+
+class CustomerDashboardQueryTests(TestCase):
+    """The customer dashboard costs the same queries for any order history"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='history', email='history@test.com', password='Test123!@#', role='customer'
+        )
+        cls.product = Product.objects.create(
+            name='Watch', category='wearables', price='300.00', condition_grade='good',
+            description='Refurbished watch', certification_status='certified', stock_quantity=50,
+        )
+        ProductImage.objects.create(product=cls.product, image='products/watch/front.jpg')
+
+    def _add_orders(self, count, status='confirmed', payment_status='success'):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, order_number=f'ORD-HIST-{Order.objects.count()}', total_amount='300.00',
+                status=status, payment_status=payment_status,
+            )
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price='300.00')
+            OrderStatusHistory.objects.create(order=order, status=status)
+
+    def _render(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('core:customer-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_constant_queries_and_summary(self):
+        self.client.force_login(self.user)
+        self._add_orders(1)
+        _, small = self._render()
+        self._add_orders(8)
+        self._add_orders(2, status='cancelled', payment_status='failed')
+        response, large = self._render()
+
+        self.assertEqual(small, large)
+        self.assertEqual(response.context['total_orders'], 11)
+        self.assertEqual(response.context['active_orders'], 9)
+        self.assertEqual(response.context['cancelled_orders'], 2)
+        self.assertEqual(response.context['total_spent'], Decimal('2700.00'))
+        order = response.context['recent_orders'][0]
+        self.assertEqual(order.primary_product_name, 'Watch')
+        # The template reads the latest status from the prefetched history
+        self.assertEqual(order.status_history.all()[0].status, 'cancelled')
+        self.assertTrue(order.primary_image_url.endswith('products/watch/front.jpg'))
+
+
+class KeysetPaginationTests(TestCase):
+    """Listings page by cursor with stable order and no OFFSET"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated prices and names exercise the pk tiebreaker
+        for i in range(25):
+            Product.objects.create(
+                name=f'Phone {i % 4}', category='phones', price=f'{100 + (i % 5) * 10}.00', condition_grade='good',
+                description='Refurbished phone', certification_status='certified', stock_quantity=3,
+            )
+
+    def _walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([product.pk for product in page])
+            if not page.has_next:
+                return pages, page
+            cursor = page.next_cursor
+
+    def test_every_sort_walks_each_row_once_and_back(self):
+        products = Product.objects.filter(certification_status='certified')
+        for sort in ('newest', 'price_low', 'price_high', 'name'):
+            paginator = KeysetPaginator(products, SORT_ORDERING[sort], 10)
+            pages, last = self._walk(paginator)
+            expected = list(products.order_by(*SORT_ORDERING[sort]).values_list('pk', flat=True))
+            self.assertEqual(sum(pages, []), expected, sort)
+            self.assertEqual([len(ids) for ids in pages], [10, 10, 5])
+
+            previous = paginator.get_page(last.previous_cursor)
+            self.assertEqual([product.pk for product in previous], pages[1])
+            self.assertEqual([product.pk for product in paginator.get_page(previous.previous_cursor)], pages[0])
+            self.assertFalse(paginator.get_page(previous.previous_cursor).has_previous)
+
+    def test_deep_pages_run_no_offset_and_bad_cursors_restart(self):
+        paginator = KeysetPaginator(Product.objects.all(), SORT_ORDERING['price_high'], 10)
+        cursor = paginator.get_page().next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.get_page(cursor)
+        self.assertEqual(len(page), 10)
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries))
+        self.assertEqual((page.count, page.count_is_estimate), (25, False))
+
+        self.assertFalse(paginator.get_page(cursor + 'x').has_previous)
+        # A cursor made for another sort is not applied to this one
+        other = KeysetPaginator(Product.objects.all(), SORT_ORDERING['name'], 10).get_page().next_cursor
+        self.assertFalse(paginator.get_page(other).has_previous)
+
+    def test_views_page_by_cursor(self):
+        response = self.client.get(reverse('products:list'), {'sort': 'price_low'})
+        page = response.context['page_obj']
+        self.assertEqual(len(response.context['products']), 12)
+        response = self.client.get(reverse('products:list'), {'sort': 'price_low', 'cursor': page.next_cursor})
+        self.assertTrue(response.context['page_obj'].has_previous)
+
+        seen = []
+        cursor = ''
+        while True:
+            response = self.client.get(reverse('core:shop'), {'sort': 'name', 'cursor': cursor})
+            seen += [product.pk for product in response.context['products']]
+            self.assertEqual(response.context['page_obj'].count, 25)
+            if not response.context['page_obj'].has_next:
+                break
+            cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(sorted(seen), sorted(Product.objects.values_list('pk', flat=True)))
+
+
+class SearchSuggestionTests(TestCase):
+    """Header search suggestions come from the in-memory index, reloaded off the request path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        buyer = get_user_model().objects.create_user(
+            username='suggest-buyer', email='suggest-buyer@test.com', password='Test123!@#', role='customer'
+        )
+        cls.products = {}
+        for name in ('Samsung Galaxy S21', 'Samsung Galaxy S22', 'Apple iPhone 13'):
+            cls.products[name] = Product.objects.create(
+                name=name, category='phones', price='500.00', condition_grade='good',
+                description='Refurbished phone', certification_status='certified', stock_quantity=5,
+            )
+        order = Order.objects.create(user=buyer, order_number='ORD-SUGGEST-1', total_amount='2500.00')
+        OrderItem.objects.create(order=order, product=cls.products['Samsung Galaxy S22'], quantity=5, price='500.00')
+
+    def setUp(self):
+        suggestion_index.rebuild()
+
+    def _names(self, query):
+        return [item['name'] for item in suggestion_index.suggest(query)]
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(set(self._names('samsnug')), {'Samsung Galaxy S21', 'Samsung Galaxy S22'})
+        self.assertEqual(self._names('iphnoe'), ['Apple iPhone 13'])
+        # Short tokens are not corrected
+        self.assertEqual(self._names('ipx'), [])
+
+    def test_popular_products_rank_first(self):
+        self.assertEqual(self._names('galaxy'), ['Samsung Galaxy S22', 'Samsung Galaxy S21'])
+        # A name starting with the query still outranks popularity
+        self.assertEqual(self._names('samsung galaxy s21')[0], 'Samsung Galaxy S21')
+
+    @override_settings(PRODUCT_SEARCH_INDEX_TTL=0)
+    def test_stale_index_is_served_while_it_reloads(self):
+        with mock.patch.object(suggestion_index, 'start_refresh') as start_refresh:
+            with self.assertNumQueries(0):
+                self.assertEqual(self._names('apple'), ['Apple iPhone 13'])
+        start_refresh.assert_called_once()
+
+    def test_changes_made_during_a_reload_are_kept(self):
+        load = suggestion_index._load
+
+        def slow_load():
+            data = load()
+            late = Product.objects.create(
+                name='Google Pixel 7', category='phones', price='400.00', condition_grade='good',
+                description='Refurbished phone', certification_status='certified', stock_quantity=1,
+            )
+            suggestion_index.index_product(late)
+            return data
+
+        with mock.patch.object(suggestion_index, '_load', slow_load):
+            suggestion_index.rebuild()
+        self.assertEqual(self._names('pixel'), ['Google Pixel 7'])
+
+
+class ProductSearchTests(TestCase):
+    """The in-memory search backend ranks, filters and counts facets without querying per search"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = [
+            ('Samsung Galaxy S21', 'phones', 'good', '8000.00', 'Refurbished phone', 'certified'),
+            ('Samsung Galaxy Tab', 'tablets', 'excellent', '20000.00', 'Refurbished tablet', 'certified'),
+            ('Dell XPS 13', 'laptops', 'fair', '30000.00', 'Laptop with a Samsung display', 'certified'),
+            ('Apple MacBook Air', 'laptops', 'good', '60000.00', 'Refurbished laptop', 'certified'),
+            ('Samsung Galaxy S23', 'phones', 'new', '9000.00', 'Awaiting inspection', 'pending'),
+        ]
+        for name, category, grade, price, description, status in rows:
+            Product.objects.create(
+                name=name, category=category, price=price, condition_grade=grade,
+                description=description, certification_status=status, stock_quantity=1,
+            )
+
+    def setUp(self):
+        self.backend = InMemorySearchBackend()
+        self.backend.rebuild()
+
+    def _names(self, result):
+        return [product.name for product in result.object_list[:10]]
+
+    def test_ranked_by_field_weight(self):
+        result = self.backend.search('samsung', sort='relevance')
+        # Name hits outrank the description hit; uncertified products are not indexed
+        self.assertEqual(self._names(result)[-1], 'Dell XPS 13')
+        self.assertEqual(set(self._names(result)[:2]), {'Samsung Galaxy S21', 'Samsung Galaxy Tab'})
+        self.assertEqual(result.count, 3)
+
+    def test_facets_ignore_their_own_filter(self):
+        result = self.backend.search(category='laptops')
+        self.assertEqual(self._names(result), ['Apple MacBook Air', 'Dell XPS 13'])
+        facets = result.facets
+        # The category facet still counts every category so the others stay selectable
+        self.assertEqual(facets['category'], [('laptops', 2), ('phones', 1), ('tablets', 1)])
+        self.assertEqual(
+            [(value, n) for value, _label, n in facets['condition']],
+            [('new', 0), ('excellent', 0), ('good', 1), ('fair', 1)],
+        )
+
+    def test_price_bucket_counts(self):
+        result = self.backend.search(min_price=Decimal('5000'), max_price=Decimal('35000'))
+        self.assertEqual(
+            [(key, n) for key, _label, n in result.facets['price']],
+            [('under_10k', 1), ('10k_25k', 1), ('25k_50k', 1), ('over_50k', 0)],
+        )
+        self.assertEqual(self._names(self.backend.search(sort='price_high'))[0], 'Apple MacBook Air')
+
+    @override_settings(PRODUCT_SEARCH_INDEX_TTL=0)
+    def test_stale_index_reloads_off_the_request_path(self):
+        with mock.patch.object(self.backend, 'start_refresh') as start_refresh:
+            with self.assertNumQueries(0):
+                result = self.backend.search('galaxy')
+        start_refresh.assert_called_once()
+        self.assertEqual(result.count, 2)
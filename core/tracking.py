@@ -0,0 +1,54 @@
+"""
+Field-change tracking for models whose saves trigger notifications.
+
+Values of ``tracked_fields`` are snapshotted when an instance is loaded from
+the database (and again after each save), so signal handlers can tell what
+changed without re-fetching the row first.
+"""
+
+
+class TrackedFieldsMixin:
+    """Expose ``changed_fields`` for the fields listed in ``tracked_fields``
+
+    core.signals reads ``changed_fields`` to detect transitions without
+    re-fetching the row, so a model lists the fields its notifications
+    depend on.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, fields=None):
+        names = self.tracked_fields if fields is None else [f for f in fields if f in self.tracked_fields]
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in names:
+            # Deferred fields are simply not tracked until they are loaded
+            if name in self.__dict__:
+                loaded[name] = self.__dict__[name]
+
+    @property
+    def changed_fields(self):
+        """{field: value as loaded} for tracked fields modified since the last load or save.
+
+        Always empty for an instance that has not been saved yet.
+        """
+        loaded = self.__dict__.get('_loaded_values', {})
+        return {
+            name: old
+            for name, old in loaded.items()
+            if self.__dict__.get(name, old) != old
+        }
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(fields)
+
+    def save(self, *args, **kwargs):
+        # post_save handlers run inside super().save() and still see the changes
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields()
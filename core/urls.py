@@ -17,13 +17,17 @@ urlpatterns = [
     path("return-policy/", views.ReturnPolicyView.as_view(), name="return_policy"),
     path("how-it-works/", views.HowItWorksView.as_view(), name="how_it_works"),
     path("search/suggest/", views.search_suggestions, name="search_suggestions"),
+    path("admin-dashboard/search-stats/", views.search_suggestions_stats, name="search-suggestions-stats"),
     
     # Role-based dashboards
     path("customer/dashboard/", views.customer_dashboard, name="customer-dashboard"),
     path("seller/dashboard/", views.seller_dashboard, name="seller-dashboard"),
     path("inspector/dashboard/", views.inspector_dashboard, name="inspector-dashboard"),
     path("admin-dashboard/", views.admin_dashboard, name="admin-dashboard"),
+    path("admin-dashboard/refresh/", views.admin_dashboard_refresh, name="admin-dashboard-refresh"),
     path("admin-dashboard/notifications/", views.admin_notification_dashboard, name="admin-notification-dashboard"),
     path("admin-dashboard/notifications/data/", views.admin_notification_data, name="admin-notification-data"),
+    path("admin-dashboard/notifications/stream/", views.admin_notification_stream, name="admin-notification-stream"),
     path("admin-dashboard/notifications/mark-read/", views.admin_notification_mark_read, name="admin-notification-mark-read"),
+    path("admin-dashboard/notifications/mark-read/bulk/", views.admin_notification_bulk_mark_read, name="admin-notification-bulk-mark-read"),
 ]
@@ -1,16 +1,94 @@
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
 from products.models import Product
 from orders.models import WarrantyPlan
+from .models import ShoppingCart, ShoppingCartItem
+
+
+class CartLine:
+    """A hydrated cart line; prices are Decimal"""
+
+    __slots__ = ('product', 'quantity', 'price', 'warranty_plan', 'warranty_price', 'total_price')
+
+    def __init__(self, product, quantity, price, warranty_plan=None, warranty_price=Decimal('0.00')):
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+        self.warranty_plan = warranty_plan
+        self.warranty_price = warranty_price
+        self.total_price = (price + warranty_price) * quantity
+
+    def __repr__(self):
+        return f"<CartLine product={self.product.pk} quantity={self.quantity}>"
+
 
 class Cart:
-    """Session-based shopping cart management"""
-    
+    """Database-backed shopping cart.
+
+    Lines live in ShoppingCartItem rows keyed by the logged-in user or, for
+    guests, by an anonymous token kept in the session. Lines are read once per
+    request; mutations mark lines dirty and save() writes only those lines.
+    """
+
+    SESSION_TOKEN_KEY = 'cart_token'
+
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
-    
+        user = getattr(request, 'user', None)
+        self.user = user if user is not None and user.is_authenticated else None
+        self._store = None
+        self._dirty = set()
+        self._removed = set()
+        self.cart = self._load()
+
+        # Carts created before the database store still sit in the session
+        legacy = self.session.pop('cart', None)
+        if legacy:
+            for product_id, item in legacy.items():
+                if product_id not in self.cart:
+                    self.cart[product_id] = item
+                    self._dirty.add(product_id)
+            self.save()
+
+    def _items(self):
+        if self.user is not None:
+            return ShoppingCartItem.objects.filter(cart__user=self.user)
+        token = self.session.get(self.SESSION_TOKEN_KEY)
+        if not token:
+            return None
+        return ShoppingCartItem.objects.filter(cart__token=token, cart__user__isnull=True)
+
+    def _load(self):
+        items = self._items()
+        if items is None:
+            return {}
+        rows = items.values_list('product_id', 'quantity', 'price', 'warranty_plan_id', 'warranty_price')
+        return {
+            str(product_id): {
+                'quantity': quantity,
+                'price': str(price),
+                'warranty_plan_id': str(plan_id) if plan_id else None,
+                'warranty_price': str(warranty_price),
+            }
+            for product_id, quantity, price, plan_id, warranty_price in rows
+        }
+
+    def _get_store(self):
+        """The ShoppingCart row, created on first write"""
+        if self._store is None:
+            if self.user is not None:
+                self._store, _ = ShoppingCart.objects.get_or_create(user=self.user)
+            else:
+                token = self.session.get(self.SESSION_TOKEN_KEY)
+                if not token:
+                    token = self.session[self.SESSION_TOKEN_KEY] = uuid.uuid4().hex
+                self._store, _ = ShoppingCart.objects.get_or_create(token=token)
+        return self._store
+
     def add(self, product_id, quantity=1, warranty_plan_id=None):
         """Add product to cart or increase quantity"""
         product_id = str(product_id)
@@ -33,6 +111,8 @@ class Cart:
             except WarrantyPlan.DoesNotExist:
                 pass
         
+        self._dirty.add(product_id)
+        self._removed.discard(product_id)
         self.save()
     
     def remove(self, product_id):
@@ -40,6 +120,8 @@ class Cart:
         product_id = str(product_id)
         if product_id in self.cart:
             del self.cart[product_id]
+            self._dirty.discard(product_id)
+            self._removed.add(product_id)
             self.save()
     
     def update(self, product_id, quantity):
@@ -49,14 +131,44 @@ class Cart:
         if product_id in self.cart:
             if quantity > 0:
                 self.cart[product_id]['quantity'] = quantity
+                self._dirty.add(product_id)
+                self.save()
             else:
                 self.remove(product_id)
-            self.save()
     
     def save(self):
-        """Mark session as modified"""
-        self.session['cart_count'] = self.get_total_items()
-        self.session.modified = True
+        """Write dirty lines to the cart store and refresh the badge count"""
+        if self._dirty or self._removed:
+            store = self._get_store()
+            removed = [int(pid) for pid in self._removed if pid.isdigit()]
+            if removed:
+                ShoppingCartItem.objects.filter(cart=store, product_id__in=removed).delete()
+            lines = [
+                ShoppingCartItem(
+                    cart=store,
+                    product_id=int(product_id),
+                    quantity=self.cart[product_id]['quantity'],
+                    price=Decimal(self.cart[product_id]['price']),
+                    warranty_plan_id=self.cart[product_id].get('warranty_plan_id') or None,
+                    warranty_price=Decimal(self.cart[product_id].get('warranty_price') or '0'),
+                )
+                for product_id in self._dirty
+                if product_id.isdigit()
+            ]
+            if lines:
+                ShoppingCartItem.objects.bulk_create(
+                    lines,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'price', 'warranty_plan', 'warranty_price'],
+                )
+            ShoppingCart.objects.filter(pk=store.pk).update(updated_at=timezone.now())
+            self._dirty.clear()
+            self._removed.clear()
+
+        count = self.get_total_items()
+        if self.session.get('cart_count') != count:
+            self.session['cart_count'] = count
     
     def get_total_items(self):
         """Get total number of items in cart"""
@@ -64,46 +176,95 @@ class Cart:
     
     def get_total_price(self):
         """Get total price of cart including warranties"""
-        total = 0
+        total = Decimal('0.00')
         for item in self.cart.values():
-            item_total = float(item['price']) * item['quantity']
-            warranty_total = float(item.get('warranty_price', 0)) * item['quantity']
-            total += item_total + warranty_total
-        return round(total, 2)
+            unit_price = Decimal(item['price']) + Decimal(item.get('warranty_price') or '0')
+            total += unit_price * item['quantity']
+        return total
     
     def get_items(self):
-        """Get cart items with product details and warranty"""
-        items = []
-        for product_id, item in self.cart.items():
+        """Get cart lines with product details and warranty.
+
+        Products (with images) and warranty plans are each loaded with a
+        single query, whatever the number of lines.
+        """
+        product_ids = []
+        for product_id in list(self.cart):
             try:
-                product = Product.objects.get(id=product_id)
-                warranty_plan = None
-                if item.get('warranty_plan_id'):
-                    try:
-                        warranty_plan = WarrantyPlan.objects.get(id=item['warranty_plan_id'])
-                    except WarrantyPlan.DoesNotExist:
-                        pass
-                
-                items.append({
-                    'product': product,
-                    'quantity': item['quantity'],
-                    'price': float(item['price']),
-                    'warranty_plan': warranty_plan,
-                    'warranty_price': float(item.get('warranty_price', 0)),
-                    'total_price': round(
-                        (float(item['price']) + float(item.get('warranty_price', 0))) * item['quantity'], 
-                        2
-                    )
-                })
-            except Product.DoesNotExist:
+                product_ids.append(int(product_id))
+            except (TypeError, ValueError):
                 self.remove(product_id)
+
+        products = Product.objects.prefetch_related('images').in_bulk(product_ids)
+
+        plan_ids = {
+            str(item['warranty_plan_id']) for item in self.cart.values()
+            if str(item.get('warranty_plan_id') or '').isdigit()
+        }
+        warranty_plans = {
+            str(pk): plan for pk, plan in WarrantyPlan.objects.in_bulk(plan_ids).items()
+        } if plan_ids else {}
+
+        items = []
+        for product_id in product_ids:
+            item = self.cart[str(product_id)]
+            product = products.get(product_id)
+            if product is None:
+                self.remove(product_id)
+                continue
+            items.append(CartLine(
+                product=product,
+                quantity=item['quantity'],
+                price=Decimal(item['price']),
+                warranty_plan=warranty_plans.get(str(item.get('warranty_plan_id'))),
+                warranty_price=Decimal(item.get('warranty_price') or '0'),
+            ))
         return items
     
     def clear(self):
         """Clear all items from cart"""
-        self.session['cart'] = {}
+        items = self._items()
+        if items is not None and self.cart:
+            items.delete()
+        self.cart = {}
+        self._dirty.clear()
+        self._removed.clear()
         self.save()
     
     def __len__(self):
         """Return number of unique items"""
         return len(self.cart)
+
+
+def merge_anonymous_cart(request, user):
+    """Fold the guest cart for this session into the user's cart after login"""
+    token = request.session.pop(Cart.SESSION_TOKEN_KEY, None)
+    if not token:
+        return
+    guest_cart = ShoppingCart.objects.filter(token=token, user__isnull=True).first()
+    if guest_cart is None:
+        return
+
+    with transaction.atomic():
+        user_cart, _ = ShoppingCart.objects.get_or_create(user=user)
+        existing = {item.product_id: item for item in user_cart.items.all()}
+        merged, moved = [], []
+        for item in guest_cart.items.all():
+            current = existing.get(item.product_id)
+            if current is None:
+                moved.append(item.pk)
+            else:
+                current.quantity += item.quantity
+                if not current.warranty_plan_id and item.warranty_plan_id:
+                    current.warranty_plan_id = item.warranty_plan_id
+                    current.warranty_price = item.warranty_price
+                merged.append(current)
+        if merged:
+            ShoppingCartItem.objects.bulk_update(merged, ['quantity', 'warranty_plan', 'warranty_price'])
+        if moved:
+            ShoppingCartItem.objects.filter(pk__in=moved).update(cart=user_cart)
+        guest_cart.delete()
+
+    request.session['cart_count'] = sum(
+        user_cart.items.values_list('quantity', flat=True)
+    )
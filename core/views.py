@@ -1,13 +1,19 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import TemplateView, ListView
-from django.db.models import Q, Sum, F
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.db.models import Q, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.views.decorators.http import require_POST, require_GET
 from django.utils import timezone
 from datetime import date
+from decimal import Decimal, InvalidOperation
 from products.models import Product
+from products.autocomplete import suggestion_index
+from products.search import search_products
+from . import counters, feed, live
+from .dashboard import get_snapshot as get_dashboard_snapshot, get_stats as get_dashboard_stats, refresh_snapshot as refresh_dashboard_snapshot
+from .pagination import KeysetPaginator
 from .utils import Cart
 from .models import Notification
 
@@ -36,6 +42,16 @@ class HowItWorksView(TemplateView):
     template_name = "pages/how_it_works.html"
 
 
+def _parse_price(value):
+    if not value:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() else None
+
+
 class ShopView(TemplateView):
     template_name = "pages/shop.html"
     
@@ -50,61 +66,27 @@ class ShopView(TemplateView):
         max_price = self.request.GET.get('max_price', '')
         sort_by = self.request.GET.get('sort', 'newest')
         
-        # Start with all products
-        products = Product.objects.filter(certification_status='certified').prefetch_related('images')
-        
-        # Search filter
-        if search_query:
-            products = products.filter(
-                Q(name__icontains=search_query) | 
-                Q(description__icontains=search_query)
-            )
-        
-        # Category filter
-        if category_filter:
-            products = products.filter(category=category_filter)
-        
-        # Condition filter
-        if condition_filter:
-            products = products.filter(condition_grade=condition_filter)
+        # Search index handles text matching, filters, ranking and facets
+        if search_query and 'sort' not in self.request.GET:
+            sort_by = 'relevance'
+
+        result = search_products(
+            text=search_query,
+            category=category_filter,
+            condition=condition_filter,
+            min_price=_parse_price(min_price),
+            max_price=_parse_price(max_price),
+            sort=sort_by,
+        )
         
-        # Price filter
-        if min_price:
-            try:
-                products = products.filter(price__gte=float(min_price))
-            except ValueError:
-                pass
-        
-        if max_price:
-            try:
-                products = products.filter(price__lte=float(max_price))
-            except ValueError:
-                pass
-        
-        # Sorting
-        sort_options = {
-            'newest': '-created_at',
-            'price_low': 'price',
-            'price_high': '-price',
-            'name': 'name',
-        }
-        order_by = sort_options.get(sort_by, '-created_at')
-        products = products.order_by(order_by)
-        
-        # Get unique categories and conditions for filter dropdowns
-        all_categories = Product.objects.values_list('category', flat=True).distinct().order_by('category')
-        all_conditions = Product.CONDITION_CHOICES
-        
-        # Pagination
-        paginator = Paginator(products, 12)
-        page_number = self.request.GET.get('page', 1)
-        page_obj = paginator.get_page(page_number)
+        # Keyset pages: the facets already hold the count, and no page needs an OFFSET
+        paginator = KeysetPaginator(result.object_list, result.ordering, 12, count=result.count)
+        page_obj = paginator.get_page(self.request.GET.get('cursor'))
         
         context.update({
             'page_obj': page_obj,
             'products': page_obj.object_list,
-            'all_categories': all_categories,
-            'all_conditions': all_conditions,
+            'facets': result.facets,
             'search_query': search_query,
             'category_filter': category_filter,
             'condition_filter': condition_filter,
@@ -238,33 +220,55 @@ from accounts.decorators import customer_required, seller_required, inspector_re
 @ensure_csrf_cookie
 def customer_dashboard(request):
     """Customer dashboard - view orders and recommendations"""
-    from orders.models import Order
+    from django.core.files.storage import default_storage
+    from django.db.models import Count, OuterRef, Prefetch, Subquery
+    from orders.models import Order, OrderItem, OrderStatusHistory
+    from products.models import ProductImage
     
-    orders_qs = Order.objects.filter(user=request.user).prefetch_related('items__product__images', 'status_history')
-    recent_orders = list(orders_qs.select_related('address').order_by('-created_at')[:5])
-
+    orders_qs = Order.objects.filter(user=request.user)
+    
+    # All summary figures in one conditional aggregate
+    summary = orders_qs.aggregate(
+        total_orders=Count('id'),
+        active_orders=Count('id', filter=Q(status__in=[
+            'payment_successful', 'confirmed', 'packed', 'shipped', 'out_for_delivery'
+        ])),
+        cancelled_orders=Count('id', filter=Q(status='cancelled')),
+        total_spent=Sum('total_amount', filter=Q(payment_status__in=['success', 'cod_pending'])),
+    )
+    
+    # First item's product and image, annotated per order
+    first_item = OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+    first_image = ProductImage.objects.filter(
+        product_id=Subquery(OrderItem.objects.filter(order=OuterRef(OuterRef('pk'))).order_by('id').values('product_id')[:1])
+    ).order_by('id')
+    # Order history is paged by keyset cursor (?orders=), newest first
+    orders_page = KeysetPaginator(
+        orders_qs.select_related('address')
+        .annotate(
+            primary_product_name=Subquery(first_item.values('product__name')[:1]),
+            primary_image=Subquery(first_image.values('image')[:1]),
+        )
+        .prefetch_related(Prefetch('status_history', queryset=OrderStatusHistory.objects.order_by('-timestamp'))),
+        ('-created_at', '-pk'),
+        5,
+        count=summary['total_orders'],
+    ).get_page(request.GET.get('orders'))
+    recent_orders = orders_page.object_list
     for order in recent_orders:
-        order.primary_item = order.items.first()
-        order.latest_status = order.status_history.first()
-
-    active_orders = orders_qs.filter(status__in=[
-        'payment_successful', 'confirmed', 'packed', 'shipped', 'out_for_delivery'
-    ]).count()
-    cancelled_orders = orders_qs.filter(status='cancelled').count()
-    total_spent = orders_qs.filter(payment_status__in=['success', 'cod_pending']).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+        order.primary_image_url = default_storage.url(order.primary_image) if order.primary_image else None
 
     profile = request.user.customer_profile_safe
 
     context = {
         'role': 'customer',
         'page_title': 'Customer Dashboard',
-        'total_orders': orders_qs.count(),
-        'active_orders': active_orders,
-        'cancelled_orders': cancelled_orders,
-        'total_spent': total_spent,
+        'total_orders': summary['total_orders'],
+        'active_orders': summary['active_orders'],
+        'cancelled_orders': summary['cancelled_orders'],
+        'total_spent': summary['total_spent'] or 0,
         'recent_orders': recent_orders,
+        'orders_page': orders_page,
         'profile': profile,
         'default_address': getattr(profile, 'default_address', None),
     }
@@ -277,12 +281,15 @@ def search_suggestions(request):
     if len(query) < 2:
         return JsonResponse({'results': []})
 
-    results = Product.objects.filter(
-        certification_status='certified',
-        name__icontains=query
-    ).values('id', 'name')[:8]
+    # Served from the in-memory suggestion index, no database round trip
+    return JsonResponse({'results': suggestion_index.suggest(query)})
+
 
-    return JsonResponse({'results': list(results)})
+@admin_required
+@require_GET
+def search_suggestions_stats(request):
+    """Hit/miss and latency counters for this worker's suggestion index"""
+    return JsonResponse(suggestion_index.stats())
 
 
 @seller_required
@@ -328,40 +335,32 @@ def inspector_dashboard(request):
 @ensure_csrf_cookie
 def admin_dashboard(request):
     """Admin dashboard - full system overview and management"""
-    from django.contrib.auth import get_user_model
-    from django.db.models import Sum
     from sellers.models import SellerSubmission
     from inspections.models import Inspection
-    from products.models import Product
-    from orders.models import Order
-    
-    User = get_user_model()
     
-    # Calculate total revenue
-    revenue_data = Order.objects.aggregate(total_revenue=Sum('total_amount'))
-    total_revenue = revenue_data['total_revenue'] or 0
+    # KPIs come from the materialized snapshot (see core.dashboard)
+    snapshot = get_dashboard_snapshot()
     
     context = {
         'role': 'admin',
         'page_title': 'Admin Dashboard',
-        'total_users': User.objects.count(),
-        'customers': User.objects.filter(role='customer').count(),
-        'sellers': User.objects.filter(role='seller').count(),
-        'inspectors': User.objects.filter(role='inspector').count(),
-        'total_products': Product.objects.count(),
-        'certified_products': Product.objects.filter(certification_status='certified').count(),
-        'total_orders': Order.objects.count(),
-        'total_revenue': total_revenue,
-        'total_submissions': SellerSubmission.objects.count(),
-        'pending_submissions': SellerSubmission.objects.filter(status='pending').count(),
-        'total_inspections': Inspection.objects.count(),
-        'pending_inspections': Inspection.objects.filter(status='pending').count(),
-        'recent_submissions': SellerSubmission.objects.order_by('-created_at')[:5],
-        'recent_inspections': Inspection.objects.order_by('-created_at')[:5],
+        **get_dashboard_stats(snapshot),
+        'stats_computed_at': snapshot.computed_at,
+        'recent_submissions': SellerSubmission.objects.select_related('seller').order_by('-created_at')[:5],
+        'recent_inspections': Inspection.objects.select_related('inspector', 'submission').order_by('-created_at')[:5],
     }
     return render(request, 'dashboards/admin_dashboard.html', context)
 
 
+@admin_required
+@require_POST
+def admin_dashboard_refresh(request):
+    """Recompute the dashboard snapshot on demand"""
+    refresh_dashboard_snapshot()
+    messages.success(request, 'Dashboard statistics refreshed.')
+    return redirect('core:admin-dashboard')
+
+
 def _parse_date(value):
     if not value:
         return None
@@ -371,11 +370,12 @@ def _parse_date(value):
         return None
 
 
-def _get_notification_queryset(request):
-    notif_type = request.GET.get('type')
-    priority = request.GET.get('priority')
-    start_date = _parse_date(request.GET.get('start_date'))
-    end_date = _parse_date(request.GET.get('end_date'))
+def _get_notification_queryset(request, params=None):
+    params = request.GET if params is None else params
+    notif_type = params.get('type')
+    priority = params.get('priority')
+    start_date = _parse_date(params.get('start_date'))
+    end_date = _parse_date(params.get('end_date'))
 
     notifications = Notification.objects.select_related('related_order')
 
@@ -392,45 +392,24 @@ def _get_notification_queryset(request):
 
 
 def _get_summary_cards():
-    from orders.models import Order
-
-    today = timezone.localdate()
-    new_orders_today = Order.objects.filter(created_at__date=today).count()
-    pending_refunds = Order.objects.filter(refund_id__isnull=False).exclude(
-        refund_status__in=['processed', 'success', 'completed']
-    ).count()
-    failed_payments = Order.objects.filter(payment_status='failed').count()
-    unread_notifications = Notification.objects.filter(is_read=False).count()
-    low_stock_alerts = Product.objects.filter(stock_quantity__lte=F('low_stock_threshold')).count()
-
-    return {
-        'new_orders_today': new_orders_today,
-        'pending_refunds': pending_refunds,
-        'failed_payments': failed_payments,
-        'unread_notifications': unread_notifications,
-        'low_stock_alerts': low_stock_alerts,
-    }
+    # Maintained incrementally by core.signals; no aggregate queries on a warm cache
+    return counters.get_summary()
+
+
+def _notification_filters(request):
+    return {key: request.GET.get(key, '') for key in ('type', 'priority', 'start_date', 'end_date')}
 
 
 @admin_required
 @ensure_csrf_cookie
 def admin_notification_dashboard(request):
-    notifications = _get_notification_queryset(request)
-    paginator = Paginator(notifications, 50)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    notifications, _ = feed.page(_get_notification_queryset(request))
 
     context = {
         'role': 'admin',
         'page_title': 'Admin Notifications',
-        'notifications': page_obj.object_list,
-        'page_obj': page_obj,
-        'filters': {
-            'type': request.GET.get('type', ''),
-            'priority': request.GET.get('priority', ''),
-            'start_date': request.GET.get('start_date', ''),
-            'end_date': request.GET.get('end_date', ''),
-        },
+        'notifications': notifications,
+        'filters': _notification_filters(request),
         'summary': _get_summary_cards(),
         'type_choices': Notification.TYPE_CHOICES,
         'priority_choices': Notification.PRIORITY_CHOICES,
@@ -441,37 +420,51 @@ def admin_notification_dashboard(request):
 @admin_required
 @require_GET
 def admin_notification_data(request):
+    """Notification feed: newest page, `before=<id>` for older ones, `since_id=<id>` for a delta"""
     notifications = _get_notification_queryset(request)
-    paginator = Paginator(notifications, 50)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-
-    data = []
-    for item in page_obj.object_list:
-        related_order = item.related_order
-        data.append({
-            'id': item.id,
-            'title': item.title,
-            'message': item.message,
-            'type': item.type,
-            'priority': item.priority,
-            'is_read': item.is_read,
-            'created_at': item.created_at.isoformat(),
-            'created_at_display': timezone.localtime(item.created_at).strftime('%Y-%m-%d %H:%M'),
-            'related_order_id': related_order.id if related_order else None,
-            'related_order_number': related_order.order_number if related_order else None,
+    since_id = feed.parse_id(request.GET.get('since_id'))
+    before = feed.parse_id(request.GET.get('before'))
+    summary = _get_summary_cards()
+
+    newest_id = feed.latest_id(notifications)
+    etag = feed.etag({**_notification_filters(request), 'before': before}, newest_id, summary)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        items, has_more = feed.page(notifications, since_id=since_id, before=before)
+        response = JsonResponse({
+            'notifications': [feed.serialize(item) for item in items],
+            'summary': summary,
+            'latest_id': newest_id,
+            'pagination': {
+                # For a delta, has_more means the gap is too large and the client should reload
+                'has_more': has_more,
+                'next_cursor': items[-1].id if has_more and since_id is None else None,
+            },
         })
-
-    return JsonResponse({
-        'notifications': data,
-        'summary': _get_summary_cards(),
-        'pagination': {
-            'page': page_obj.number,
-            'pages': page_obj.paginator.num_pages,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-        }
-    })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def admin_notification_stream(request):
+    """Server-sent events for the notification dashboard: new notifications and summary counters"""
+    user = await request.auser()
+    if not (user.is_authenticated and (user.is_staff or user.is_superuser)):
+        return HttpResponseForbidden()
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an endless response would pin a worker; the dashboard keeps polling instead
+        return HttpResponse('Live updates need an ASGI server', status=503, content_type='text/plain')
+
+    filters = {key: request.GET.get(key, '') for key in ('type', 'priority')}
+    for key in ('start_date', 'end_date'):
+        parsed = _parse_date(request.GET.get(key))
+        filters[key] = parsed.isoformat() if parsed else ''
+    response = StreamingHttpResponse(live.stream(filters), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @admin_required
@@ -482,4 +475,35 @@ def admin_notification_mark_read(request):
         return JsonResponse({'success': False, 'error': 'Missing notification_id'}, status=400)
 
     updated = Notification.objects.filter(id=notification_id, is_read=False).update(is_read=True)
+    counters.adjust('unread_notifications', -updated)
+    return JsonResponse({'success': True, 'updated': updated})
+
+
+@admin_required
+@require_POST
+def admin_notification_bulk_mark_read(request):
+    """
+    Mark many notifications read in one request
+
+    scope=ids     the notifications listed in `ids` (repeated or comma separated)
+    scope=filter  everything matching type/priority/start_date/end_date, optionally
+                  only below the `before` cursor (exclusive, as in the feed)
+    """
+    scope = request.POST.get('scope')
+    if scope == 'ids':
+        raw_ids = [part for value in request.POST.getlist('ids') for part in value.split(',') if part.strip()]
+        ids = [feed.parse_id(value.strip()) for value in raw_ids]
+        if not ids or None in ids:
+            return JsonResponse({'success': False, 'error': 'ids must be a list of notification ids'}, status=400)
+        updated = feed.mark_read(Notification.objects.all(), ids=ids)
+    elif scope == 'filter':
+        notifications = _get_notification_queryset(request, request.POST)
+        if request.POST.get('before'):
+            before = feed.parse_id(request.POST['before'])
+            if before is None:
+                return JsonResponse({'success': False, 'error': 'Invalid before cursor'}, status=400)
+            notifications = notifications.filter(id__lt=before)
+        updated = feed.mark_read(notifications)
+    else:
+        return JsonResponse({'success': False, 'error': "scope must be 'ids' or 'filter'"}, status=400)
     return JsonResponse({'success': True, 'updated': updated})
@@ -1,8 +1,11 @@
 from django.db import models
 from django.conf import settings
 from sellers.models import SellerSubmission
+from core.tracking import TrackedFieldsMixin
 
-class Inspection(models.Model):
+class Inspection(TrackedFieldsMixin, models.Model):
+    tracked_fields = ('status',)
+    
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
@@ -25,6 +25,7 @@ def create_product_on_approval(sender, instance, created, update_fields, **kwarg
                     condition_grade=instance.condition_grade,
                     description=instance.submission.description,
                     certification_status='certified',
+                    stock_quantity=1,  # one submission is one physical unit
                     warranty_info=f"Inspected on {instance.inspection_date.strftime('%Y-%m-%d')} by inspector #{instance.inspector.id}",
                     inspection=instance
                 )
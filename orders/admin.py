@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.utils import timezone
-from .models import Order, OrderItem, OrderStatusHistory, NotificationLog, WarrantyPlan
-from .tasks import send_order_notifications
+from .models import Order, OrderItem, OrderStatusHistory, NotificationLog, WarrantyPlan, StockReservation, PaymentWebhookEvent, RefundRequest
+from .services.notifications import replay_dead_letters
+from .services.payments import send_notifications
 import logging
 
 logger = logging.getLogger(__name__)
@@ -71,7 +72,7 @@ class OrderAdmin(admin.ModelAdmin):
                 event_type = notification_map.get(new_status)
                 if event_type:
                     try:
-                        send_order_notifications.delay(obj.id, event_type)
+                        send_notifications([(obj.id, event_type)])
                         logger.info(f"Queued {event_type} notification for order {obj.order_number}")
                     except Exception as e:
                         logger.error(f"Failed to queue notification: {str(e)}")
@@ -100,20 +101,54 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'product', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order__order_number', 'product__name']
+    readonly_fields = ['order', 'product', 'quantity', 'status', 'expires_at', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RefundRequest)
+class RefundRequestAdmin(admin.ModelAdmin):
+    list_display = ['order', 'amount', 'status', 'gateway_status', 'razorpay_refund_id', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order__order_number', 'razorpay_refund_id']
+    readonly_fields = ['order', 'amount', 'idempotency_key', 'razorpay_refund_id', 'gateway_status', 'attempts', 'last_error', 'created_at', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PaymentWebhookEvent)
+class PaymentWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type', 'received_at']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'event_type', 'payload', 'attempts', 'error', 'received_at', 'processed_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(NotificationLog)
 class NotificationLogAdmin(admin.ModelAdmin):
-    list_display = ['id', 'notification_type', 'event_type', 'recipient', 'status', 'sent_at', 'created_at']
-    list_filter = ['notification_type', 'status', 'event_type', 'created_at']
+    list_display = ['id', 'notification_type', 'event_type', 'recipient', 'status', 'queue', 'sent_at', 'created_at']
+    list_filter = ['notification_type', 'status', 'queue', 'event_type', 'created_at']
     search_fields = ['recipient', 'user__username', 'order__order_number']
-    readonly_fields = ['user', 'order', 'notification_type', 'event_type', 'recipient', 
-                      'status', 'response_log', 'error_message', 'retry_count', 'sent_at', 'created_at']
+    readonly_fields = ['user', 'order', 'notification_type', 'event_type', 'recipient', 'queue',
+                      'status', 'response_log', 'error_message', 'retry_count', 'next_attempt_at', 'sent_at', 'created_at']
+    actions = ['replay_failed']
     
     fieldsets = (
         ('Notification Info', {
-            'fields': ('user', 'order', 'notification_type', 'event_type', 'recipient')
+            'fields': ('user', 'order', 'notification_type', 'event_type', 'recipient', 'queue')
         }),
         ('Status', {
-            'fields': ('status', 'retry_count', 'sent_at', 'created_at')
+            'fields': ('status', 'retry_count', 'next_attempt_at', 'sent_at', 'created_at')
         }),
         ('Response Details', {
             'fields': ('response_log', 'error_message'),
@@ -126,6 +161,11 @@ class NotificationLogAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         return request.user.is_superuser
+    
+    def replay_failed(self, request, queryset):
+        replayed = replay_dead_letters(queryset)
+        self.message_user(request, f"Queued {replayed} failed notification(s) for delivery.")
+    replay_failed.short_description = "Replay selected failed notifications"
 
 
 @admin.register(WarrantyPlan)
@@ -0,0 +1,217 @@
+"""
+Local stand-in for the Razorpay REST API, for tests and latency benchmarks.
+
+    with FakeGateway(latency=0.005) as fake:
+        with override_settings(RAZORPAY_BASE_URL=fake.base_url):
+            ...
+
+Implements the endpoints the shop uses (create order, fetch payment,
+list order payments, refund, list refunds) over HTTP/1.1 keep-alive, and
+can inject latency and failures: the next `fail_next` requests are
+answered with `fail_status` (503 by default), with `fail_html` as an HTML
+body when set, the way a proxy in front of the API fails. `connections`
+counts TCP connections accepted, which shows whether callers reuse pooled
+connections.
+
+FakeHTTPService is the reusable server part; orders.fake_sms builds the
+SMS provider stand-in on it.
+"""
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls on keep-alive
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, content_type='application/json'):
+        body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            data = json.loads(body or b'{}')
+        else:
+            data = dict(parse_qsl(body.decode()))
+        path, _, query = self.path.partition('?')
+        data.update(parse_qsl(query))
+        with fake.lock:
+            fake.requests += 1
+            failing = fake.fail_next > 0
+            if failing:
+                fake.fail_next -= 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        if failing and fake.fail_html is not None:
+            return self._send(fake.fail_status, fake.fail_html, content_type='text/html')
+        if failing:
+            return self._send(fake.fail_status, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+        for route_method, pattern, name in fake.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                status, payload = getattr(fake, name)(data, headers=self.headers, **match.groupdict())
+                return self._send(status, payload)
+        self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Unknown endpoint'}})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+class FakeHTTPService:
+    """In-process keep-alive HTTP server dispatching `routes` to methods of the subclass"""
+
+    # (method, compiled path pattern, handler method name)
+    routes = []
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.fail_next = 0
+        self.fail_status = 503
+        self.fail_html = None
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeGateway(FakeHTTPService):
+    """In-process HTTP server mimicking the Razorpay endpoints used by the shop"""
+
+    routes = [
+        ('POST', re.compile(r'^/v1/orders$'), 'create_order'),
+        ('GET', re.compile(r'^/v1/orders/(?P<order_id>[\w-]+)/payments$'), 'order_payments'),
+        ('GET', re.compile(r'^/v1/payments/(?P<payment_id>[\w-]+)$'), 'fetch_payment'),
+        ('POST', re.compile(r'^/v1/payments/(?P<payment_id>[\w-]+)/refund$'), 'refund'),
+        ('GET', re.compile(r'^/v1/refunds$'), 'list_refunds'),
+    ]
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.orders = {}
+        self.payments = {}
+        self.refunds = {}
+        self.refund_status = 'processed'
+        self._idempotency_keys = {}
+
+    # ----- state helpers for tests -----
+
+    def add_payment(self, order_id, amount=None, status='captured'):
+        order = self.orders.get(order_id, {})
+        payment_id = f'pay_{uuid.uuid4().hex[:14]}'
+        self.payments[payment_id] = {
+            'id': payment_id,
+            'entity': 'payment',
+            'order_id': order_id,
+            'amount': order.get('amount', 0) if amount is None else amount,
+            'currency': 'INR',
+            'status': status,
+        }
+        return payment_id
+
+    # ----- endpoints -----
+
+    def create_order(self, data, headers=None):
+        order_id = f'order_{uuid.uuid4().hex[:14]}'
+        self.orders[order_id] = {
+            'id': order_id,
+            'entity': 'order',
+            'amount': data.get('amount'),
+            'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'),
+            'notes': data.get('notes', {}),
+            'status': 'created',
+        }
+        return 200, self.orders[order_id]
+
+    def order_payments(self, data, order_id, headers=None):
+        items = [p for p in self.payments.values() if p['order_id'] == order_id]
+        return 200, {'entity': 'collection', 'count': len(items), 'items': items}
+
+    def fetch_payment(self, data, payment_id, headers=None):
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return 400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}}
+        return 200, payment
+
+    def refund(self, data, payment_id, headers=None):
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return 400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}}
+        key = (headers or {}).get('X-Refund-Idempotency')
+        with self.lock:
+            if key in self._idempotency_keys:
+                return 200, self.refunds[self._idempotency_keys[key]]
+            refund_id = f'rfnd_{uuid.uuid4().hex[:14]}'
+            self.refunds[refund_id] = {
+                'id': refund_id,
+                'entity': 'refund',
+                'payment_id': payment_id,
+                'amount': data.get('amount', payment['amount']),
+                'status': self.refund_status,
+                'created_at': int(time.time()),
+            }
+            if key:
+                self._idempotency_keys[key] = refund_id
+        payment['status'] = 'refunded'
+        return 200, self.refunds[refund_id]
+
+    def list_refunds(self, data, headers=None):
+        since = int(data.get('from', 0))
+        items = sorted(
+            (r for r in self.refunds.values() if r['created_at'] >= since),
+            key=lambda r: r['created_at'], reverse=True,
+        )
+        skip, count = int(data.get('skip', 0)), int(data.get('count', 10))
+        page = items[skip:skip + count]
+        return 200, {'entity': 'collection', 'count': len(page), 'items': page}
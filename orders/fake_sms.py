@@ -0,0 +1,55 @@
+"""
+Local stand-in for the MSG91 and Fast2SMS HTTP APIs, for tests and
+throughput benchmarks.
+
+    with FakeSmsProvider() as fake:
+        with override_settings(MSG91_BASE_URL=fake.base_url, FAST2SMS_BASE_URL=fake.base_url):
+            ...
+
+Every accepted message is appended to `delivered` as (provider, phone,
+text). `down` makes one provider answer 503 to every request.
+"""
+import re
+import uuid
+
+from .fake_gateway import FakeHTTPService
+
+
+class FakeSmsProvider(FakeHTTPService):
+    """In-process HTTP server mimicking the MSG91 flow and Fast2SMS bulk endpoints"""
+
+    routes = [
+        ('POST', re.compile(r'^/api/v5/flow/?$'), 'msg91_flow'),
+        ('POST', re.compile(r'^/dev/bulkV2$'), 'fast2sms_bulk'),
+    ]
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.delivered = []
+        self.down = set()
+        self.provider_requests = {'msg91': 0, 'fast2sms': 0}
+
+    def _deliver(self, provider, messages):
+        """Record (phone, text) pairs; False when the provider is marked down"""
+        with self.lock:
+            self.provider_requests[provider] += 1
+            if provider in self.down:
+                return False
+            self.delivered.extend((provider, phone, text) for phone, text in messages)
+            return True
+
+    def msg91_flow(self, data, headers=None):
+        if not (headers or {}).get('authkey'):
+            return 401, {'type': 'error', 'message': 'Authentication failure'}
+        messages = [(phone, entry['message']) for entry in data.get('sms', []) for phone in entry.get('to', [])]
+        if not self._deliver('msg91', messages):
+            return 503, {'type': 'error', 'message': 'Service unavailable'}
+        return 200, {'type': 'success', 'message': uuid.uuid4().hex}
+
+    def fast2sms_bulk(self, data, headers=None):
+        if not (headers or {}).get('authorization'):
+            return 401, {'return': False, 'message': 'Invalid Authentication'}
+        phones = [phone for phone in data.get('numbers', '').split(',') if phone]
+        if not self._deliver('fast2sms', [(phone, data.get('message', '')) for phone in phones]):
+            return 503, {'return': False, 'message': 'Service unavailable'}
+        return 200, {'return': True, 'request_id': uuid.uuid4().hex, 'message': ['SMS sent successfully.']}
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from orders.services.notification_archive import archive_notifications
+
+
+class Command(BaseCommand):
+    help = 'Move old sent/failed notification logs to monthly gzip JSONL archives and delete them from the table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Keep this many days (default NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--archive-dir', default=None, help='Where to write archives (default NOTIFICATION_ARCHIVE_DIR)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-archive', action='store_true', help='Delete old rows without archiving them')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be moved')
+
+    def handle(self, *args, **options):
+        stats = archive_notifications(
+            older_than_days=options['days'],
+            archive_dir=options['archive_dir'],
+            batch_size=options['batch_size'],
+            archive=not options['no_archive'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{stats['archived']} notification log(s) would be archived")
+            return
+        for path in sorted(stats['files']):
+            self.stdout.write(f'  {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats['archived']} and deleted {stats['deleted']} notification log(s)"
+        ))
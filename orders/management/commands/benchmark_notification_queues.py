@@ -0,0 +1,78 @@
+import queue
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.services.sms_service import RateLimiter
+
+
+class Command(BaseCommand):
+    help = (
+        'Model transactional notification latency while a bulk backlog is draining: one shared queue '
+        '(the old setup) against separate transactional and bulk queues with their own workers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', type=int, default=2000, help='Bulk messages queued up front')
+        parser.add_argument('--transactional', type=int, default=100, help='Receipts arriving during the run')
+        parser.add_argument('--interval', type=float, default=0.01, help='Seconds between receipts')
+        parser.add_argument('--send-time', type=float, default=0.005, help='Simulated seconds per send')
+        parser.add_argument('--workers', type=int, default=8, help='Transactional (or shared) worker processes')
+        parser.add_argument('--bulk-workers', type=int, default=2)
+        parser.add_argument('--bulk-rate', type=float, default=200, help='Bulk sends per second')
+
+    def _run(self, options, bulk, routed):
+        send_time = options['send_time']
+        transactional_queue = queue.Queue()
+        bulk_queue = transactional_queue if not routed else queue.Queue()
+        latencies = []
+        done = threading.Event()
+        limiter = RateLimiter(options['bulk_rate'])
+
+        def work(jobs, throttle=None):
+            while not done.is_set():
+                try:
+                    kind, queued_at = jobs.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if throttle is not None:
+                    throttle.acquire()
+                time.sleep(send_time)
+                if kind == 'transactional':
+                    latencies.append(time.perf_counter() - queued_at)
+
+        for _ in range(bulk):
+            bulk_queue.put(('bulk', time.perf_counter()))
+        threads = [threading.Thread(target=work, args=(transactional_queue,)) for _ in range(options['workers'])]
+        if routed:
+            threads += [threading.Thread(target=work, args=(bulk_queue, limiter)) for _ in range(options['bulk_workers'])]
+        for thread in threads:
+            thread.start()
+        for _ in range(options['transactional']):
+            transactional_queue.put(('transactional', time.perf_counter()))
+            time.sleep(options['interval'])
+        while len(latencies) < options['transactional']:
+            time.sleep(0.01)
+        done.set()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    def _report(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f'  {label:<36} p50 {statistics.median(latencies) * 1000:8.1f}ms  '
+            f'p95 {p95 * 1000:8.1f}ms  max {latencies[-1] * 1000:8.1f}ms'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['transactional']} receipts, {options['bulk']} bulk messages, "
+            f"{options['send_time'] * 1000:.0f}ms per send, {options['workers']} transactional worker(s)"
+        )
+        self._report('routed queues, bulk idle', self._run(options, 0, routed=True))
+        self._report('routed queues, bulk saturated', self._run(options, options['bulk'], routed=True))
+        self._report('one shared queue, bulk saturated', self._run(options, options['bulk'], routed=False))
@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.fake_gateway import FakeGateway
+from orders.services.payment_gateway import PaymentGateway
+
+
+class Command(BaseCommand):
+    help = 'Compare pooled vs per-call Razorpay clients against the local fake gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.002, help='Simulated gateway latency in seconds')
+
+    def _measure(self, call, count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        with FakeGateway(latency=options['latency']) as fake:
+            order = fake.create_order({'amount': 100})[1]
+            payment_id = fake.add_payment(order['id'])
+
+            def per_call():
+                # What get_razorpay_client() used to do: a new client and session every time
+                PaymentGateway('rzp_test_key', 'secret', base_url=fake.base_url).fetch_payment(payment_id)
+
+            fake.connections = 0
+            fresh = self._measure(per_call, count)
+            fresh_connections = fake.connections
+
+            gateway = PaymentGateway('rzp_test_key', 'secret', base_url=fake.base_url)
+            fake.connections = 0
+            pooled = self._measure(lambda: gateway.fetch_payment(payment_id), count)
+            pooled_connections = fake.connections
+
+        self.stdout.write(f'{count} fetch_payment calls, {options["latency"] * 1000:.1f}ms simulated latency')
+        self.stdout.write(f'  new client per call: p50 {fresh[0]:.2f}ms  p95 {fresh[1]:.2f}ms  connections {fresh_connections}')
+        self.stdout.write(f'  pooled client:       p50 {pooled[0]:.2f}ms  p95 {pooled[1]:.2f}ms  connections {pooled_connections}')
@@ -0,0 +1,43 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from orders.fake_sms import FakeSmsProvider
+from orders.services.payment_gateway import CircuitBreaker
+from orders.services.sms_service import Msg91Provider, SmsDispatcher, SmsMessage
+
+
+class Command(BaseCommand):
+    help = 'Compare per-message SMS requests with the batched dispatcher against a local fake provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--latency', type=float, default=0.02, help='Simulated provider latency in seconds')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        messages = [SmsMessage(f'+91 98{i:08d}', f'Order ORD-{i} confirmed. - CERTIBUY') for i in range(count)]
+        with FakeSmsProvider(latency=options['latency']) as fake:
+            url = f'{fake.base_url}/api/v5/flow/'
+
+            # What send_sms_msg91() used to do: a bare requests.post per message
+            started = time.perf_counter()
+            for message in messages:
+                requests.post(url, json={'sms': [{'message': message.text, 'to': [message.phone]}]},
+                              headers={'authkey': 'bench'}, timeout=10)
+            single = time.perf_counter() - started
+            single_connections, single_requests = fake.connections, fake.requests
+
+            fake.connections = fake.requests = 0
+            provider = Msg91Provider('bench', fake.base_url, 'CERTBY', batch_size=options['batch_size'],
+                                     rate=1_000_000, breaker=CircuitBreaker(name='MSG91'))
+            started = time.perf_counter()
+            results = SmsDispatcher([provider]).send_many(messages)
+            batched = time.perf_counter() - started
+
+        sent = sum(1 for result in results if result['status'] == 'success')
+        self.stdout.write(f'{count} messages, {options["latency"] * 1000:.0f}ms simulated provider latency')
+        self.stdout.write(f'  one request per message: {count / single:8.0f} msg/s  requests {single_requests}  connections {single_connections}')
+        self.stdout.write(f'  batched dispatcher:      {count / batched:8.0f} msg/s  requests {fake.requests}  connections {fake.connections}  sent {sent}')
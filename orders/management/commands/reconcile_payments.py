@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from orders.services.reconciliation import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = 'Confirm or fail online orders left in pending payment by checking Razorpay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None, help='Minutes since the order was placed (default PAYMENT_RECONCILE_AFTER_MINUTES)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders fetched and locked per page')
+        parser.add_argument('--concurrency', type=int, default=None, help='Parallel gateway requests')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many orders')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without updating orders')
+
+    def handle(self, *args, **options):
+        stats = reconcile_pending_payments(
+            older_than_minutes=options['older_than'],
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+        )
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Scanned {stats['scanned']} pending order(s): {stats['confirmed']} confirmed, "
+            f"{stats['failed']} failed, {stats['unchanged']} unchanged, {stats['errors']} error(s)"
+        ))
+        if stats['scanned']:
+            self.stdout.write(
+                f"  {stats['duration_seconds']}s, {stats['orders_per_second']} orders/s, "
+                f"oldest pending order {stats['max_lag_seconds']}s old"
+            )
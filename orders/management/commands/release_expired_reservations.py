@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.services.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by unpaid checkouts whose reservation has expired'
+
+    def handle(self, *args, **kwargs):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock reservation(s)'))
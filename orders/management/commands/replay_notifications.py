@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import NotificationLog
+from orders.services.notifications import replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = 'Queue dead-lettered (failed) customer notifications again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='+', help='Only these NotificationLog ids')
+        parser.add_argument('--order', help='Only notifications of this order number')
+        parser.add_argument('--event', help='Only this event type, e.g. order_confirmed')
+        parser.add_argument('--since-hours', type=int, default=None, help='Only notifications created in the last N hours')
+        parser.add_argument('--queue', choices=['bulk', 'transactional'], default='bulk',
+                            help='Queue to replay into (default bulk, so a large replay cannot delay receipts)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be replayed')
+
+    def handle(self, *args, **options):
+        dead = NotificationLog.objects.filter(status='failed')
+        if options['ids']:
+            dead = dead.filter(pk__in=options['ids'])
+        if options['order']:
+            dead = dead.filter(order__order_number=options['order'])
+        if options['event']:
+            dead = dead.filter(event_type=options['event'])
+        if options['since_hours'] is not None:
+            dead = dead.filter(created_at__gte=timezone.now() - timedelta(hours=options['since_hours']))
+
+        if options['dry_run']:
+            self.stdout.write(f"{dead.count()} dead-lettered notification(s) would be replayed")
+            return
+        replayed = replay_dead_letters(dead, queue=options['queue'])
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} notification(s) into the {options['queue']} queue"))
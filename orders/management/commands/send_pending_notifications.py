@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from orders.services.notifications import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver customer emails and SMS waiting in the notification outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Notifications per batch (default NOTIFICATION_BATCH_SIZE or NOTIFICATION_BULK_BATCH_SIZE)')
+        parser.add_argument('--queue', choices=['transactional', 'bulk'], default=None,
+                            help='Only drain this queue (default both, transactional first)')
+
+    def handle(self, *args, **options):
+        queues = [options['queue']] if options['queue'] else ['transactional', 'bulk']
+        for queue in queues:
+            claimed_total = sent_total = 0
+            while True:
+                claimed, sent = deliver_pending(batch_size=options['batch_size'], queue=queue)
+                if not claimed:
+                    break
+                claimed_total += claimed
+                sent_total += sent
+            self.stdout.write(self.style.SUCCESS(
+                f'Delivered {sent_total} of {claimed_total} pending {queue} notification(s)'
+            ))
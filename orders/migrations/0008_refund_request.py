@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 00:02
+
+import django.db.models.deletion
+import orders.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_payment_webhook_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefundRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('idempotency_key', models.CharField(default=orders.models.generate_idempotency_key, max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('submitted', 'Submitted'), ('processed', 'Processed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('razorpay_refund_id', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('gateway_status', models.CharField(blank=True, max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refund_requests', to='orders.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='orders_refu_status_74e84d_idx')],
+            },
+        ),
+    ]
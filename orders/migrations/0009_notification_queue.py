@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 00:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_refund_request'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='queue',
+            field=models.CharField(choices=[('transactional', 'Transactional'), ('bulk', 'Bulk')], default='transactional', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['status', 'queue', 'created_at'], name='orders_noti_status_0dda07_idx'),
+        ),
+    ]
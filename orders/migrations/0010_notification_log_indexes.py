@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 00:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_notification_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notificationlog',
+            name='orders_noti_status_9e31c2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notificationlog',
+            name='orders_noti_status_0dda07_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['created_at'], name='orders_noti_created_269b0e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['status', 'created_at'], name='orders_noti_status_28c612_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['queue', 'created_at'], name='notificationlog_pending_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from products.models import Product
+from core.tracking import TrackedFieldsMixin
 from datetime import timedelta
 
 User = get_user_model()
@@ -13,6 +14,12 @@ def generate_order_number():
     return f"ORD-{int(timezone.now().timestamp())}-{secrets.randbelow(10000):04d}"
 
 
+def generate_idempotency_key():
+    """Random key sent with a refund so gateway retries never refund twice"""
+    import uuid
+    return uuid.uuid4().hex
+
+
 class WarrantyPlan(models.Model):
     name = models.CharField(max_length=200)
     duration_months = models.PositiveIntegerField()
@@ -50,7 +57,9 @@ class OrderAddress(models.Model):
         return f"{self.full_name} - {self.address[:50]}"
 
 
-class Order(models.Model):
+class Order(TrackedFieldsMixin, models.Model):
+    tracked_fields = ('status', 'payment_status', 'refund_id', 'refund_status')
+    
     ORDER_STATUS_CHOICES = [
         ('pending_payment', 'Pending Payment'),
         ('payment_successful', 'Payment Successful'),
@@ -169,6 +178,110 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
 
+class StockReservation(models.Model):
+    """Units taken off Product.stock_quantity for an order.
+
+    A 'held' reservation expires if payment is not confirmed in time; see
+    orders.services.inventory.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['order', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity}x product #{self.product_id} for order #{self.order_id} ({self.status})"
+
+
+class RefundRequest(models.Model):
+    """A refund owed on an order, executed off the request path.
+
+    Lifecycle (see orders.services.refunds):
+        pending   -> recorded, waiting for a worker (or a retry after a gateway error)
+        submitted -> accepted by Razorpay, refund still in progress there
+        processed -> money returned to the customer
+        failed    -> rejected by the gateway or out of retries; needs manual handling
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('submitted', 'Submitted'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='refund_requests')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    reason = models.CharField(max_length=255, blank=True)
+    idempotency_key = models.CharField(max_length=64, unique=True, default=generate_idempotency_key)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    razorpay_refund_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
+    gateway_status = models.CharField(max_length=20, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"Refund of {self.amount} for order #{self.order_id} ({self.status})"
+
+
+class PaymentWebhookEvent(models.Model):
+    """Raw Razorpay webhook delivery, stored before it is applied.
+
+    event_id is Razorpay's X-Razorpay-Event-Id, so redelivered webhooks are
+    stored once. orders.services.webhooks applies pending rows in batches.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Set after a failed attempt; the event is not retried before then
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+
 class NotificationLog(models.Model):
     NOTIFICATION_TYPE_CHOICES = [
         ('email', 'Email'),
@@ -181,6 +294,11 @@ class NotificationLog(models.Model):
         ('failed', 'Failed'),
     ]
     
+    QUEUE_CHOICES = [
+        ('transactional', 'Transactional'),
+        ('bulk', 'Bulk'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     notification_type = models.CharField(max_length=10, choices=NOTIFICATION_TYPE_CHOICES)
@@ -190,6 +308,10 @@ class NotificationLog(models.Model):
     response_log = models.TextField(blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
     retry_count = models.PositiveIntegerField(default=0)
+    # Bulk rows are drained by their own throttled worker so they never delay receipts
+    queue = models.CharField(max_length=20, choices=QUEUE_CHOICES, default='transactional')
+    # Set while a failed send waits for its retry; failed rows are the dead letters
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -198,7 +320,15 @@ class NotificationLog(models.Model):
         indexes = [
             models.Index(fields=['user', 'notification_type']),
             models.Index(fields=['order', 'event_type']),
-            models.Index(fields=['status']),
+            # Admin list (newest first, optionally by status) and archive_notifications
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at']),
+            # Worker claims: only pending rows, so the index stays small as history grows
+            models.Index(
+                fields=['queue', 'created_at'],
+                condition=models.Q(status='pending'),
+                name='notificationlog_pending_idx',
+            ),
         ]
     
     def __str__(self):
@@ -0,0 +1,67 @@
+"""
+Cached health of the Celery broker.
+
+Checking the broker on every notification used to mean a fresh Redis
+client and a ping against localhost; with the broker down each check
+blocked the web request for a full second. broker_available() connects to
+the configured CELERY_BROKER_URL at most once per CELERY_BROKER_HEALTH_TTL
+seconds per process and answers from memory in between. Callers that see
+.delay() fail anyway call mark_broker_down() so the rest of the TTL skips
+the broker without waiting on it.
+
+Settings (all optional):
+    CELERY_BROKER_HEALTH_TTL      seconds a result is trusted, default 15
+    CELERY_BROKER_HEALTH_TIMEOUT  connect timeout of the check in seconds, default 0.5
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from kombu import Connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {'url': None, 'available': None, 'checked_at': 0.0}
+
+
+def _check(url):
+    timeout = float(getattr(settings, 'CELERY_BROKER_HEALTH_TIMEOUT', 0.5))
+    conn = Connection(url, connect_timeout=timeout, transport_options={'socket_connect_timeout': timeout})
+    try:
+        conn.ensure_connection(max_retries=0)
+        return True
+    except Exception as exc:
+        # as_uri() masks the password
+        logger.warning(f"Celery broker unavailable at {conn.as_uri()}: {str(exc)[:100]}")
+        return False
+    finally:
+        conn.release()
+
+
+def broker_available():
+    """True if the broker answered within the last CELERY_BROKER_HEALTH_TTL seconds"""
+    url = settings.CELERY_BROKER_URL
+    ttl = float(getattr(settings, 'CELERY_BROKER_HEALTH_TTL', 15))
+    now = time.monotonic()
+    if _state['url'] == url and now - _state['checked_at'] < ttl:
+        return _state['available']
+    with _lock:
+        # Another thread may have refreshed it while we waited
+        if _state['url'] != url or time.monotonic() - _state['checked_at'] >= ttl:
+            _state['available'] = _check(url)
+            _state.update(url=url, checked_at=time.monotonic())
+        return _state['available']
+
+
+def mark_broker_down():
+    """Record a failed publish so callers skip the broker for the rest of the TTL"""
+    with _lock:
+        _state.update(url=settings.CELERY_BROKER_URL, available=False, checked_at=time.monotonic())
+
+
+def reset():
+    """Forget the cached result (tests, or after reconfiguring the broker)"""
+    with _lock:
+        _state.update(url=None, available=None, checked_at=0.0)
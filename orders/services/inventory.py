@@ -0,0 +1,205 @@
+"""
+Stock reservations for checkout.
+
+Stock is taken with a conditional UPDATE (``stock_quantity >= n``) so two
+buyers can never both claim the last unit, without any read-modify-write.
+
+Lifecycle of a StockReservation:
+    held      -> taken when the order is created, expires after STOCK_RESERVATION_MINUTES
+    committed -> payment confirmed (or COD), stock stays deducted
+    released  -> order cancelled or payment failed, stock returned
+    expired   -> hold timed out before payment, stock returned
+
+A capture can still arrive after a hold was expired or released (gateway
+retry, payment.captured after payment.failed, late capture after
+reconciliation); commit_reservations() then takes the stock again.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from core import counters
+from core.outbox import queue_notification
+from orders.models import StockReservation
+from products.models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a product cannot cover the requested quantity"""
+
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f"Product {product_id} unavailable: insufficient stock for {quantity} unit(s)")
+
+
+class _OutOfStock(Exception):
+    pass
+
+
+def _take(product_id, quantity):
+    """Atomically decrement stock; False if not enough is left"""
+    return Product.objects.filter(
+        pk=product_id,
+        stock_quantity__gte=quantity,
+    ).update(stock_quantity=F('stock_quantity') - quantity) == 1
+
+
+def _take_all(quantities):
+    """Decrement several products in one conditional UPDATE; False if any is short"""
+    if len(quantities) == 1:
+        (product_id, quantity), = quantities.items()
+        return _take(product_id, quantity)
+    # Lock rows in id order first so concurrent multi-product checkouts cannot deadlock
+    list(Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk').values_list('pk', flat=True))
+    wanted = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    taken = Product.objects.filter(pk__in=quantities, stock_quantity__gte=wanted).update(
+        stock_quantity=F('stock_quantity') - wanted
+    )
+    return taken == len(quantities)
+
+
+def _short_product(quantities):
+    stock = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock_quantity'))
+    for product_id, quantity in sorted(quantities.items()):
+        if stock.get(product_id, 0) < quantity:
+            return product_id
+    return min(quantities)
+
+
+def _restock(quantities):
+    for product_id, quantity in sorted(quantities.items()):
+        Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') + quantity)
+    _note_stock_change(quantities)
+
+
+def _note_stock_change(deltas):
+    """Raise low-stock alerts for stock moved by UPDATE, which fires no save signals"""
+    change = 0
+    rows = Product.objects.filter(pk__in=deltas).values_list('pk', 'name', 'stock_quantity', 'low_stock_threshold')
+    for product_id, name, stock, threshold in rows:
+        was_low = counters.is_low_stock(stock - deltas[product_id], threshold)
+        now_low = counters.is_low_stock(stock, threshold)
+        change += int(now_low) - int(was_low)
+        if now_low and not was_low:
+            queue_notification(
+                "Low Stock Detected", f"Low stock for {name} (qty: {stock}).", 'inventory', 'high',
+                related_object=f'product:{product_id}',
+            )
+    counters.adjust('low_stock_alerts', change)
+
+
+def reserve_stock(order, lines, hold=True):
+    """Take stock for every (product_id, quantity) line of an order.
+
+    All-or-nothing: raises InsufficientStock and rolls back every decrement
+    if any product runs short. With hold=False the reservation is committed
+    straight away (COD and test-mode payments).
+    """
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+
+    release_expired_holds(product_ids=list(quantities))
+
+    expires_at = None
+    if hold:
+        expires_at = timezone.now() + timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+    try:
+        with transaction.atomic():
+            if not _take_all(quantities):
+                raise _OutOfStock()
+            _note_stock_change({product_id: -quantity for product_id, quantity in quantities.items()})
+
+            StockReservation.objects.bulk_create([
+                StockReservation(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity,
+                    status='held' if hold else 'committed',
+                    expires_at=expires_at,
+                )
+                for product_id, quantity in quantities.items()
+            ])
+    except _OutOfStock:
+        # Decrements are rolled back by now, so current stock shows the real culprit
+        product_id = _short_product(quantities)
+        raise InsufficientStock(product_id, quantities[product_id]) from None
+    logger.info(f"[Order {order.id}] Reserved stock for {len(quantities)} product(s), hold={hold}")
+
+
+def commit_reservations(order):
+    """Make an order's holds permanent once payment is confirmed.
+
+    Holds whose stock was already returned (expired, or released by a failed
+    payment) are re-taken if stock allows; returns False when that fails so
+    the caller can flag the order for manual follow-up.
+    """
+    with transaction.atomic():
+        StockReservation.objects.filter(order=order, status='held').update(status='committed', expires_at=None)
+
+        fully_covered = True
+        returned = StockReservation.objects.select_for_update().filter(order=order, status__in=['expired', 'released'])
+        for reservation in returned:
+            if _take(reservation.product_id, reservation.quantity):
+                _note_stock_change({reservation.product_id: -reservation.quantity})
+                StockReservation.objects.filter(pk=reservation.pk).update(status='committed', expires_at=None)
+            else:
+                fully_covered = False
+                logger.error(
+                    f"[INVENTORY] Order {order.id} paid after its hold was {reservation.status} and product "
+                    f"{reservation.product_id} is out of stock"
+                )
+    return fully_covered
+
+
+def release_reservations(order):
+    """Return an order's held or committed stock (cancellation, failed payment)"""
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(order=order, status__in=['held', 'committed'])
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if not reservations:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in reservations]).update(
+            status='released', expires_at=None
+        )
+        quantities = Counter()
+        for _, product_id, quantity in reservations:
+            quantities[product_id] += quantity
+        _restock(quantities)
+    logger.info(f"[Order {order.id}] Released stock for {len(reservations)} reservation(s)")
+    return len(reservations)
+
+
+def release_expired_holds(product_ids=None, now=None):
+    """Expire unpaid holds and put their stock back; returns the number expired"""
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status='held', expires_at__lte=now)
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+
+    with transaction.atomic():
+        rows = list(expired.select_for_update(skip_locked=True).values_list('pk', 'product_id', 'quantity'))
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows], status='held').update(status='expired')
+        quantities = Counter()
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        _restock(quantities)
+    logger.info(f"[INVENTORY] Expired {len(rows)} unpaid stock hold(s)")
+    return len(rows)
@@ -0,0 +1,81 @@
+"""
+Retention for NotificationLog.
+
+archive_notifications() moves sent and failed rows older than
+NOTIFICATION_RETENTION_DAYS out of the table. Rows are read in primary key
+order, one batch at a time, and appended to one gzip-compressed JSONL file
+per calendar month:
+
+    <NOTIFICATION_ARCHIVE_DIR>/notification_log-2026-01.jsonl.gz
+
+Each batch is written as a complete gzip member and closed before its rows
+are deleted, so an interrupted run never loses rows. At worst a batch
+appears in the archive twice. Pending rows (the outbox) are never archived.
+"""
+import gzip
+import json
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from orders.models import NotificationLog
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = (
+    'id', 'user_id', 'order_id', 'notification_type', 'event_type', 'recipient', 'status', 'queue',
+    'response_log', 'error_message', 'retry_count', 'sent_at', 'created_at',
+)
+
+
+def _write(archive_dir, rows):
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row['created_at'].strftime('%Y-%m'), []).append(row)
+    paths = []
+    for month, month_rows in by_month.items():
+        path = archive_dir / f'notification_log-{month}.jsonl.gz'
+        # Appending adds a new gzip member; gzip readers see one continuous stream
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            for row in month_rows:
+                archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        paths.append(path)
+    return paths
+
+
+def archive_notifications(older_than_days=None, archive_dir=None, batch_size=1000, archive=True, dry_run=False):
+    """Archive (or just delete, with archive=False) old notification logs; returns stats"""
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+    archive_dir = Path(archive_dir or settings.NOTIFICATION_ARCHIVE_DIR)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    old = NotificationLog.objects.filter(created_at__lt=cutoff).exclude(status='pending')
+
+    stats = {'archived': 0, 'deleted': 0, 'files': set()}
+    if dry_run:
+        stats['archived'] = old.count()
+        return stats
+    if archive:
+        archive_dir.mkdir(parents=True, exist_ok=True)
+
+    last_pk = 0
+    while True:
+        rows = list(old.filter(pk__gt=last_pk).order_by('pk').values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            break
+        last_pk = rows[-1]['id']
+        if archive:
+            stats['files'].update(_write(archive_dir, rows))
+            stats['archived'] += len(rows)
+        deleted, _ = NotificationLog.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        stats['deleted'] += deleted
+
+    logger.info(
+        f"Archived {stats['archived']} and deleted {stats['deleted']} notification log(s) "
+        f"older than {older_than_days} day(s)"
+    )
+    return stats
@@ -0,0 +1,386 @@
+"""
+Customer email/SMS delivery in batches.
+
+queue_order_notifications() records one pending NotificationLog per
+channel and event. deliver_pending() drains them a batch at a time:
+
+- events of the same order are coalesced into one email and one SMS;
+- each order is loaded once, with its items, for both channels;
+- every email in the batch goes out over a single SMTP connection;
+- email templates are compiled once per process;
+- SMS go through the batched dispatcher in orders.services.sms_service;
+- outcomes are written back with one bulk_update.
+
+A worker claims a batch in a short transaction (SELECT ... FOR UPDATE
+SKIP LOCKED) that leases the rows: their next_attempt_at is pushed
+NOTIFICATION_LEASE_SECONDS ahead, so other workers skip them. The SMTP
+and SMS calls run after that transaction has committed, and the outcomes
+are written back afterwards, replacing the lease. If a worker dies
+mid-batch, its rows are picked up again once the lease runs out.
+
+notify() is the entry point for web requests. It only writes the pending
+rows and wakes the worker when the broker is healthy. When the broker is
+down the rows wait in the table, and no SMTP or SMS call is made inside
+the request. The beat schedule or the send_pending_notifications command
+drains them later.
+
+Rows belong to the transactional queue (receipts, order updates) or the
+bulk queue (backfills, replays). Each queue is drained by its own Celery
+task, routed to its own worker, so a bulk run cannot delay a receipt. A
+failed send is retried with exponential backoff and jitter. After
+NOTIFICATION_MAX_ATTEMPTS the row stays 'failed' as a dead letter until
+the replay_notifications command puts it back in a queue.
+"""
+import json
+import logging
+import random
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from orders.models import NotificationLog, Order
+from .broker import broker_available, mark_broker_down
+from .sms_service import SmsMessage, send_sms_batch
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TEMPLATES = {
+    'order_confirmed': ('Order Confirmed', 'emails/order_confirmed.html'),
+    'payment_successful': ('Payment Successful', 'emails/payment_successful.html'),
+    'invoice_sent': ('Invoice Ready', 'emails/invoice_sent.html'),
+    'order_shipped': ('Order Shipped', 'emails/order_shipped.html'),
+    'out_for_delivery': ('Out for Delivery', 'emails/out_for_delivery.html'),
+    'order_delivered': ('Order Delivered', 'emails/order_delivered.html'),
+    'refund_processed': ('Refund Processed', 'emails/refund_processed.html'),
+}
+
+SMS_TEMPLATES = {
+    'payment_successful': lambda order: f'Payment successful for order {order.order_number}. Amount: Rs.{order.total_amount}. - CERTIBUY',
+    'order_confirmed': lambda order: f'Order {order.order_number} confirmed. Track at certibuy.com. - CERTIBUY',
+    'invoice_sent': lambda order: f'Invoice for order {order.order_number} (Rs.{order.total_amount}). Download at certibuy.com/orders/{order.id}/invoice/. - CERTIBUY',
+    'order_shipped': lambda order: f'Your order {order.order_number} has been shipped. Tracking: {order.tracking_id or "Pending"}. - CERTIBUY',
+    'out_for_delivery': lambda order: f'Order {order.order_number} is out for delivery. Expect delivery today. - CERTIBUY',
+    'order_delivered': lambda order: f'Order {order.order_number} has been delivered. Thank you! - CERTIBUY',
+    'refund_processed': lambda order: f'Refund of Rs.{order.refund_amount} processed for order {order.order_number}. - CERTIBUY',
+}
+
+
+# Short form of each event for a combined SMS
+SMS_SUMMARIES = {
+    'payment_successful': lambda order: f'payment of Rs.{order.total_amount} received',
+    'order_confirmed': lambda order: 'confirmed',
+    'invoice_sent': lambda order: f'invoice at certibuy.com/orders/{order.id}/invoice/',
+    'order_shipped': lambda order: f'shipped (tracking {order.tracking_id or "pending"})',
+    'out_for_delivery': lambda order: 'out for delivery today',
+    'order_delivered': lambda order: 'delivered',
+    'refund_processed': lambda order: f'refund of Rs.{order.refund_amount} processed',
+}
+
+# Events are listed in the order they happen to an order
+EVENT_ORDER = {event_type: position for position, event_type in enumerate((
+    'payment_successful', 'order_confirmed', 'invoice_sent', 'order_shipped',
+    'out_for_delivery', 'order_delivered', 'refund_processed',
+))}
+
+
+@lru_cache(maxsize=None)
+def _compiled_template(name):
+    return get_template(name)
+
+
+def _in_order(event_types):
+    return sorted(set(event_types), key=lambda event_type: EVENT_ORDER.get(event_type, len(EVENT_ORDER)))
+
+
+def sms_message(order, event_types):
+    """One SMS text for one or more events of an order, or None if none has a template"""
+    event_types = [event_type for event_type in _in_order(event_types) if event_type in SMS_TEMPLATES]
+    if len(event_types) == 1:
+        return SMS_TEMPLATES[event_types[0]](order)
+    if not event_types:
+        return None
+    summary = '; '.join(SMS_SUMMARIES[event_type](order) for event_type in event_types)
+    return f'Order {order.order_number}: {summary}. - CERTIBUY'
+
+
+def build_email(order, event_types):
+    """One EmailMultiAlternatives for one or more events of an order, or None if none has a template"""
+    event_types = [event_type for event_type in _in_order(event_types) if event_type in EMAIL_TEMPLATES]
+    if not event_types:
+        return None
+    titles = [EMAIL_TEMPLATES[event_type][0] for event_type in event_types]
+    if len(event_types) == 1:
+        template_name = EMAIL_TEMPLATES[event_types[0]][1]
+    else:
+        template_name = 'emails/order_updates.html'
+    subject = f"{', '.join(titles)} - {order.order_number}"
+    context = {
+        'user': order.user,
+        'order': order,
+        'items': order.items.all(),
+        'updates': [{'event_type': event_type, 'title': title} for event_type, title in zip(event_types, titles)],
+        'site_name': 'CERTIBUY',
+        'support_email': settings.DEFAULT_FROM_EMAIL,
+    }
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=f"Order {order.order_number} - {subject}",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[order.user.email],
+    )
+    email.attach_alternative(_compiled_template(template_name).render(context), "text/html")
+    return email
+
+
+def _build_logs(items, channels, queue):
+    """Unsaved pending email/SMS logs for (order_id, event_type) pairs"""
+    orders = {
+        pk: (user_id, email, phone)
+        for pk, user_id, email, phone in Order.objects.filter(
+            pk__in={order_id for order_id, _ in items}
+        ).order_by().values_list('pk', 'user_id', 'user__email', 'address__phone')
+    }
+    logs = []
+    for order_id, event_type in items:
+        if order_id not in orders:
+            logger.error(f"Order {order_id} not found for {event_type} notification")
+            continue
+        user_id, email, phone = orders[order_id]
+        if 'email' in channels and event_type in EMAIL_TEMPLATES and email:
+            logs.append(NotificationLog(
+                user_id=user_id, order_id=order_id, notification_type='email',
+                event_type=event_type, recipient=email, status='pending', queue=queue,
+            ))
+        if 'sms' in channels and event_type in SMS_TEMPLATES and phone:
+            logs.append(NotificationLog(
+                user_id=user_id, order_id=order_id, notification_type='sms',
+                event_type=event_type, recipient=phone, status='pending', queue=queue,
+            ))
+    return logs
+
+
+def queue_order_notifications(items, channels=('email', 'sms'), queue='transactional'):
+    """Record pending email/SMS logs for (order_id, event_type) pairs; returns their ids"""
+    logs = _build_logs(items, channels, queue)
+    NotificationLog.objects.bulk_create(logs)
+    return [log.pk for log in logs]
+
+
+def send_now(items, channels=('email', 'sms')):
+    """Send (order_id, event_type) notifications inline; returns how many logs were sent
+
+    The outcome is known before anything is stored, so each log is written
+    once, already sent or failed (or pending with its retry time).
+    """
+    logs = _build_logs(items, channels, 'transactional')
+    if not logs:
+        return 0
+    _send(logs)
+    NotificationLog.objects.bulk_create(logs)
+    return sum(1 for log in logs if log.status == 'sent')
+
+
+def wake_worker(queue='transactional'):
+    """Ask Celery to drain a queue once the coalescing window has passed; False if the broker is down"""
+    from orders.tasks import deliver_bulk_notifications, deliver_pending_notifications
+
+    task = deliver_bulk_notifications if queue == 'bulk' else deliver_pending_notifications
+    if not broker_available():
+        return False
+    try:
+        task.apply_async(countdown=_coalesce_seconds())
+    except Exception as exc:
+        mark_broker_down()
+        logger.warning(f"Could not queue notification delivery: {str(exc)[:100]}")
+        return False
+    return True
+
+
+def notify(items, queue='transactional', channels=('email', 'sms')):
+    """Queue customer notifications for (order_id, event_type) pairs and wake the worker"""
+    ids = queue_order_notifications(items, channels=channels, queue=queue)
+    if ids and not wake_worker(queue):
+        logger.info(f"Broker down; {len(ids)} notification(s) kept in the outbox")
+    return ids
+
+
+def _coalesce_seconds():
+    return getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 10)
+
+
+def _retry_delay(attempts):
+    """Exponential backoff with jitter, so failed sends do not retry in lockstep"""
+    delay = min(getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 30) * 2 ** (attempts - 1), 3600)
+    return random.uniform(delay / 2, delay)
+
+
+def _response_log(response):
+    """Compact JSON of a provider response, capped at NOTIFICATION_RESPONSE_LOG_CHARS"""
+    return json.dumps(response, separators=(',', ':'))[:getattr(settings, 'NOTIFICATION_RESPONSE_LOG_CHARS', 500)]
+
+
+def _mark(logs, ok, response=None, error=None, sent_at=None):
+    """Record an outcome; a failure is retried later until NOTIFICATION_MAX_ATTEMPTS, then dead-lettered"""
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+    response_log = _response_log(response) if response is not None else None
+    for log in logs:
+        log.retry_count += 1
+        log.response_log = response_log or log.response_log
+        if ok:
+            log.status = 'sent'
+            log.sent_at = sent_at
+            log.next_attempt_at = None
+            continue
+        log.error_message = error
+        if log.retry_count < max_attempts:
+            log.next_attempt_at = timezone.now() + timedelta(seconds=_retry_delay(log.retry_count))
+        else:
+            log.status = 'failed'
+            log.next_attempt_at = None
+            logger.error(
+                f"{log.notification_type} {log.event_type} for order {log.order_id} "
+                f"dead-lettered after {log.retry_count} attempt(s): {error}"
+            )
+
+
+def _events(group):
+    return ', '.join(_in_order(log.event_type for log in group))
+
+
+def deliver_emails(groups, orders):
+    """Send one email per group over a single SMTP connection; updates the logs in memory"""
+    if not groups:
+        return
+    sent_at = timezone.now()
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.error(f"✗ Could not open email connection: {str(exc)}")
+        for group in groups:
+            _mark(group, False, error=str(exc))
+        return
+    try:
+        for group in groups:
+            order = orders[group[0].order_id]
+            try:
+                email = build_email(order, [log.event_type for log in group])
+                if email is None:
+                    raise ValueError(f"Unknown event type: {_events(group)}")
+                # send_messages on an open connection leaves it open for the next message
+                connection.send_messages([email])
+            except Exception as exc:
+                _mark(group, False, error=str(exc))
+                logger.error(f"✗ Email failed: {_events(group)} for order {order.order_number} - {str(exc)}")
+            else:
+                _mark(group, True, response='Email sent successfully', sent_at=sent_at)
+                logger.info(f"✓ Email sent: {_events(group)} for order {order.order_number}")
+    finally:
+        connection.close()
+
+
+def deliver_sms(groups, orders):
+    """Send one SMS per group through the batched dispatcher; updates the logs in memory"""
+    if not groups:
+        return
+    sendable, messages = [], []
+    for group in groups:
+        message = sms_message(orders[group[0].order_id], [log.event_type for log in group])
+        if message is None:
+            _mark(group, False, error=f"Unknown SMS event type: {_events(group)}")
+            continue
+        sendable.append(group)
+        messages.append(SmsMessage(group[0].recipient, message))
+    sent_at = timezone.now()
+    for group, response in zip(sendable, send_sms_batch(messages) if messages else []):
+        order_number = orders[group[0].order_id].order_number
+        if response.get('status') == 'success':
+            _mark(group, True, response=response, sent_at=sent_at)
+            logger.info(f"✓ SMS sent: {_events(group)} for order {order_number} to {group[0].recipient}")
+        else:
+            _mark(group, False, response=response, error=response.get('message', 'Unknown error'))
+            logger.error(f"✗ SMS failed: {_events(group)} for order {order_number}")
+
+
+def _send(logs):
+    """Send logs, recording outcomes in memory
+
+    Logs for the same order, channel and recipient are coalesced into one
+    message, and each order is loaded once for both the email and the SMS.
+    """
+    orders = (
+        Order.objects.select_related('user', 'address')
+        .prefetch_related('items__product')
+        .in_bulk({log.order_id for log in logs})
+    )
+    groups = {}
+    for log in logs:
+        if log.order_id not in orders:
+            _mark([log], False, error=f"Order {log.order_id} not found")
+            continue
+        groups.setdefault((log.order_id, log.notification_type, log.recipient), []).append(log)
+    deliver_emails([group for key, group in groups.items() if key[1] == 'email'], orders)
+    deliver_sms([group for key, group in groups.items() if key[1] == 'sms'], orders)
+
+
+def deliver(logs):
+    """Send claimed logs and store every outcome with one bulk_update"""
+    _send(logs)
+    NotificationLog.objects.bulk_update(
+        logs, ['status', 'sent_at', 'next_attempt_at', 'response_log', 'error_message', 'retry_count']
+    )
+    return sum(1 for log in logs if log.status == 'sent')
+
+
+def _claim(pending, batch_size, now):
+    """Lease up to batch_size rows to this worker, in a transaction that ends before anything is sent"""
+    lease_until = now + timedelta(seconds=getattr(settings, 'NOTIFICATION_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        logs = list(pending.select_for_update(skip_locked=True).order_by('created_at')[:batch_size])
+        if logs:
+            NotificationLog.objects.filter(pk__in=[log.pk for log in logs]).update(next_attempt_at=lease_until)
+    return logs
+
+
+def deliver_pending(batch_size=None, ids=None, queue='transactional'):
+    """Drain one batch of pending notifications from a queue; returns (claimed, sent)
+
+    Without ids only rows older than NOTIFICATION_COALESCE_SECONDS are
+    taken, so events raised together for an order (payment, confirmation,
+    invoice) are sent as one email and one SMS. Rows waiting for a retry,
+    or leased by another worker, are skipped until their next_attempt_at.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'NOTIFICATION_BULK_BATCH_SIZE' if queue == 'bulk' else 'NOTIFICATION_BATCH_SIZE', 200)
+    now = timezone.now()
+    pending = NotificationLog.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        status='pending',
+        order__isnull=False,
+    )
+    if ids is not None:
+        pending = pending.filter(pk__in=ids)
+    else:
+        pending = pending.filter(queue=queue, created_at__lte=now - timedelta(seconds=_coalesce_seconds()))
+    logs = _claim(pending, batch_size, now)
+    if not logs:
+        return 0, 0
+    sent = deliver(logs)
+    logger.info(f"Delivered {sent} of {len(logs)} {queue} notification(s)")
+    return len(logs), sent
+
+
+def replay_dead_letters(queryset, queue='bulk'):
+    """Put dead-lettered (failed) notifications back in a queue; returns how many"""
+    replayed = queryset.filter(status='failed').update(
+        status='pending', queue=queue, retry_count=0, next_attempt_at=None,
+    )
+    if replayed:
+        wake_worker(queue)
+    return replayed
@@ -0,0 +1,92 @@
+"""
+Order persistence for checkout.
+
+Every row is prepared in Python first; the transaction then runs a fixed
+set of statements whatever the cart size:
+
+    INSERT order
+    INSERT order items          (one bulk_create)
+    reserve stock               (see orders.services.inventory)
+    INSERT status history       (one bulk_create)
+
+The order is created directly in its final state (e.g. confirmed for COD)
+so it is never saved a second time inside the checkout transaction.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, OrderStatusHistory
+from .inventory import release_reservations, reserve_stock
+
+logger = logging.getLogger(__name__)
+
+
+def build_order(user, address, lines, *, order_number, subtotal, total_amount, payment_method,
+                delivery_charge=0, emi_plan=None, item_options=None, status='pending_payment',
+                payment_status='pending', history=(), hold=True, **order_fields):
+    """Create an order, its items, stock reservations and history in one short transaction.
+
+    ``lines`` are cart lines (anything with product, quantity and price).
+    ``history`` is a sequence of (status, notes) pairs written after the
+    initial "Order created" entry. With hold=False the stock is committed
+    immediately instead of being held until payment.
+    """
+    item_options = item_options or {}
+    order = Order(
+        user=user,
+        order_number=order_number,
+        address=address,
+        subtotal=subtotal,
+        delivery_charge=delivery_charge,
+        total_amount=total_amount,
+        payment_method=payment_method,
+        payment_status=payment_status,
+        status=status,
+        emi_plan=emi_plan,
+        estimated_delivery=timezone.now().date() + timedelta(days=getattr(settings, 'ORDER_DELIVERY_DAYS', 5)),
+        **order_fields,
+    )
+    items = [
+        OrderItem(
+            product=line.product,
+            quantity=line.quantity,
+            price=line.price,
+            condition=item_options.get('condition'),
+            storage=item_options.get('storage'),
+            color=item_options.get('color'),
+        )
+        for line in lines
+    ]
+    entries = [('pending_payment', "Order created")] + list(history)
+    stock_lines = [(line.product.id, line.quantity) for line in lines]
+
+    with transaction.atomic():
+        order.save()
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        # Raises InsufficientStock and rolls everything back if a product ran out
+        reserve_stock(order, stock_lines, hold=hold)
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(order=order, status=entry_status, updated_by=user, notes=notes)
+            for entry_status, notes in entries
+        ])
+
+    logger.info(f"Order {order.id} created with {len(items)} item(s), status={status}, payment={payment_status}")
+    return order
+
+
+def discard_order(order, reason):
+    """Undo an order whose payment could not be started (e.g. gateway down).
+
+    Mirrors the rollback the order would have had if the gateway call had
+    been made inside the checkout transaction.
+    """
+    with transaction.atomic():
+        release_reservations(order)
+        order.delete()
+    logger.warning(f"Discarded order {order.order_number}: {reason}")
@@ -0,0 +1,230 @@
+"""
+Process-wide Razorpay adapter.
+
+One razorpay.Client is shared by every request in the process. Its
+requests.Session keeps a pool of keep-alive connections, so checkout,
+payment callbacks and refunds skip the TCP/TLS handshake. Every call has
+explicit connect/read timeouts. Idempotent reads are retried with jittered
+exponential backoff. A circuit breaker fails fast with GatewayUnavailable
+once the gateway keeps failing, instead of tying up workers on timeouts.
+A 5xx is raised as GatewayServerError before its body is parsed (a proxy's
+502 page is HTML), and both 5xx answers and unparseable bodies count as
+breaker failures.
+
+Settings (all optional):
+    RAZORPAY_BASE_URL                   override the API host (fake gateway in tests)
+    RAZORPAY_CONNECT_TIMEOUT            seconds, default 3
+    RAZORPAY_READ_TIMEOUT               seconds, default 10
+    RAZORPAY_POOL_SIZE                  keep-alive connections, default 10
+    RAZORPAY_MAX_RETRIES                extra attempts for idempotent calls, default 2
+    RAZORPAY_BREAKER_THRESHOLD          consecutive failures that open the breaker, default 5
+    RAZORPAY_BREAKER_COOLDOWN           seconds the breaker stays open, default 30
+"""
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayUnavailable(Exception):
+    """Raised without calling the gateway while the circuit breaker is open"""
+
+
+class GatewayServerError(requests.exceptions.HTTPError):
+    """The gateway answered 5xx"""
+
+
+def _raise_for_server_error(response, *args, **kwargs):
+    """Session response hook: fail on 5xx before the client tries to parse the body as JSON"""
+    if response.status_code >= 500:
+        raise GatewayServerError(f"Gateway returned {response.status_code}: {response.text[:200]}", response=response)
+
+
+def gateway_errors():
+    """Errors that indicate the gateway (not the request) is unhealthy"""
+    # JSONDecodeError: a body that is not the API's JSON came from something other than the gateway
+    errors = (
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout, GatewayServerError, json.JSONDecodeError,
+    )
+    try:
+        from razorpay.errors import GatewayError, ServerError
+        return errors + (GatewayError, ServerError)
+    except ImportError:
+        return errors
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half-open after `cooldown`"""
+
+    def __init__(self, threshold=5, cooldown=30.0, name='Payment gateway'):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == 'open' or (state == 'half-open' and self._trial_running):
+                raise GatewayUnavailable(f"{self.name} circuit is open")
+            if state == 'half-open':
+                # Let exactly one trial request probe the gateway
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"[GATEWAY] {self.name} recovered, circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                logger.error(f"[GATEWAY] {self.name} circuit opened after {self._failures} consecutive failure(s)")
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies a default (connect, read) timeout to every request"""
+
+    def __init__(self, timeout, pool_size):
+        super().__init__()
+        self.default_timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+class PaymentGateway:
+    """Thin wrapper over razorpay.Client adding timeouts, retries and a circuit breaker"""
+
+    def __init__(self, key_id, key_secret, base_url=None, connect_timeout=3.0, read_timeout=10.0,
+                 pool_size=10, max_retries=2, breaker=None):
+        import razorpay
+
+        self.session = TimeoutSession((connect_timeout, read_timeout), pool_size)
+        self.session.hooks['response'].append(_raise_for_server_error)
+        options = {'base_url': base_url} if base_url else {}
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret), **options)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._gateway_errors = gateway_errors()
+
+    def _call(self, func, *args, idempotent=False):
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        delay = 0.2
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                result = func(*args)
+            except self._gateway_errors as exc:
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+                # Full jitter keeps retrying workers from hitting the gateway in lockstep
+                sleep_for = random.uniform(0, delay)
+                logger.warning(f"[GATEWAY] {type(exc).__name__} on attempt {attempt + 1}, retrying in {sleep_for:.2f}s")
+                time.sleep(sleep_for)
+                delay *= 2
+            except Exception:
+                # 4xx-style errors mean the gateway answered; it is healthy
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def create_order(self, data):
+        return self._call(self.client.order.create, data)
+
+    def fetch_payment(self, payment_id):
+        return self._call(self.client.payment.fetch, payment_id, idempotent=True)
+
+    def fetch_order_payments(self, order_id):
+        return self._call(self.client.order.payments, order_id, idempotent=True)
+
+    def refund(self, payment_id, data, idempotency_key=None):
+        if idempotency_key is None:
+            return self._call(self.client.payment.refund, payment_id, data)
+        # A repeated key returns the original refund, so the call is safe to retry
+        headers = {'X-Refund-Idempotency': idempotency_key}
+        return self._call(
+            lambda *args: self.client.payment.refund(*args, headers=headers), payment_id, data, idempotent=True
+        )
+
+    def fetch_refunds(self, params):
+        return self._call(self.client.refund.all, params, idempotent=True)
+
+
+_gateway = None
+_gateway_config = None
+_gateway_lock = threading.Lock()
+
+
+def _config():
+    return (
+        settings.RAZORPAY_KEY_ID,
+        settings.RAZORPAY_KEY_SECRET,
+        getattr(settings, 'RAZORPAY_BASE_URL', None),
+        float(getattr(settings, 'RAZORPAY_CONNECT_TIMEOUT', 3)),
+        float(getattr(settings, 'RAZORPAY_READ_TIMEOUT', 10)),
+        int(getattr(settings, 'RAZORPAY_POOL_SIZE', 10)),
+        int(getattr(settings, 'RAZORPAY_MAX_RETRIES', 2)),
+        int(getattr(settings, 'RAZORPAY_BREAKER_THRESHOLD', 5)),
+        float(getattr(settings, 'RAZORPAY_BREAKER_COOLDOWN', 30)),
+    )
+
+
+def get_gateway():
+    """The shared PaymentGateway, or None when Razorpay is not installed or configured"""
+    global _gateway, _gateway_config
+
+    config = _config()
+    if _gateway is not None and _gateway_config == config:
+        return _gateway
+    key_id, key_secret, base_url, connect, read, pool, retries, threshold, cooldown = config
+    if not key_id or not key_secret:
+        logger.error("Razorpay keys are missing. Set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET.")
+        return None
+    with _gateway_lock:
+        if _gateway is None or _gateway_config != config:
+            try:
+                _gateway = PaymentGateway(
+                    key_id, key_secret, base_url=base_url, connect_timeout=connect, read_timeout=read,
+                    pool_size=pool, max_retries=retries, breaker=CircuitBreaker(threshold, cooldown),
+                )
+            except ImportError:
+                logger.warning("Razorpay SDK not installed")
+                return None
+            _gateway_config = config
+    return _gateway
@@ -0,0 +1,69 @@
+"""
+Payment outcome transitions shared by every path that learns about a
+Razorpay payment: the checkout callback, the webhook worker and the
+pending-payment reconciliation job.
+
+The apply_* helpers expect a row-locked order inside a transaction and
+return the unsaved OrderStatusHistory row, so batch callers can insert
+history with one bulk_create.
+"""
+import logging
+
+from django.db import transaction
+
+from core.outbox import queue_notification
+from orders.models import OrderStatusHistory
+from .inventory import commit_reservations, release_reservations
+
+logger = logging.getLogger(__name__)
+
+CONFIRMATION_EVENTS = ('payment_successful', 'order_confirmed', 'invoice_sent')
+
+
+def apply_captured(order, payment_id, signature=None, source=''):
+    order.razorpay_payment_id = payment_id
+    if signature:
+        order.razorpay_signature = signature
+    order.payment_status = 'success'
+    order.status = 'confirmed'
+    order.save()
+    if not commit_reservations(order):
+        logger.error(f"[INVENTORY] Order {order.id} needs manual stock review after late payment")
+    notes = f"Payment captured: {payment_id}" + (f" ({source})" if source else "")
+    logger.info(f"[PAYMENT] Order {order.id} confirmed. {notes}")
+    return OrderStatusHistory(order=order, status='confirmed', updated_by=order.user, notes=notes)
+
+
+def apply_failed(order, notes):
+    order.payment_status = 'failed'
+    order.save()
+    release_reservations(order)
+    return OrderStatusHistory(order=order, status='payment_failed', updated_by=order.user, notes=notes)
+
+
+def apply_captured_for_cancelled(order, payment_id, source=''):
+    """A payment captured after the order was cancelled: never confirm it, flag it for a manual refund"""
+    logger.error(f"[PAYMENT] Payment {payment_id} captured for cancelled order {order.id}; refund it manually")
+    queue_notification(
+        "Refund Needed",
+        f"Payment {payment_id} was captured for cancelled order {order.order_number or order.id} and needs a manual refund.",
+        'refund', 'high', order,
+    )
+    notes = f"Payment {payment_id} captured for a cancelled order; refund it manually" + (f" ({source})" if source else "")
+    return apply_failed(order, notes)
+
+
+def send_notifications(pending):
+    """Queue (order_id, event_type) customer notifications; they wait in the outbox if Celery is down"""
+    from .notifications import notify
+
+    try:
+        notify(pending)
+    except Exception as exc:
+        logger.error(f"[NOTIFICATION] Failed to queue {len(pending)} notification(s): {str(exc)}")
+
+
+def notify_confirmed_on_commit(order_ids):
+    pending = [(order_id, event) for order_id in order_ids for event in CONFIRMATION_EVENTS]
+    if pending:
+        transaction.on_commit(lambda: send_notifications(pending))
@@ -0,0 +1,165 @@
+"""
+Reconciliation of online orders stuck in payment_status='pending'.
+
+Customers who close the tab after the Razorpay checkout never hit
+payment_callback. reconcile_pending_payments() walks those orders by
+primary key, one page at a time, so memory stays flat however many are
+pending. For each page it asks Razorpay for the payments of every order
+using a bounded thread pool, then locks the page's orders once and applies
+the outcome through orders.services.payments, the same transitions the
+checkout callback and the webhook worker use:
+
+    a captured payment of the right amount -> order confirmed
+    only failed payments, or none at all     -> payment marked failed
+    anything else (e.g. authorized)          -> left pending for the next run
+
+Cancelled orders are skipped. One cancelled after its page was fetched is
+never confirmed: a captured payment on it is marked failed and flagged to
+the admins for a manual refund, as the webhook worker does.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order, OrderStatusHistory
+from .payment_gateway import GatewayUnavailable, get_gateway
+from .payments import apply_captured, apply_captured_for_cancelled, apply_failed, notify_confirmed_on_commit
+
+logger = logging.getLogger(__name__)
+
+
+def _pending_orders(cutoff, batch_size):
+    """Pages of (pk, razorpay_order_id, total_amount, created_at), keyset-paginated by pk"""
+    last_pk = 0
+    while True:
+        page = list(
+            Order.objects.filter(
+                payment_status='pending',
+                razorpay_order_id__isnull=False,
+                created_at__lte=cutoff,
+                pk__gt=last_pk,
+            )
+            .exclude(status='cancelled')
+            .order_by('pk')
+            .values_list('pk', 'razorpay_order_id', 'total_amount', 'created_at')[:batch_size]
+        )
+        if not page:
+            return
+        yield page
+        last_pk = page[-1][0]
+
+
+def _decide(payments, total_amount):
+    """('captured', payment) / ('failed', reason) / None to leave the order pending"""
+    expected = int(total_amount * 100)
+    for payment in payments:
+        if payment.get('status') == 'captured':
+            if payment.get('amount') != expected:
+                return 'failed', f"Payment amount mismatch - FRAUD ALERT ({payment.get('id')})"
+            return 'captured', payment
+    if any(payment.get('status') not in ('failed', 'refunded') for payment in payments):
+        return None
+    if payments:
+        return 'failed', "Payment failed (reconciliation)"
+    return 'failed', "Payment not completed (reconciliation)"
+
+
+def _fetch(gateway, razorpay_order_id):
+    try:
+        return gateway.fetch_order_payments(razorpay_order_id).get('items', [])
+    except GatewayUnavailable:
+        raise
+    except Exception as exc:
+        logger.warning(f"[RECONCILE] Could not fetch payments for {razorpay_order_id}: {str(exc)}")
+        return None
+
+
+def _apply(decisions):
+    """Apply one page of decisions under a single lock; returns (confirmed, failed)"""
+    confirmed, failed, history = [], [], []
+    with transaction.atomic():
+        # Re-check under the lock: the callback or a webhook may have won meanwhile
+        unsettled = Order.objects.select_for_update().select_related('user').filter(
+            pk__in=decisions, payment_status='pending', razorpay_payment_id__isnull=True,
+        )
+        orders = list(unsettled.exclude(status='cancelled'))
+        for order in orders:
+            outcome, detail = decisions[order.pk]
+            if outcome == 'captured':
+                history.append(apply_captured(order, detail['id'], source='reconciliation'))
+                confirmed.append(order.pk)
+            else:
+                history.append(apply_failed(order, detail))
+                failed.append(order.pk)
+        captured = [pk for pk, (outcome, _) in decisions.items() if outcome == 'captured']
+        if len(orders) < len(decisions) and captured:
+            # Cancelled since the page was read; the money has to go back
+            for order in unsettled.filter(pk__in=captured, status='cancelled'):
+                history.append(apply_captured_for_cancelled(order, decisions[order.pk][1]['id'], source='reconciliation'))
+                failed.append(order.pk)
+        OrderStatusHistory.objects.bulk_create(history)
+        notify_confirmed_on_commit(confirmed)
+    return len(confirmed), len(failed)
+
+
+def reconcile_pending_payments(older_than_minutes=None, batch_size=None, concurrency=None, limit=None, dry_run=False):
+    """Resolve stale pending payments against Razorpay; returns throughput and lag metrics"""
+    older_than_minutes = older_than_minutes or getattr(settings, 'PAYMENT_RECONCILE_AFTER_MINUTES', 30)
+    batch_size = batch_size or getattr(settings, 'PAYMENT_RECONCILE_BATCH_SIZE', 200)
+    concurrency = concurrency or getattr(settings, 'PAYMENT_RECONCILE_CONCURRENCY', 8)
+
+    stats = {'scanned': 0, 'confirmed': 0, 'failed': 0, 'unchanged': 0, 'errors': 0, 'max_lag_seconds': 0}
+    started = time.perf_counter()
+    gateway = get_gateway()
+    if gateway is None:
+        logger.error("[RECONCILE] Payment gateway is not configured")
+        return stats
+    now = timezone.now()
+    cutoff = now - timedelta(minutes=older_than_minutes)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for page in _pending_orders(cutoff, batch_size):
+            if limit is not None:
+                page = page[:limit - stats['scanned']]
+            stats['scanned'] += len(page)
+            oldest = min(row[3] for row in page)
+            stats['max_lag_seconds'] = max(stats['max_lag_seconds'], int((now - oldest).total_seconds()))
+            try:
+                results = list(pool.map(lambda row: _fetch(gateway, row[1]), page))
+            except GatewayUnavailable:
+                logger.error("[RECONCILE] Payment gateway circuit is open; stopping this run")
+                stats['errors'] += len(page)
+                break
+
+            decisions = {}
+            for (pk, _, total_amount, _), payments in zip(page, results):
+                if payments is None:
+                    stats['errors'] += 1
+                    continue
+                decision = _decide(payments, total_amount)
+                if decision is not None:
+                    decisions[pk] = decision
+            if dry_run:
+                confirmed = sum(1 for outcome, _ in decisions.values() if outcome == 'captured')
+                failed = len(decisions) - confirmed
+            else:
+                confirmed, failed = _apply(decisions) if decisions else (0, 0)
+            stats['confirmed'] += confirmed
+            stats['failed'] += failed
+            if limit is not None and stats['scanned'] >= limit:
+                break
+
+    stats['unchanged'] = stats['scanned'] - stats['confirmed'] - stats['failed'] - stats['errors']
+    stats['duration_seconds'] = round(time.perf_counter() - started, 3)
+    stats['orders_per_second'] = round(stats['scanned'] / stats['duration_seconds'], 1) if stats['duration_seconds'] else 0
+    logger.info(
+        f"[RECONCILE] Scanned {stats['scanned']} pending order(s) in {stats['duration_seconds']}s "
+        f"({stats['orders_per_second']}/s): {stats['confirmed']} confirmed, {stats['failed']} failed, "
+        f"{stats['errors']} error(s), oldest {stats['max_lag_seconds']}s behind"
+    )
+    return stats
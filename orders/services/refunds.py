@@ -0,0 +1,251 @@
+"""
+Refund queue.
+
+Cancelling an order only records a RefundRequest; the gateway is called by
+a Celery worker after the cancellation has committed, so no row lock is
+held across the network call and a slow gateway cannot fail the
+cancellation.
+
+Every request carries an idempotency key sent as X-Refund-Idempotency, so
+a retry after a lost response returns the original refund instead of
+refunding twice. Gateway errors are retried with exponential backoff up to
+REFUND_MAX_ATTEMPTS; a claimed request is leased for REFUND_LEASE_SECONDS
+so concurrent workers skip it and a crashed worker's claim runs out.
+
+Refunds still in progress at Razorpay are reconciled by reconcile_refunds(),
+which lists recent refunds page by page instead of fetching them one at a
+time and writes status changes with bulk_update.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import counters
+from core.outbox import queue_notification
+from orders.models import Order, RefundRequest
+from .payment_gateway import GatewayUnavailable, gateway_errors, get_gateway
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _queue(refund_id):
+    from orders.tasks import execute_refund as execute_refund_task
+
+    try:
+        execute_refund_task.delay(refund_id)
+    except Exception as exc:
+        # The process_due_refunds beat task picks it up
+        logger.warning(f"[REFUND] Could not queue refund {refund_id}: {str(exc)}")
+
+
+def request_refund(order, amount=None, reason=''):
+    """Record a refund for the order and queue it once the transaction commits"""
+    refund = RefundRequest.objects.filter(order=order).exclude(status='failed').first()
+    if refund is not None:
+        return refund
+    refund = RefundRequest.objects.create(order=order, amount=amount or order.total_amount, reason=reason)
+    transaction.on_commit(lambda: _queue(refund.pk))
+    logger.info(f"[REFUND] Refund of {refund.amount} requested for order {order.id}")
+    return refund
+
+
+def _claim(refund_id, now):
+    with transaction.atomic():
+        refund = (
+            RefundRequest.objects.select_for_update()
+            .select_related('order')
+            .filter(pk=refund_id, status='pending')
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .first()
+        )
+        if refund is None:
+            return None
+        refund.attempts += 1
+        refund.next_attempt_at = now + timedelta(seconds=_setting('REFUND_LEASE_SECONDS', 300))
+        refund.save(update_fields=['attempts', 'next_attempt_at', 'updated_at'])
+        return refund
+
+
+def _fail(refund, error):
+    with transaction.atomic():
+        refund.status = 'failed'
+        refund.last_error = error
+        refund.next_attempt_at = None
+        refund.save(update_fields=['status', 'last_error', 'next_attempt_at', 'updated_at'])
+        order = Order.objects.select_for_update().get(pk=refund.order_id)
+        order.refund_status = 'failed'
+        order.save()
+        queue_notification(
+            "Refund Failed",
+            f"Refund for order {order.order_number or order.id} failed and needs manual handling.",
+            'refund', 'high', order,
+        )
+    logger.error(f"[REFUND] Refund {refund.pk} for order {refund.order_id} failed: {error}")
+
+
+def _notify_customer(order_id):
+    from .payments import send_notifications
+
+    send_notifications([(order_id, 'refund_processed')])
+
+
+def _record_submission(refund, result):
+    now = timezone.now()
+    with transaction.atomic():
+        refund.razorpay_refund_id = result['id']
+        refund.gateway_status = result.get('status', '')
+        refund.status = 'processed' if refund.gateway_status in counters.REFUND_DONE_STATUSES else 'submitted'
+        refund.last_error = ''
+        refund.next_attempt_at = None
+        refund.save()
+
+        order = Order.objects.select_for_update().get(pk=refund.order_id)
+        order.refund_id = refund.razorpay_refund_id
+        order.refund_status = refund.gateway_status
+        order.refund_amount = refund.amount
+        order.payment_status = 'refunded'
+        if refund.status == 'processed':
+            order.refunded_at = now
+        order.save()
+
+        transaction.on_commit(lambda: _notify_customer(order.id))
+    logger.info(f"[REFUND] Refund {refund.razorpay_refund_id} ({refund.gateway_status}) for order {order.id}")
+
+
+def _retry_delay(attempts):
+    delay = min(_setting('REFUND_RETRY_BASE_SECONDS', 30) * 2 ** (attempts - 1), 3600)
+    return random.uniform(delay / 2, delay)
+
+
+def execute_refund(refund_id):
+    """Send one refund to the gateway.
+
+    Returns the number of seconds after which it should be retried, or None
+    when there is nothing more to do.
+    """
+    refund = _claim(refund_id, timezone.now())
+    if refund is None:
+        return None
+    order = refund.order
+    gateway = get_gateway()
+    try:
+        if gateway is None:
+            raise GatewayUnavailable("Razorpay is not configured")
+        result = gateway.refund(
+            order.razorpay_payment_id,
+            {'amount': int(refund.amount * 100), 'notes': {'order_number': order.order_number or str(order.id)}},
+            idempotency_key=refund.idempotency_key,
+        )
+    except (GatewayUnavailable,) + gateway_errors() as exc:
+        if refund.attempts >= _setting('REFUND_MAX_ATTEMPTS', 8):
+            _fail(refund, f"Gave up after {refund.attempts} attempts: {exc}")
+            return None
+        delay = _retry_delay(refund.attempts)
+        refund.last_error = str(exc) or type(exc).__name__
+        refund.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        refund.save(update_fields=['last_error', 'next_attempt_at', 'updated_at'])
+        logger.warning(f"[REFUND] Gateway error for refund {refund.pk}, retrying in {delay:.0f}s: {str(exc)}")
+        return delay
+    except Exception as exc:
+        # The gateway answered and refused (e.g. payment already fully refunded)
+        _fail(refund, str(exc))
+        return None
+    _record_submission(refund, result)
+    return None
+
+
+def due_refunds(limit=100, now=None):
+    """Ids of pending refunds whose retry time (or lease) has passed"""
+    now = now or timezone.now()
+    return list(
+        RefundRequest.objects.filter(status='pending')
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def _gateway_statuses(gateway, refunds):
+    """Current gateway status of each refund, listing refunds page by page"""
+    wanted = {refund.razorpay_refund_id for refund in refunds}
+    since = int(min(refund.created_at for refund in refunds).timestamp()) - 60
+    page_size = 100
+    statuses = {}
+    skip = 0
+    while True:
+        page = gateway.fetch_refunds({'from': since, 'count': page_size, 'skip': skip})
+        items = page.get('items', [])
+        for item in items:
+            if item['id'] in wanted:
+                statuses[item['id']] = item['status']
+        if len(items) < page_size or len(statuses) == len(wanted):
+            return statuses
+        skip += page_size
+
+
+def reconcile_refunds(batch_size=None):
+    """Poll the gateway for submitted refunds and apply status changes in bulk"""
+    batch_size = batch_size or _setting('REFUND_RECONCILE_BATCH_SIZE', 100)
+    refunds = list(
+        RefundRequest.objects.filter(status='submitted')
+        .select_related('order')
+        .order_by('created_at')[:batch_size]
+    )
+    gateway = get_gateway()
+    if not refunds or gateway is None:
+        return 0
+    statuses = _gateway_statuses(gateway, refunds)
+
+    now = timezone.now()
+    changed_refunds, changed_orders = [], []
+    for refund in refunds:
+        status = statuses.get(refund.razorpay_refund_id)
+        if status is None or status == refund.gateway_status:
+            continue
+        refund.gateway_status = status
+        if status in counters.REFUND_DONE_STATUSES:
+            refund.status = 'processed'
+        elif status == 'failed':
+            refund.status = 'failed'
+        refund.updated_at = now
+        changed_refunds.append(refund)
+
+        order = refund.order
+        order.refund_status = status
+        if refund.status == 'processed':
+            order.refunded_at = order.refunded_at or now
+        order.updated_at = now
+        changed_orders.append(order)
+
+    if not changed_refunds:
+        return 0
+    with transaction.atomic():
+        RefundRequest.objects.bulk_update(changed_refunds, ['gateway_status', 'status', 'updated_at'])
+        Order.objects.bulk_update(changed_orders, ['refund_status', 'refunded_at', 'updated_at'])
+        # bulk_update sends no post_save, so do what core.signals would have done
+        processed = [refund.order for refund in changed_refunds if refund.status == 'processed']
+        counters.adjust('pending_refunds', -len(processed))
+        for order in processed:
+            queue_notification(
+                "Refund Processed",
+                f"Refund processed for order {order.order_number or order.id}.",
+                'refund', 'medium', order,
+            )
+        for refund in changed_refunds:
+            if refund.status == 'failed':
+                queue_notification(
+                    "Refund Failed",
+                    f"Refund for order {refund.order.order_number or refund.order_id} failed and needs manual handling.",
+                    'refund', 'high', refund.order,
+                )
+    logger.info(f"[REFUND] Reconciled {len(changed_refunds)} of {len(refunds)} submitted refund(s)")
+    return len(changed_refunds)
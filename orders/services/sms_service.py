@@ -1,140 +1,306 @@
-import requests
+"""
+SMS delivery through MSG91 and Fast2SMS.
+
+SmsDispatcher keeps one pooled requests.Session per provider and sends
+many messages per HTTP call: an MSG91 flow call takes a list of
+{message, to[]} entries, and a Fast2SMS bulk call takes one text for many
+comma-separated numbers. A token bucket throttles each provider. Each
+provider also has a circuit breaker. A provider that keeps failing is
+skipped for SMS_PROVIDER_COOLDOWN seconds, and the other provider takes
+its traffic; it is not tried first and left to time out on every message.
+
+send_sms(), send_sms_msg91() and send_sms_fast2sms() keep their old
+signatures and result dicts.
+
+Settings (all optional):
+    SMS_PROVIDER                        preferred provider, 'msg91' or 'fast2sms'
+    MSG91_BASE_URL / FAST2SMS_BASE_URL  override the API hosts (fake provider in tests)
+    SMS_CONNECT_TIMEOUT                 seconds, default 3
+    SMS_READ_TIMEOUT                    seconds, default 10
+    SMS_POOL_SIZE                       keep-alive connections per provider, default 10
+    SMS_BATCH_SIZE                      messages per provider call, default 100
+    SMS_RATE_LIMIT_PER_SECOND           messages per second per provider, default 20
+    SMS_PROVIDER_FAILURE_THRESHOLD      consecutive failures before skipping a provider, default 3
+    SMS_PROVIDER_COOLDOWN               seconds a failing provider is skipped, default 60
+"""
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import requests
 from django.conf import settings
 
+from .payment_gateway import CircuitBreaker, GatewayUnavailable, TimeoutSession
+
 logger = logging.getLogger(__name__)
 
+SmsMessage = namedtuple('SmsMessage', ['phone', 'text'])
 
-def send_sms_msg91(phone, message, order_id=None):
-    """Send SMS via MSG91 API"""
-    try:
-        api_key = settings.MSG91_API_KEY
-        sender_id = settings.MSG91_SENDER_ID
-        route = settings.MSG91_ROUTE
-        
-        if not api_key:
-            logger.warning("MSG91 API key not configured")
-            return {'status': 'failed', 'message': 'SMS service not configured'}
-        
-        url = "https://api.msg91.com/api/v5/flow/"
-        
+
+class SmsError(Exception):
+    """The provider did not accept the batch"""
+
+
+class RateLimiter:
+    """Token bucket: `rate` messages per second with bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Block until `count` tokens are available (a batch larger than the burst drains it fully)"""
+        count = min(count, self.burst)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= count:
+                    self._tokens -= count
+                    return
+                wait = (count - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SmsProvider:
+    name = ''
+
+    def __init__(self, api_key, base_url, sender_id, timeout=(3.0, 10.0), pool_size=10,
+                 batch_size=100, rate=20, breaker=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.sender_id = sender_id
+        self.batch_size = batch_size
+        self.session = TimeoutSession(timeout, pool_size)
+        self.limiter = RateLimiter(rate)
+        self.breaker = breaker or CircuitBreaker()
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def send_batch(self, messages):
+        """Send up to batch_size messages; raises SmsError or GatewayUnavailable"""
+        self.breaker.before_call()
+        self.limiter.acquire(len(messages))
+        try:
+            response = self._post(messages)
+        except requests.exceptions.RequestException as exc:
+            self.breaker.record_failure()
+            raise SmsError(f"{self.name}: {type(exc).__name__}") from exc
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise SmsError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+        if response.status_code != 200:
+            # A 4xx means the provider is up but refused the request
+            self.breaker.record_success()
+            raise SmsError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+        try:
+            result = self._parse(response)
+        except SmsError:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return self._check(result)
+
+    def chunks(self, indices, messages):
+        """Split message indices into the groups sent per call"""
+        for start in range(0, len(indices), self.batch_size):
+            yield indices[start:start + self.batch_size]
+
+    def _post(self, messages):
+        raise NotImplementedError
+
+    def _parse(self, response):
+        try:
+            return response.json()
+        except ValueError as exc:
+            # A 200 with an HTML error page or an empty body from a proxy
+            raise SmsError(f"{self.name} returned a non-JSON response: {response.text[:200]}") from exc
+
+    def _check(self, result):
+        """Raise SmsError if a parsed reply says the provider refused the messages"""
+        return result
+
+
+class Msg91Provider(SmsProvider):
+    name = 'msg91'
+
+    def __init__(self, *args, route='4', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.route = route
+
+    def _post(self, messages):
+        grouped = OrderedDict()
+        for message in messages:
+            grouped.setdefault(message.text, []).append(message.phone.replace("+", "").replace(" ", ""))
         payload = {
-            "sender": sender_id,
-            "route": route,
+            "sender": self.sender_id,
+            "route": self.route,
             "country": "91",
-            "sms": [
-                {
-                    "message": message,
-                    "to": [phone.replace("+", "").replace(" ", "")]
-                }
-            ]
+            "sms": [{"message": text, "to": phones} for text, phones in grouped.items()],
         }
-        
-        headers = {
-            "authkey": api_key,
-            "content-type": "application/json"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            logger.info(f"MSG91 SMS sent to {phone}")
-            return {
-                'status': 'success',
-                'message': 'SMS sent successfully',
-                'response': response.json()
-            }
-        else:
-            logger.error(f"MSG91 SMS failed: {response.text}")
-            return {
-                'status': 'failed',
-                'message': response.text,
-                'status_code': response.status_code
-            }
-    
-    except requests.exceptions.Timeout:
-        logger.error(f"MSG91 SMS timeout for {phone}")
-        return {'status': 'failed', 'message': 'Request timeout'}
-    except Exception as e:
-        logger.exception(f"MSG91 SMS error: {str(e)}")
-        return {'status': 'failed', 'message': str(e)}
+        return self.session.post(f"{self.base_url}/api/v5/flow/", json=payload, headers={"authkey": self.api_key})
 
 
-def send_sms_fast2sms(phone, message, order_id=None):
-    """Send SMS via Fast2SMS API"""
-    try:
-        api_key = settings.FAST2SMS_API_KEY
-        
-        if not api_key:
-            logger.warning("Fast2SMS API key not configured")
-            return {'status': 'failed', 'message': 'SMS service not configured'}
-        
-        url = "https://www.fast2sms.com/dev/bulkV2"
-        
+class Fast2SmsProvider(SmsProvider):
+    name = 'fast2sms'
+
+    def chunks(self, indices, messages):
+        # A bulk call carries one text, so batch the recipients of each distinct text
+        by_text = OrderedDict()
+        for i in indices:
+            by_text.setdefault(messages[i].text, []).append(i)
+        for group in by_text.values():
+            yield from super().chunks(group, messages)
+
+    def _post(self, messages):
         payload = {
             "route": "v3",
-            "sender_id": settings.FAST2SMS_SENDER_ID,
-            "message": message,
+            "sender_id": self.sender_id,
+            "message": messages[0].text,
             "language": "english",
             "flash": 0,
-            "numbers": phone.replace("+91", "").replace(" ", "")
+            "numbers": ",".join(message.phone.replace("+91", "").replace(" ", "") for message in messages),
         }
-        
-        headers = {
-            "authorization": api_key,
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Cache-Control": "no-cache"
-        }
-        
-        response = requests.post(url, data=payload, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('return'):
-                logger.info(f"Fast2SMS sent to {phone}")
-                return {
-                    'status': 'success',
-                    'message': 'SMS sent successfully',
-                    'response': result
-                }
-            else:
-                logger.error(f"Fast2SMS failed: {result}")
-                return {
-                    'status': 'failed',
-                    'message': result.get('message', 'Unknown error')
-                }
-        else:
-            logger.error(f"Fast2SMS failed: {response.text}")
-            return {
-                'status': 'failed',
-                'message': response.text,
-                'status_code': response.status_code
-            }
-    
-    except requests.exceptions.Timeout:
-        logger.error(f"Fast2SMS timeout for {phone}")
-        return {'status': 'failed', 'message': 'Request timeout'}
-    except Exception as e:
-        logger.exception(f"Fast2SMS error: {str(e)}")
-        return {'status': 'failed', 'message': str(e)}
+        return self.session.post(
+            f"{self.base_url}/dev/bulkV2", data=payload,
+            headers={"authorization": self.api_key, "Cache-Control": "no-cache"},
+        )
+
+    def _parse(self, response):
+        result = super()._parse(response)
+        if not isinstance(result, dict):
+            raise SmsError(f"fast2sms returned an unexpected response: {response.text[:200]}")
+        return result
+
+    def _check(self, result):
+        if not result.get('return'):
+            raise SmsError(f"fast2sms: {result.get('message', 'Unknown error')}")
+        return result
+
+
+class SmsDispatcher:
+    """Sends messages through the first healthy provider, falling back in order"""
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    def _candidates(self, only=None):
+        providers = [p for p in self.providers if p.configured and (only is None or p.name == only)]
+        # Stable sort: preferred order, but providers with an open or probing circuit go last
+        return sorted(providers, key=lambda provider: provider.breaker.state != 'closed')
+
+    def send_many(self, messages, only=None):
+        """Send messages in provider batches; returns one result dict per message, in order"""
+        messages = [message if isinstance(message, SmsMessage) else SmsMessage(*message) for message in messages]
+        results = [None] * len(messages)
+        remaining = list(range(len(messages)))
+        last_error = 'SMS service not configured'
+
+        for provider in self._candidates(only):
+            for chunk in provider.chunks(remaining, messages):
+                try:
+                    response = provider.send_batch([messages[i] for i in chunk])
+                except GatewayUnavailable:
+                    last_error = f"{provider.name} is unavailable"
+                    logger.info(f"Skipping SMS provider {provider.name}: recently failing")
+                    break
+                except SmsError as exc:
+                    last_error = str(exc)
+                    logger.error(f"SMS batch of {len(chunk)} failed via {provider.name}: {exc}")
+                    break
+                for i in chunk:
+                    results[i] = {
+                        'status': 'success',
+                        'message': 'SMS sent successfully',
+                        'provider': provider.name,
+                        'response': response,
+                    }
+                logger.info(f"{provider.name} accepted {len(chunk)} SMS")
+            remaining = [i for i in remaining if results[i] is None]
+            if not remaining:
+                break
+            logger.info(f"Trying next SMS provider for {len(remaining)} message(s)")
+
+        for i in remaining:
+            results[i] = {'status': 'failed', 'message': last_error}
+        return results
+
+
+_dispatcher = None
+_dispatcher_config = None
+_dispatcher_lock = threading.Lock()
+
+
+def _config():
+    return (
+        getattr(settings, 'SMS_PROVIDER', 'msg91').lower(),
+        settings.MSG91_API_KEY,
+        settings.MSG91_SENDER_ID,
+        getattr(settings, 'MSG91_ROUTE', '4'),
+        getattr(settings, 'MSG91_BASE_URL', 'https://api.msg91.com'),
+        settings.FAST2SMS_API_KEY,
+        settings.FAST2SMS_SENDER_ID,
+        getattr(settings, 'FAST2SMS_BASE_URL', 'https://www.fast2sms.com'),
+        float(getattr(settings, 'SMS_CONNECT_TIMEOUT', 3)),
+        float(getattr(settings, 'SMS_READ_TIMEOUT', 10)),
+        int(getattr(settings, 'SMS_POOL_SIZE', 10)),
+        int(getattr(settings, 'SMS_BATCH_SIZE', 100)),
+        float(getattr(settings, 'SMS_RATE_LIMIT_PER_SECOND', 20)),
+        int(getattr(settings, 'SMS_PROVIDER_FAILURE_THRESHOLD', 3)),
+        float(getattr(settings, 'SMS_PROVIDER_COOLDOWN', 60)),
+    )
+
+
+def get_dispatcher():
+    """The shared SmsDispatcher, rebuilt when SMS settings change"""
+    global _dispatcher, _dispatcher_config
+
+    config = _config()
+    if _dispatcher is not None and _dispatcher_config == config:
+        return _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_config != config:
+            (preferred, msg91_key, msg91_sender, msg91_route, msg91_url, fast2sms_key, fast2sms_sender,
+             fast2sms_url, connect, read, pool, batch, rate, threshold, cooldown) = config
+            common = {'timeout': (connect, read), 'pool_size': pool, 'batch_size': batch, 'rate': rate}
+            providers = [
+                Msg91Provider(msg91_key, msg91_url, msg91_sender, route=msg91_route,
+                              breaker=CircuitBreaker(threshold, cooldown, name='MSG91'), **common),
+                Fast2SmsProvider(fast2sms_key, fast2sms_url, fast2sms_sender,
+                                 breaker=CircuitBreaker(threshold, cooldown, name='Fast2SMS'), **common),
+            ]
+            if preferred == 'fast2sms':
+                providers.reverse()
+            _dispatcher = SmsDispatcher(providers)
+            _dispatcher_config = config
+    return _dispatcher
+
+
+def send_sms_batch(messages):
+    """Send (phone, text) pairs; returns one result dict per message"""
+    return get_dispatcher().send_many(messages)
+
+
+def send_sms_msg91(phone, message, order_id=None):
+    """Send SMS via MSG91 API"""
+    return get_dispatcher().send_many([SmsMessage(phone, message)], only='msg91')[0]
+
+
+def send_sms_fast2sms(phone, message, order_id=None):
+    """Send SMS via Fast2SMS API"""
+    return get_dispatcher().send_many([SmsMessage(phone, message)], only='fast2sms')[0]
 
 
 def send_sms(phone, message, order_id=None):
     """
     Main SMS sending function - uses configured provider
-    Fallback to secondary provider if primary fails
+    Falls back to the other provider if the preferred one fails or is known to be down
     """
-    provider = getattr(settings, 'SMS_PROVIDER', 'msg91').lower()
-    
-    if provider == 'fast2sms':
-        result = send_sms_fast2sms(phone, message, order_id)
-        if result['status'] == 'failed':
-            logger.info("Trying MSG91 as fallback")
-            result = send_sms_msg91(phone, message, order_id)
-    else:
-        result = send_sms_msg91(phone, message, order_id)
-        if result['status'] == 'failed':
-            logger.info("Trying Fast2SMS as fallback")
-            result = send_sms_fast2sms(phone, message, order_id)
-    
-    return result
+    return get_dispatcher().send_many([SmsMessage(phone, message)])[0]
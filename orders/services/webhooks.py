@@ -0,0 +1,224 @@
+"""
+Razorpay webhook inbox.
+
+The webhook view only verifies the signature and stores the raw event in
+PaymentWebhookEvent (one INSERT, duplicates ignored by event id), so
+Razorpay gets its 200 immediately even during a flash sale. A worker
+(orders.tasks.process_payment_webhooks) then applies pending events to
+their orders in batches: one query claims the batch, one query loads and
+locks every order it touches, and status history rows go in with a single
+bulk_create.
+
+Handled events:
+    payment.captured  -> order confirmed, stock reservations committed
+    payment.failed    -> payment marked failed, stock reservations released
+    refund.processed  -> refund recorded on the order
+Anything else is marked 'ignored'. Events whose order cannot be found yet
+(a webhook can beat the checkout transaction) stay pending and are retried
+with exponential backoff from PAYMENT_WEBHOOK_RETRY_SECONDS, up to
+PAYMENT_WEBHOOK_MAX_ATTEMPTS times.
+"""
+import hashlib
+import hmac
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.models import Order, OrderStatusHistory, PaymentWebhookEvent, RefundRequest
+from .payments import (
+    CONFIRMATION_EVENTS, apply_captured, apply_captured_for_cancelled, apply_failed, send_notifications,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Retry(Exception):
+    """The event cannot be applied yet; leave it pending"""
+
+
+def verify_signature(body, signature, secret):
+    """Check X-Razorpay-Signature: HMAC-SHA256 of the raw request body"""
+    if not (secret and signature):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def record_event(event_id, event):
+    """Store a verified webhook delivery; redeliveries of the same event id are ignored"""
+    PaymentWebhookEvent.objects.bulk_create(
+        [PaymentWebhookEvent(event_id=event_id, event_type=event.get('event', ''), payload=event)],
+        ignore_conflicts=True,
+    )
+
+
+def _retry_at(event, now):
+    delay = getattr(settings, 'PAYMENT_WEBHOOK_RETRY_SECONDS', 30) * 2 ** (event.attempts - 1)
+    return now + timedelta(seconds=min(delay, 3600))
+
+
+def _entity(event, name):
+    return ((event.payload.get('payload') or {}).get(name) or {}).get('entity') or {}
+
+
+def _load_orders(events):
+    """Lock every order referenced by the batch, keyed by Razorpay order and payment id"""
+    order_ids, payment_ids = set(), set()
+    for event in events:
+        payment = _entity(event, 'payment')
+        if payment.get('order_id'):
+            order_ids.add(payment['order_id'])
+        payment_ids.update(filter(None, [payment.get('id'), _entity(event, 'refund').get('payment_id')]))
+    if not (order_ids or payment_ids):
+        return {}
+    orders = {}
+    for order in Order.objects.select_for_update().filter(
+        Q(razorpay_order_id__in=order_ids) | Q(razorpay_payment_id__in=payment_ids)
+    ):
+        orders[order.razorpay_order_id] = order
+        if order.razorpay_payment_id:
+            orders[order.razorpay_payment_id] = order
+    return orders
+
+
+def _find_order(event, orders):
+    payment = _entity(event, 'payment')
+    order = (
+        orders.get(payment.get('order_id'))
+        or orders.get(payment.get('id'))
+        or orders.get(_entity(event, 'refund').get('payment_id'))
+    )
+    if order is None:
+        raise _Retry(f"No order for {event.event_type} {event.event_id}")
+    return order
+
+
+def _payment_captured(event, order, orders):
+    payment = _entity(event, 'payment')
+    payment_id = payment.get('id')
+    if order.razorpay_payment_id and order.razorpay_payment_id != payment_id:
+        logger.error(f"[FRAUD_ALERT] Webhook capture {payment_id} for order {order.id} already paid by {order.razorpay_payment_id}")
+        return 'failed', f"Order already paid by {order.razorpay_payment_id}", [], []
+
+    expected_amount = int(order.total_amount * 100)
+    if payment.get('amount') != expected_amount:
+        logger.error(f"[PAYMENT_SECURITY] Webhook amount mismatch for order {order.id} - Expected: {expected_amount}, Got: {payment.get('amount')}")
+        if order.payment_status == 'success':
+            return 'failed', 'Amount mismatch on a confirmed order', [], []
+        return 'failed', 'Amount mismatch', [apply_failed(order, "Payment amount mismatch - FRAUD ALERT")], []
+
+    if order.payment_status == 'success':
+        # Already confirmed by the checkout callback
+        return 'processed', '', [], []
+    if order.status == 'cancelled':
+        history = apply_captured_for_cancelled(order, payment_id, source='webhook')
+        return 'failed', 'Payment captured for a cancelled order', [history], []
+
+    history = apply_captured(order, payment_id, source='webhook')
+    orders[payment_id] = order
+    return 'processed', '', [history], list(CONFIRMATION_EVENTS)
+
+
+def _payment_failed(event, order, orders):
+    if order.payment_status in ('success', 'failed', 'refunded'):
+        return 'ignored', '', [], []
+    reason = _entity(event, 'payment').get('error_description') or 'Payment failed'
+    return 'processed', '', [apply_failed(order, f"{reason} (webhook)")], []
+
+
+def _refund_processed(event, order, orders):
+    refund = _entity(event, 'refund')
+    if order.refund_id == refund.get('id') and order.refund_status == 'processed':
+        return 'processed', '', [], []
+    RefundRequest.objects.filter(razorpay_refund_id=refund.get('id')).update(
+        status='processed', gateway_status='processed', updated_at=timezone.now()
+    )
+    # Refunds from the refund queue announce themselves when they are submitted
+    announce = not order.refund_id and not order.refund_requests.exists()
+    order.refund_id = refund.get('id')
+    order.refund_status = 'processed'
+    order.refund_amount = Decimal(refund.get('amount') or 0) / 100
+    order.payment_status = 'refunded'
+    order.refunded_at = order.refunded_at or timezone.now()
+    order.save()
+    history = [OrderStatusHistory(
+        order=order, status='refunded', updated_by=order.user,
+        notes=f"Refund processed: {order.refund_id} (webhook)",
+    )]
+    return 'processed', '', history, ['refund_processed'] if announce else []
+
+
+HANDLERS = {
+    'payment.captured': _payment_captured,
+    'payment.failed': _payment_failed,
+    'refund.processed': _refund_processed,
+}
+
+
+def process_pending_events(batch_size=None):
+    """Apply one batch of pending webhook events; returns the number of events handled"""
+    batch_size = batch_size or getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'PAYMENT_WEBHOOK_MAX_ATTEMPTS', 5)
+
+    with transaction.atomic():
+        events = list(
+            PaymentWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+            .order_by('received_at')[:batch_size]
+        )
+        if not events:
+            return 0
+        orders = _load_orders(events)
+        history, notifications = [], []
+        now = timezone.now()
+
+        for event in events:
+            event.attempts += 1
+            handler = HANDLERS.get(event.event_type)
+            if handler is None:
+                event.status = 'ignored'
+                event.processed_at = now
+                continue
+            order = None
+            try:
+                order = _find_order(event, orders)
+                with transaction.atomic():
+                    event.status, event.error, rows, events_to_send = handler(event, order, orders)
+            except _Retry as exc:
+                event.error = str(exc)
+                if event.attempts >= max_attempts:
+                    event.status = 'failed'
+                    logger.error(f"[WEBHOOK] Giving up on {event.event_id}: {exc}")
+                else:
+                    event.next_attempt_at = _retry_at(event, now)
+                continue
+            except Exception as exc:
+                logger.exception(f"[WEBHOOK] Failed to apply {event.event_type} {event.event_id}")
+                event.error = str(exc)
+                if event.attempts >= max_attempts:
+                    event.status = 'failed'
+                else:
+                    event.next_attempt_at = _retry_at(event, now)
+                if order is not None:
+                    # The savepoint rolled back; drop the half-applied in-memory changes
+                    order.refresh_from_db()
+                continue
+            if event.status != 'pending':
+                event.processed_at = now
+            history.extend(rows)
+            notifications.extend((order.id, name) for name in events_to_send)
+
+        OrderStatusHistory.objects.bulk_create(history)
+        PaymentWebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'error', 'processed_at', 'next_attempt_at'])
+        if notifications:
+            transaction.on_commit(lambda: send_notifications(notifications))
+
+    applied = sum(1 for event in events if event.status == 'processed')
+    logger.info(f"[WEBHOOK] Handled {len(events)} event(s), {applied} applied")
+    return len(events)
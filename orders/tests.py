@@ -1,3 +1,929 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import hmac
+import json
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.template.loader import get_template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Notification, ShoppingCart, ShoppingCartItem
+from products.models import Product
+from .fake_gateway import FakeGateway
+from .fake_sms import FakeSmsProvider
+from .models import (
+    NotificationLog,
+    Order,
+    OrderAddress,
+    OrderStatusHistory,
+    PaymentWebhookEvent,
+    RefundRequest,
+    StockReservation,
+)
+from .services import broker, reconciliation
+from .services.notification_archive import archive_notifications
+from .services.notifications import _compiled_template, deliver_pending, notify, queue_order_notifications, send_now
+from .services.inventory import (
+    InsufficientStock,
+    commit_reservations,
+    release_expired_holds,
+    reserve_stock,
+)
+from .services.payments import CONFIRMATION_EVENTS, apply_captured, apply_failed
+from .services.payment_gateway import (
+    CircuitBreaker,
+    GatewayServerError,
+    GatewayUnavailable,
+    PaymentGateway,
+    get_gateway,
+)
+from .services.reconciliation import reconcile_pending_payments
+from .services.refunds import execute_refund, reconcile_refunds
+from .services.sms_service import RateLimiter, get_dispatcher
+from .tasks import process_payment_webhooks
+from .services.webhooks import process_pending_events
+
+
+def _make_order(user, address, number):
+    return Order.objects.create(
+        user=user, order_number=f'ORD-TEST-{number}', address=address,
+        subtotal='1000.00', total_amount='1000.00', payment_method='cod',
+    )
+
+
+class StockReservationLoadTests(TransactionTestCase):
+    """Many buyers racing for the same SKU must never oversell it"""
+
+    BUYERS = 200
+    STOCK = 7
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='racer', email='racer@test.com', password='Test123!@#', role='customer'
+        )
+        self.address = OrderAddress.objects.create(
+            user=self.user, full_name='Race Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        self.product = Product.objects.create(
+            name='Last Phone', category='phones', price='1000.00', condition_grade='good',
+            description='Refurbished phone', certification_status='certified', stock_quantity=self.STOCK,
+        )
+        self.orders = [_make_order(self.user, self.address, i) for i in range(self.BUYERS)]
+
+    def _checkout(self, order):
+        try:
+            for _ in range(200):
+                try:
+                    reserve_stock(order, [(self.product.id, 1)])
+                    return True
+                except InsufficientStock:
+                    return False
+                except OperationalError:
+                    # SQLite serialises writers with table locks; Postgres would block instead
+                    time.sleep(0.001)
+            raise AssertionError(f"Order {order.id} never got the write lock")
+        finally:
+            connection.close()
+
+    def test_concurrent_buyers_do_not_oversell(self):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(self._checkout, self.orders))
+
+        self.assertEqual(sum(results), self.STOCK)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+        self.assertEqual(StockReservation.objects.filter(status='held').count(), self.STOCK)
+
+
+class StockReservationLifecycleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='holder', email='holder@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Hold Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        cls.product = Product.objects.create(
+            name='Tablet', category='tablets', price='1000.00', condition_grade='good',
+            description='Refurbished tablet', certification_status='certified', stock_quantity=2,
+        )
+
+    def _stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock_quantity
+
+    def test_all_or_nothing(self):
+        order = _make_order(self.user, self.address, 1)
+        other = Product.objects.create(
+            name='Charger', category='accessories', price='10.00', condition_grade='good',
+            description='Charger', certification_status='certified', stock_quantity=0,
+        )
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(order, [(self.product.id, 1), (other.id, 1)])
+        self.assertEqual(self._stock(), 2)
+        self.assertFalse(StockReservation.objects.filter(order=order).exists())
+
+    def test_expired_hold_returns_stock(self):
+        order = _make_order(self.user, self.address, 2)
+        reserve_stock(order, [(self.product.id, 2)])
+        self.assertEqual(self._stock(), 0)
+
+        self.assertEqual(release_expired_holds(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self._stock(), 2)
+
+        # payment arriving late re-takes the stock while it is still there
+        self.assertTrue(commit_reservations(order))
+        self.assertEqual(self._stock(), 0)
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+
+    def test_capture_after_failed_payment_retakes_stock(self):
+        self.product.stock_quantity = 1
+        self.product.save()
+        order = _make_order(self.user, self.address, 4)
+        reserve_stock(order, [(self.product.id, 1)])
+        with transaction.atomic():
+            apply_failed(order, 'Payment failed')
+        self.assertEqual(self._stock(), 1)
+
+        # payment.captured lands after payment.failed
+        with transaction.atomic():
+            apply_captured(order, 'pay_late')
+        self.assertEqual(self._stock(), 0)
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+
+        # the unit is sold once: the next buyer is turned away
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(_make_order(self.user, self.address, 5), [(self.product.id, 1)])
+
+        # with the stock gone, a second failed-then-captured order is flagged instead
+        order = _make_order(self.user, self.address, 6)
+        StockReservation.objects.create(order=order, product=self.product, quantity=1, status='released')
+        self.assertFalse(commit_reservations(order))
+
+    def test_cancel_order_releases_stock(self):
+        order = _make_order(self.user, self.address, 3)
+        order.status = 'confirmed'
+        order.save()
+        reserve_stock(order, [(self.product.id, 1)], hold=False)
+        self.assertEqual(self._stock(), 1)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('orders:cancel_order', args=[order.id]))
+
+        self.assertEqual(self._stock(), 2)
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+
+
+class OrderBuilderTests(TestCase):
+    """Placing an order costs the same number of statements for any cart size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='builder', email='builder@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Bulk Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        cls.products = [
+            Product.objects.create(
+                name=f'Laptop {i}', category='laptops', price='500.00', condition_grade='good',
+                description='Refurbished laptop', certification_status='certified', stock_quantity=5,
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _place_order(self, lines):
+        cart, _ = ShoppingCart.objects.get_or_create(user=self.user)
+        ShoppingCartItem.objects.bulk_create(
+            ShoppingCartItem(cart=cart, product=product, quantity=1, price=product.price)
+            for product in self.products[:lines]
+        )
+        session = self.client.session
+        session['checkout_address_id'] = self.address.id
+        session['checkout_payment_method'] = 'cod'
+        session.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders:checkout_step3_review'))
+        order = Order.objects.latest('id')
+        self.assertRedirects(response, reverse('orders:order_confirmation', args=[order.id]), fetch_redirect_response=False)
+        return order, len(queries)
+
+    def test_statement_count_is_constant(self):
+        small_order, small = self._place_order(2)
+        large_order, large = self._place_order(12)
+        self.assertEqual(small, large)
+        self.assertEqual(large_order.items.count(), 12)
+
+    def test_cod_order_is_created_confirmed(self):
+        order, _ = self._place_order(3)
+        self.assertEqual((order.status, order.payment_status), ('confirmed', 'cod_pending'))
+        self.assertEqual(
+            list(OrderStatusHistory.objects.filter(order=order).order_by('id').values_list('status', flat=True)),
+            ['pending_payment', 'confirmed'],
+        )
+        self.assertEqual(set(StockReservation.objects.filter(order=order).values_list('status', flat=True)), {'committed'})
+
+
+class PaymentGatewayTests(SimpleTestCase):
+    """The shared gateway adapter pools connections, retries reads and fails fast"""
+
+    def setUp(self):
+        self.fake = FakeGateway().start()
+        self.addCleanup(self.fake.stop)
+        self.gateway = PaymentGateway(
+            'rzp_test_key', 'secret', base_url=self.fake.base_url, max_retries=2,
+            breaker=CircuitBreaker(threshold=3, cooldown=0.2),
+        )
+        self.order = self.gateway.create_order({'amount': 5000, 'currency': 'INR', 'receipt': 'r-1'})
+        self.payment_id = self.fake.add_payment(self.order['id'])
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.assertEqual(self.gateway.fetch_payment(self.payment_id)['amount'], 5000)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_reads_are_retried_but_writes_are_not(self):
+        self.fake.fail_next = 1
+        self.assertEqual(self.gateway.fetch_payment(self.payment_id)['status'], 'captured')
+
+        self.fake.fail_next = 1
+        with self.assertRaises(GatewayServerError):
+            self.gateway.create_order({'amount': 100})
+        self.assertEqual(len(self.fake.orders), 1)
+
+    def test_breaker_fails_fast_then_recovers(self):
+        self.fake.fail_next = 3
+        with self.assertRaises(GatewayServerError):
+            self.gateway.fetch_payment(self.payment_id)
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+        requests_before = self.fake.requests
+        with self.assertRaises(GatewayUnavailable):
+            self.gateway.fetch_payment(self.payment_id)
+        self.assertEqual(self.fake.requests, requests_before)
+
+        time.sleep(0.25)
+        self.assertEqual(self.gateway.breaker.state, 'half-open')
+        self.gateway.fetch_payment(self.payment_id)
+        self.assertEqual(self.gateway.breaker.state, 'closed')
+
+    def test_html_error_pages_count_as_failures(self):
+        # A proxy in front of the gateway answering with HTML
+        self.fake.fail_html = '<html><body>502 Bad Gateway</body></html>'
+        self.fake.fail_status, self.fake.fail_next = 502, 1
+        self.assertEqual(self.gateway.fetch_payment(self.payment_id)['status'], 'captured')
+
+        self.fake.fail_status, self.fake.fail_next = 502, 3
+        with self.assertRaises(GatewayServerError):
+            self.gateway.fetch_payment(self.payment_id)
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+        time.sleep(0.25)
+        # An unparseable 200 is a failure too, not a healthy answer
+        self.fake.fail_status, self.fake.fail_next = 200, 1
+        with self.assertRaises(json.JSONDecodeError):
+            self.gateway.create_order({'amount': 100})
+        self.assertEqual(self.gateway.breaker.state, 'open')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec_test')
+@mock.patch('orders.views.process_payment_webhooks')
+class PaymentWebhookTests(TestCase):
+    """Webhooks are stored and acknowledged at once, then applied in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='hooked', email='hooked@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Hook Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        cls.product = Product.objects.create(
+            name='Watch', category='wearables', price='1000.00', condition_grade='good',
+            description='Refurbished watch', certification_status='certified', stock_quantity=5,
+        )
+
+    def _order(self, number):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-HOOK-{number}', address=self.address,
+            subtotal='1000.00', total_amount='1000.00', payment_method='online',
+            razorpay_order_id=f'order_hook{number:08d}',
+        )
+        reserve_stock(order, [(self.product.id, 1)])
+        return order
+
+    def _post(self, event_id, event, payment=None, refund=None, secret='whsec_test'):
+        payload = {}
+        if payment:
+            payload['payment'] = {'entity': payment}
+        if refund:
+            payload['refund'] = {'entity': refund}
+        body = json.dumps({'entity': 'event', 'event': event, 'payload': payload}).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('orders:razorpay_webhook'), body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def _captured(self, order, payment_id, amount=100000):
+        return {'id': payment_id, 'order_id': order.razorpay_order_id, 'amount': amount, 'status': 'captured'}
+
+    def test_bad_signature_is_rejected(self, task):
+        order = self._order(1)
+        response = self._post('evt_1', 'payment.captured', self._captured(order, 'pay_bad'), secret='wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+        task.delay.assert_not_called()
+
+    def test_redelivery_is_stored_once(self, task):
+        order = self._order(2)
+        for _ in range(3):
+            response = self._post('evt_2', 'payment.captured', self._captured(order, 'pay_twice'))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+        self.assertEqual(task.delay.call_count, 3)
+
+    def test_batch_confirms_and_fails_orders(self, task):
+        paid, declined = self._order(3), self._order(4)
+        self._post('evt_3', 'payment.captured', self._captured(paid, 'pay_ok'))
+        self._post('evt_4', 'payment.failed', {'id': 'pay_no', 'order_id': declined.razorpay_order_id, 'amount': 100000})
+        self._post('evt_5', 'order.paid', {'id': 'pay_ok', 'order_id': paid.razorpay_order_id})
+
+        with mock.patch('orders.services.notifications.notify') as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_pending_events(), 3)
+
+        paid.refresh_from_db()
+        declined.refresh_from_db()
+        self.assertEqual((paid.status, paid.payment_status, paid.razorpay_payment_id), ('confirmed', 'success', 'pay_ok'))
+        self.assertEqual(declined.payment_status, 'failed')
+        self.assertEqual(StockReservation.objects.get(order=paid).status, 'committed')
+        self.assertEqual(StockReservation.objects.get(order=declined).status, 'released')
+        self.assertEqual(
+            dict(PaymentWebhookEvent.objects.values_list('event_id', 'status')),
+            {'evt_3': 'processed', 'evt_4': 'processed', 'evt_5': 'ignored'},
+        )
+        notify.assert_called_once_with([(paid.id, event) for event in CONFIRMATION_EVENTS])
+        self.assertEqual(process_pending_events(), 0)
+
+    def test_amount_mismatch_is_not_confirmed(self, task):
+        order = self._order(6)
+        self._post('evt_6', 'payment.captured', self._captured(order, 'pay_short', amount=100))
+        process_pending_events()
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'failed')
+        self.assertIsNone(order.razorpay_payment_id)
+        self.assertEqual(PaymentWebhookEvent.objects.get().status, 'failed')
+
+    def test_refund_processed(self, task):
+        order = self._order(7)
+        Order.objects.filter(pk=order.pk).update(razorpay_payment_id='pay_refund', payment_status='success')
+        self._post('evt_7', 'refund.processed', {'id': 'pay_refund', 'order_id': order.razorpay_order_id},
+                   refund={'id': 'rfnd_1', 'payment_id': 'pay_refund', 'amount': 50000})
+        with mock.patch('orders.services.notifications.notify'):
+            process_pending_events()
+        order.refresh_from_db()
+        self.assertEqual((order.refund_id, order.refund_status, order.payment_status), ('rfnd_1', 'processed', 'refunded'))
+        self.assertEqual(str(order.refund_amount), '500.00')
+
+    @mock.patch('orders.views.get_razorpay_client')
+    def test_callback_leaves_confirmation_to_the_webhook(self, get_client, task):
+        order = self._order(9)
+        signature = hmac.new(b'test_secret', f'{order.razorpay_order_id}|pay_callback01'.encode(), hashlib.sha256).hexdigest()
+        with self.settings(RAZORPAY_KEY_SECRET='test_secret'):
+            response = self.client.post(reverse('orders:payment_callback'), {
+                'razorpay_payment_id': 'pay_callback01',
+                'razorpay_order_id': order.razorpay_order_id,
+                'razorpay_signature': signature,
+            })
+        self.assertEqual(response.json()['status'], 'success')
+        get_client.assert_not_called()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('pending_payment', 'pending'))
+
+        # A short payment is caught by the webhook instead of being confirmed by the callback
+        self._post('evt_9', 'payment.captured', self._captured(order, 'pay_callback01', amount=100))
+        process_pending_events()
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'failed')
+        self.assertIsNone(order.razorpay_payment_id)
+
+    def test_callback_with_bad_signature_leaves_order_alone(self, task):
+        order = self._order(10)
+        with self.settings(RAZORPAY_KEY_SECRET='test_secret'):
+            response = self.client.post(reverse('orders:payment_callback'), {
+                'razorpay_payment_id': 'pay_forged0001',
+                'razorpay_order_id': order.razorpay_order_id,
+                'razorpay_signature': 'forged',
+            })
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('pending_payment', 'pending'))
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'held')
+
+    def test_unknown_order_is_retried_then_failed(self, task):
+        self._post('evt_8', 'payment.failed', {'id': 'pay_lost', 'order_id': 'order_missing0001'})
+        with self.settings(PAYMENT_WEBHOOK_MAX_ATTEMPTS=2):
+            # One task run makes one attempt; the retry waits for its backoff
+            self.assertEqual(process_payment_webhooks(), 1)
+            event = PaymentWebhookEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), ('pending', 1))
+            self.assertGreater(event.next_attempt_at, timezone.now())
+
+            PaymentWebhookEvent.objects.update(next_attempt_at=timezone.now())
+            process_pending_events()
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('failed', 2))
+
+    def test_webhook_ahead_of_its_order_is_applied_on_retry(self, task):
+        self._post('evt_10', 'payment.captured', {
+            'id': 'pay_early', 'order_id': 'order_hook00000010', 'amount': 100000, 'status': 'captured',
+        })
+        process_pending_events()
+        self.assertEqual(PaymentWebhookEvent.objects.get().status, 'pending')
+
+        order = self._order(10)
+        PaymentWebhookEvent.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('orders.services.notifications.notify'):
+            process_pending_events()
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'success')
+        self.assertEqual(PaymentWebhookEvent.objects.get().status, 'processed')
+
+
+class RefundQueueTests(TestCase):
+    """Cancellation only records a refund; a worker sends it and reconciliation finishes it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='refunded', email='refunded@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Refund Buyer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+
+    def setUp(self):
+        self.fake = FakeGateway().start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(RAZORPAY_BASE_URL=self.fake.base_url, RAZORPAY_MAX_RETRIES=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        razorpay_order = self.fake.create_order({'amount': 150000})[1]
+        self.order = Order.objects.create(
+            user=self.user, order_number='ORD-REFUND-1', address=self.address,
+            subtotal='1500.00', total_amount='1500.00', payment_method='online',
+            payment_status='success', status='confirmed', razorpay_order_id=razorpay_order['id'],
+            razorpay_payment_id=self.fake.add_payment(razorpay_order['id']),
+        )
+
+    def _cancel(self):
+        self.client.force_login(self.user)
+        with mock.patch('orders.tasks.execute_refund') as task, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('orders:cancel_order', args=[self.order.id]))
+        return task
+
+    def test_cancel_records_refund_without_calling_gateway(self):
+        task = self._cancel()
+        self.order.refresh_from_db()
+        refund = RefundRequest.objects.get(order=self.order)
+        self.assertEqual((self.order.status, self.order.refund_status), ('cancelled', 'pending'))
+        self.assertEqual((refund.status, refund.amount), ('pending', self.order.total_amount))
+        self.assertEqual(self.fake.requests, 0)
+        task.delay.assert_called_once_with(refund.pk)
+
+    @mock.patch('orders.services.notifications.notify')
+    def test_gateway_error_is_retried_with_same_key(self, notify):
+        self._cancel()
+        refund = RefundRequest.objects.get(order=self.order)
+
+        self.fake.fail_next = 1
+        self.assertIsNotNone(execute_refund(refund.pk))
+        refund.refresh_from_db()
+        self.assertEqual((refund.status, refund.attempts), ('pending', 1))
+        # Not due yet
+        self.assertIsNone(execute_refund(refund.pk))
+
+        RefundRequest.objects.filter(pk=refund.pk).update(next_attempt_at=timezone.now())
+        self.assertIsNone(execute_refund(refund.pk))
+        refund.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(refund.status, 'processed')
+        self.assertEqual((self.order.refund_id, self.order.payment_status), (refund.razorpay_refund_id, 'refunded'))
+        self.assertEqual(len(self.fake.refunds), 1)
+
+        # A replayed request with the same key returns the original refund
+        gateway_refund = get_gateway().refund(self.order.razorpay_payment_id, {'amount': 150000}, idempotency_key=refund.idempotency_key)
+        self.assertEqual(gateway_refund['id'], refund.razorpay_refund_id)
+        self.assertEqual(len(self.fake.refunds), 1)
+
+    @mock.patch('orders.services.notifications.notify')
+    def test_reconcile_updates_refunds_in_progress(self, notify):
+        self._cancel()
+        refund = RefundRequest.objects.get(order=self.order)
+        self.fake.refund_status = 'pending'
+        execute_refund(refund.pk)
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, 'submitted')
+
+        self.assertEqual(reconcile_refunds(), 0)
+        self.fake.refunds[refund.razorpay_refund_id]['status'] = 'processed'
+        requests_before = self.fake.requests
+        self.assertEqual(reconcile_refunds(), 1)
+        self.assertEqual(self.fake.requests - requests_before, 1)
+
+        refund.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(refund.status, 'processed')
+        self.assertEqual(self.order.refund_status, 'processed')
+        self.assertIsNotNone(self.order.refunded_at)
+
+
+class PaymentReconciliationTests(TestCase):
+    """Stale pending payments are settled against the gateway page by page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='tabcloser', email='tabcloser@test.com', password='Test123!@#', role='customer'
+        )
+        cls.address = OrderAddress.objects.create(
+            user=cls.user, full_name='Tab Closer', phone='9999999999',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        cls.product = Product.objects.create(
+            name='Camera', category='cameras', price='1000.00', condition_grade='good',
+            description='Refurbished camera', certification_status='certified', stock_quantity=10,
+        )
+
+    def setUp(self):
+        self.fake = FakeGateway().start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(RAZORPAY_BASE_URL=self.fake.base_url, RAZORPAY_MAX_RETRIES=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _order(self, name, minutes_old=60):
+        razorpay_order = self.fake.create_order({'amount': 100000})[1]
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-RECON-{name}', address=self.address,
+            subtotal='1000.00', total_amount='1000.00', payment_method='online',
+            razorpay_order_id=razorpay_order['id'],
+        )
+        reserve_stock(order, [(self.product.id, 1)])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_old))
+        return order
+
+    @mock.patch('orders.services.notifications.notify')
+    def test_orders_are_confirmed_failed_or_left_pending(self, notify):
+        paid = self._order('paid')
+        paid_payment = self.fake.add_payment(paid.razorpay_order_id)
+        underpaid = self._order('underpaid')
+        self.fake.add_payment(underpaid.razorpay_order_id, amount=100)
+        declined = self._order('declined')
+        self.fake.add_payment(declined.razorpay_order_id, status='failed')
+        abandoned = self._order('abandoned')
+        authorized = self._order('authorized')
+        self.fake.add_payment(authorized.razorpay_order_id, status='authorized')
+        recent = self._order('recent', minutes_old=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = reconcile_pending_payments(older_than_minutes=30, batch_size=2, concurrency=4)
+
+        self.assertEqual(
+            {key: stats[key] for key in ('scanned', 'confirmed', 'failed', 'unchanged', 'errors')},
+            {'scanned': 5, 'confirmed': 1, 'failed': 3, 'unchanged': 1, 'errors': 0},
+        )
+        self.assertGreaterEqual(stats['max_lag_seconds'], 3600)
+        states = dict(Order.objects.values_list('order_number', 'payment_status'))
+        self.assertEqual(states, {
+            'ORD-RECON-paid': 'success', 'ORD-RECON-underpaid': 'failed', 'ORD-RECON-declined': 'failed',
+            'ORD-RECON-abandoned': 'failed', 'ORD-RECON-authorized': 'pending', 'ORD-RECON-recent': 'pending',
+        })
+        paid.refresh_from_db()
+        self.assertEqual((paid.status, paid.razorpay_payment_id), ('confirmed', paid_payment))
+        self.assertEqual(StockReservation.objects.get(order=paid).status, 'committed')
+        self.assertEqual(StockReservation.objects.get(order=abandoned).status, 'released')
+        notify.assert_called_once_with([(paid.id, event) for event in CONFIRMATION_EVENTS])
+
+    def test_cancelled_orders_are_never_confirmed(self):
+        decide = reconciliation._decide
+
+        def cancel_then_decide(payments, total_amount):
+            # The customer cancels while the page is being checked
+            Order.objects.filter(pk=raced.pk).update(status='cancelled')
+            return decide(payments, total_amount)
+
+        # The test transaction never commits: capture every admin notification queued from here on
+        with self.captureOnCommitCallbacks(execute=True):
+            skipped = self._order('skipped')
+            self.fake.add_payment(skipped.razorpay_order_id)
+            Order.objects.filter(pk=skipped.pk).update(status='cancelled')
+            raced = self._order('raced')
+            payment_id = self.fake.add_payment(raced.razorpay_order_id)
+            with mock.patch.object(reconciliation, '_decide', cancel_then_decide):
+                stats = reconcile_pending_payments()
+
+        self.assertEqual((stats['scanned'], stats['confirmed'], stats['failed']), (1, 0, 1))
+        skipped.refresh_from_db()
+        raced.refresh_from_db()
+        self.assertEqual(skipped.payment_status, 'pending')
+        self.assertEqual((raced.status, raced.payment_status), ('cancelled', 'failed'))
+        self.assertIsNone(raced.razorpay_payment_id)
+        self.assertTrue(Notification.objects.filter(
+            title='Refund Needed', related_order=raced, message__contains=payment_id,
+        ).exists())
+
+    def test_dry_run_changes_nothing(self):
+        order = self._order('dry')
+        self.fake.add_payment(order.razorpay_order_id)
+        stats = reconcile_pending_payments(dry_run=True)
+        self.assertEqual(stats['confirmed'], 1)
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'pending')
+
+
+class SmsDispatcherTests(TestCase):
+    """SMS go out in pooled provider batches and skip a provider that is down"""
+
+    def setUp(self):
+        self.fake = FakeSmsProvider().start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(
+            MSG91_API_KEY='msg91-key', FAST2SMS_API_KEY='fast2sms-key', SMS_PROVIDER='msg91',
+            MSG91_BASE_URL=self.fake.base_url, FAST2SMS_BASE_URL=self.fake.base_url,
+            SMS_BATCH_SIZE=100, SMS_RATE_LIMIT_PER_SECOND=100000, SMS_PROVIDER_FAILURE_THRESHOLD=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_messages_are_batched_over_one_connection(self):
+        messages = [(f'+91 90000{i:05d}', f'Order {i % 3} confirmed') for i in range(250)]
+        results = get_dispatcher().send_many(messages)
+        self.assertTrue(all(result['status'] == 'success' for result in results))
+        self.assertEqual(len(self.fake.delivered), 250)
+        self.assertEqual(self.fake.provider_requests['msg91'], 3)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_failing_provider_is_skipped(self):
+        self.fake.down.add('msg91')
+        dispatcher = get_dispatcher()
+        for attempt in range(3):
+            result = dispatcher.send_many([('+919000000001', f'Attempt {attempt}')])[0]
+            self.assertEqual(result['provider'], 'fast2sms')
+        # After two failures MSG91 is no longer tried first
+        self.assertEqual(self.fake.provider_requests['msg91'], 2)
+        self.assertEqual(self.fake.provider_requests['fast2sms'], 3)
+
+    def test_non_json_reply_falls_back_to_next_provider(self):
+        # A captive proxy answering 200 with an HTML page
+        self.fake.fail_next, self.fake.fail_status, self.fake.fail_html = 1, 200, '<html>Gateway</html>'
+        result = get_dispatcher().send_many([('+919000000003', 'Order shipped')])[0]
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['provider'], 'fast2sms')
+
+    def test_unparseable_replies_trip_the_breaker(self):
+        self.fake.fail_next, self.fake.fail_status, self.fake.fail_html = 2, 200, '[1]'
+        dispatcher = get_dispatcher()
+        for attempt in range(2):
+            result = dispatcher.send_many([('+919000000004', f'Attempt {attempt}')], only='fast2sms')[0]
+            self.assertEqual(result['status'], 'failed')
+            self.assertIn('unexpected response', result['message'])
+        result = dispatcher.send_many([('+919000000004', 'Attempt 2')], only='fast2sms')[0]
+        self.assertEqual(result['message'], 'fast2sms is unavailable')
+        self.assertEqual(self.fake.provider_requests['fast2sms'], 0)
+
+    def test_rate_limiter_throttles(self):
+        limiter = RateLimiter(rate=100, burst=5)
+        started = time.monotonic()
+        for _ in range(15):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_order_sms_are_logged_in_bulk(self):
+        user = get_user_model().objects.create_user(
+            username='texted', email='texted@test.com', password='Test123!@#', role='customer'
+        )
+        address = OrderAddress.objects.create(
+            user=user, full_name='Text Buyer', phone='+91 9000000002',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+        orders = [_make_order(user, address, f'SMS-{i}') for i in range(3)]
+        items = [(order.id, event) for order in orders for event in ('payment_successful', 'order_confirmed')]
+
+        # Recipient lookup, orders with items, then one insert of the logs with their outcome
+        with self.assertNumQueries(4):
+            self.assertEqual(send_now(items, channels=('sms',)), 6)
+        self.assertEqual(self.fake.provider_requests['msg91'], 1)
+        # One combined SMS per order
+        self.assertEqual(len(self.fake.delivered), 3)
+        self.assertEqual(NotificationLog.objects.filter(notification_type='sms', status='sent').count(), 6)
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+class NotificationDeliveryTests(TestCase):
+    """Queued customer emails go out in batches over one SMTP connection"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='mailed', email='mailed@test.com', password='Test123!@#', role='customer'
+        )
+        self.address = OrderAddress.objects.create(
+            user=self.user, full_name='Mail Buyer', phone='',
+            address='1 Test Street', city='Pune', postal_code='411001',
+        )
+
+    def test_batch_shares_one_connection_and_compiled_templates(self):
+        orders = [_make_order(self.user, self.address, f'MAIL-{i}') for i in range(5)]
+        ids = queue_order_notifications([
+            (order.id, event) for order in orders for event in ('payment_successful', 'order_confirmed')
+        ])
+        self.assertEqual(len(ids), 10)
+
+        with mock.patch('orders.services.notifications.get_connection', wraps=get_connection) as connect, \
+                mock.patch('orders.services.notifications.get_template', wraps=get_template) as compile_template:
+            _compiled_template.cache_clear()
+            self.assertEqual(deliver_pending(), (10, 10))
+        self.assertEqual(connect.call_count, 1)
+        # Both events of an order share one combined email
+        self.assertEqual(compile_template.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, 'Payment Successful, Order Confirmed - ORD-TEST-MAIL-0')
+        self.assertEqual(NotificationLog.objects.filter(status='sent').count(), 10)
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failed_message_is_retried_then_dead_lettered(self):
+        orders = [_make_order(self.user, self.address, f'FAIL-{i}') for i in range(3)]
+        queue_order_notifications([(order.id, 'order_shipped') for order in orders])
+        locmem = mail.get_connection()
+        sent = []
+
+        def send_messages(messages):
+            if messages[0].subject.endswith('FAIL-1'):
+                raise OSError('Mailbox unavailable')
+            sent.extend(messages)
+            return len(messages)
+
+        with mock.patch.object(locmem, 'send_messages', side_effect=send_messages), \
+                mock.patch('orders.services.notifications.get_connection', return_value=locmem):
+            self.assertEqual(deliver_pending(), (3, 2))
+            self.assertEqual(len(sent), 2)
+            retrying = NotificationLog.objects.get(status='pending')
+            self.assertEqual((retrying.order.order_number, retrying.retry_count), ('ORD-TEST-FAIL-1', 1))
+            self.assertGreater(retrying.next_attempt_at, timezone.now())
+            # Backing off
+            self.assertEqual(deliver_pending(), (0, 0))
+
+            NotificationLog.objects.filter(pk=retrying.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(deliver_pending(), (1, 0))
+        dead = NotificationLog.objects.get(status='failed')
+        self.assertEqual((dead.retry_count, dead.next_attempt_at, dead.error_message), (2, None, 'Mailbox unavailable'))
+
+        with mock.patch('orders.services.notifications.wake_worker') as wake:
+            call_command('replay_notifications', '--order', 'ORD-TEST-FAIL-1', stdout=StringIO())
+        wake.assert_called_once_with('bulk')
+        # The replay goes to the bulk queue, which the transactional worker leaves alone
+        self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(deliver_pending(queue='bulk'), (1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_bulk_rows_do_not_hold_up_transactional_ones(self):
+        backlog = [_make_order(self.user, self.address, f'BULK-{i}') for i in range(5)]
+        queue_order_notifications([(order.id, 'order_delivered') for order in backlog], queue='bulk')
+        receipt = _make_order(self.user, self.address, 'RECEIPT')
+        queue_order_notifications([(receipt.id, 'order_confirmed')])
+
+        self.assertEqual(deliver_pending(batch_size=2), (1, 1))
+        self.assertEqual(mail.outbox[0].subject, 'Order Confirmed - ORD-TEST-RECEIPT')
+        self.assertEqual(deliver_pending(batch_size=2, queue='bulk'), (2, 2))
+        self.assertEqual(NotificationLog.objects.filter(queue='bulk', status='pending').count(), 3)
+
+        # The command drains the bulk queue too once the transactional one is empty
+        out = StringIO()
+        call_command('send_pending_notifications', stdout=out)
+        self.assertIn('Delivered 3 of 3 pending bulk notification(s)', out.getvalue())
+        self.assertFalse(NotificationLog.objects.filter(status='pending').exists())
+
+    def test_claimed_rows_are_leased_while_sending(self):
+        orders = [_make_order(self.user, self.address, f'LEASE-{i}') for i in range(2)]
+        queue_order_notifications([(order.id, 'order_shipped') for order in orders])
+        real_send_messages = mail.get_connection().send_messages
+        seen = []
+
+        def send_messages(messages):
+            # Another worker running meanwhile finds nothing to claim
+            seen.append(deliver_pending())
+            return real_send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            self.assertEqual(deliver_pending(), (2, 2))
+        self.assertEqual(seen, [(0, 0), (0, 0)])
+
+        # A worker that died mid-batch leaves its lease behind; the rows come back once it expires
+        order = _make_order(self.user, self.address, 'LEASE-DEAD')
+        [log_id] = queue_order_notifications([(order.id, 'order_shipped')])
+        with mock.patch('orders.services.notifications.deliver', side_effect=RuntimeError('worker killed')):
+            with self.assertRaises(RuntimeError):
+                deliver_pending()
+        self.assertEqual(deliver_pending(), (0, 0))
+        NotificationLog.objects.filter(pk=log_id).update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_pending(), (1, 1))
+
+    @override_settings(CELERY_BROKER_URL='redis://127.0.0.1:1/0', CELERY_BROKER_HEALTH_TTL=60)
+    def test_broker_down_keeps_notifications_in_the_outbox(self):
+        order = _make_order(self.user, self.address, 'OUTBOX')
+        broker.reset()
+        self.addCleanup(broker.reset)
+
+        with mock.patch('orders.services.broker._check', wraps=broker._check) as check:
+            notify([(order.id, 'order_confirmed')])
+            notify([(order.id, 'order_shipped')])
+        # One connection attempt per TTL, and nothing sent inside the request
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(NotificationLog.objects.filter(status='pending').count(), 2)
+
+        call_command('send_pending_notifications', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(NotificationLog.objects.filter(status='pending').exists())
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=60)
+    def test_events_of_an_order_are_coalesced(self):
+        self.address.phone = '+91 9000000003'
+        self.address.save()
+        order = _make_order(self.user, self.address, 'COMBINED')
+        ids = queue_order_notifications([(order.id, event) for event in reversed(CONFIRMATION_EVENTS)])
+        # Still inside the coalescing window
+        self.assertEqual(deliver_pending(), (0, 0))
+
+        NotificationLog.objects.filter(pk__in=ids).update(created_at=timezone.now() - timedelta(minutes=2))
+        with mock.patch('orders.services.notifications.send_sms_batch',
+                        side_effect=lambda messages: [{'status': 'success'} for _ in messages]) as send_sms:
+            self.assertEqual(deliver_pending(), (6, 6))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Payment Successful, Order Confirmed, Invoice Ready - ORD-TEST-COMBINED')
+        self.assertIn('/invoice/?download=1', mail.outbox[0].alternatives[0][0])
+        [sms] = send_sms.call_args[0][0]
+        self.assertEqual(sms.text, (
+            f'Order ORD-TEST-COMBINED: payment of Rs.{order.total_amount} received; confirmed; '
+            f'invoice at certibuy.com/orders/{order.id}/invoice/. - CERTIBUY'
+        ))
+
+    def test_old_logs_are_archived_by_month_and_deleted(self):
+        order = _make_order(self.user, self.address, 'ARCHIVE')
+        send_now([(order.id, 'order_shipped'), (order.id, 'order_delivered')], channels=('email',))
+        queue_order_notifications([(order.id, 'out_for_delivery')])
+        NotificationLog.objects.update(created_at=timezone.now() - timedelta(days=120))
+        recent = NotificationLog.objects.get(event_type='order_shipped')
+        NotificationLog.objects.filter(pk=recent.pk).update(created_at=timezone.now())
+
+        archive_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, archive_dir)
+        stats = archive_notifications(older_than_days=90, archive_dir=archive_dir, batch_size=1)
+        self.assertEqual((stats['archived'], stats['deleted']), (1, 1))
+
+        # Pending rows and recent rows stay
+        self.assertEqual(
+            set(NotificationLog.objects.values_list('event_type', flat=True)), {'order_shipped', 'out_for_delivery'}
+        )
+        [path] = stats['files']
+        self.assertEqual(path.name, f"notification_log-{(timezone.now() - timedelta(days=120)):%Y-%m}.jsonl.gz")
+        with gzip.open(path, 'rt') as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual([(row['event_type'], row['status']) for row in rows], [('order_delivered', 'sent')])
+
+    def test_zero_days_archives_everything_sent(self):
+        order = _make_order(self.user, self.address, 'ARCHIVE-ALL')
+        send_now([(order.id, 'order_shipped')], channels=('email',))
+        out = StringIO()
+        call_command('archive_notifications', days=0, dry_run=True, stdout=out)
+        self.assertIn('1 notification log(s) would be archived', out.getvalue())
@@ -15,6 +15,7 @@ urlpatterns = [
     # Payment
     path("payment/<int:order_id>/", views.payment_gateway, name="payment_gateway"),
     path("payment/callback/", views.payment_callback, name="payment_callback"),
+    path("payment/webhook/", views.razorpay_webhook, name="razorpay_webhook"),
     
     # Order Management
     path("order/<int:order_id>/cancel/", views.cancel_order, name="cancel_order"),
@@ -14,28 +14,25 @@ import hmac
 import logging
 import uuid
 from datetime import datetime, timedelta
+from decimal import Decimal
 
-from core.utils import Cart
-from .models import Order, OrderItem, OrderAddress, OrderStatusHistory
+from core.utils import Cart, CartLine
+from .models import Order, OrderAddress, OrderStatusHistory
 from products.models import Product
 from accounts.decorators import customer_required
-from .tasks import send_order_notifications
+from .services.inventory import release_reservations
+from .services.order_builder import build_order, discard_order
+from .services.payments import CONFIRMATION_EVENTS, apply_captured, apply_failed, send_notifications
+from .services.payment_gateway import get_gateway
+from .services.refunds import request_refund
+from .services.webhooks import record_event, verify_signature as verify_webhook_signature
+from .tasks import process_payment_webhooks
 
 logger = logging.getLogger(__name__)
 
 def get_razorpay_client():
-    """Lazy load Razorpay client"""
-    try:
-        import razorpay
-        if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
-            logger.error("Razorpay keys are missing. Set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET.")
-            return None
-        return razorpay.Client(
-            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-        )
-    except ImportError:
-        logger.warning("Razorpay SDK not installed")
-        return None
+    """Shared payment gateway adapter (pooled connections, timeouts, circuit breaker)"""
+    return get_gateway()
 
 
 @login_required
@@ -117,13 +114,8 @@ def checkout_step2_payment(request):
         if not product:
             messages.warning(request, 'Product unavailable.')
             return redirect('core:shop')
-        cart_items = [{
-            'product': product,
-            'quantity': 1,
-            'price': float(product.price),
-            'total_price': float(product.price),
-        }]
-        subtotal = float(product.price)
+        cart_items = [CartLine(product=product, quantity=1, price=product.price)]
+        subtotal = product.price
         is_buy_now = True
     else:
         cart_items = cart.get_items()
@@ -156,7 +148,7 @@ def checkout_step2_payment(request):
         months = plan['months']
         interest_rate = plan['interest_rate']
         principal = total_amount
-        interest_amount = principal * interest_rate
+        interest_amount = principal * Decimal(str(interest_rate))
         total_with_interest = principal + interest_amount
         monthly_amount = total_with_interest / months
         plan['monthly_amount'] = round(monthly_amount, 2)
@@ -204,13 +196,8 @@ def checkout_step3_review(request):
         if not product:
             messages.warning(request, 'Product unavailable.')
             return redirect('core:shop')
-        cart_items = [{
-            'product': product,
-            'quantity': 1,
-            'price': float(product.price),
-            'total_price': float(product.price),
-        }]
-        subtotal = float(product.price)
+        cart_items = [CartLine(product=product, quantity=1, price=product.price)]
+        subtotal = product.price
         is_buy_now = True
     else:
         cart_items = cart.get_items()
@@ -227,223 +214,125 @@ def checkout_step3_review(request):
         logger.info(f"Order creation started for user {request.user.id}")
         logger.info(f"Address ID: {address_id}, Payment method: {payment_method}")
         try:
-            with transaction.atomic():
-                order_number = f"ORD-{int(timezone.now().timestamp())}-{secrets.randbelow(10000):04d}"
-                logger.info(f"Creating order: {order_number}, Total: {total_amount}")
-                
-                order = Order.objects.create(
-                    user=request.user,
-                    order_number=order_number,
-                    address=address,
-                    subtotal=subtotal,
-                    delivery_charge=delivery_charge,
-                    total_amount=total_amount,
-                    payment_method=payment_method,
-                    emi_plan=emi_plan,
-                    estimated_delivery=timezone.now().date() + timedelta(days=5),
+            order_number = f"ORD-{int(timezone.now().timestamp())}-{secrets.randbelow(10000):04d}"
+            logger.info(f"Creating order: {order_number}, Total: {total_amount}")
+            
+            # Resolve the gateway before opening the order transaction
+            razorpay_client = None
+            is_fake_payment = False
+            if payment_method in ('online', 'emi'):
+                razorpay_client = get_razorpay_client()
+                is_fake_payment = (
+                    not razorpay_client or
+                    'SAMPLE' in settings.RAZORPAY_KEY_ID or
+                    'REPLACE_ME' in settings.RAZORPAY_KEY_ID or
+                    len(settings.RAZORPAY_KEY_ID) < 20
                 )
-                logger.info(f"Order {order.id} created successfully")
-                
-                for item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item['product'],
-                        quantity=item['quantity'],
-                        price=item['price'],
-                        condition=buy_now_options.get('condition'),
-                        storage=buy_now_options.get('storage'),
-                        color=buy_now_options.get('color'),
-                    )
-                logger.info(f"Order items created for order {order.id}")
-                
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status=order.status,
-                    updated_by=request.user,
-                    notes="Order created"
+            
+            order_kwargs = dict(
+                order_number=order_number,
+                subtotal=subtotal,
+                delivery_charge=delivery_charge,
+                total_amount=total_amount,
+                payment_method=payment_method,
+                emi_plan=emi_plan,
+                item_options=buy_now_options,
+            )
+            
+            if payment_method == 'cod':
+                logger.info(f"Processing COD (Cash on Delivery) for order {order_number}")
+                order = build_order(
+                    request.user, address, cart_items,
+                    status='confirmed',
+                    payment_status='cod_pending',
+                    history=[('confirmed', "COD order confirmed - awaiting delivery")],
+                    hold=False,
+                    **order_kwargs,
+                )
+                logger.info(f"[Order {order.id}] COD order confirmed successfully")
+            
+            elif is_fake_payment:
+                # MOCK PAYMENT MODE - For testing without Razorpay credentials
+                is_emi = payment_method == 'emi'
+                logger.info(f"[Order {order_number}] Using MOCK {'EMI ' if is_emi else ''}payment mode (Razorpay not configured)")
+                prefix = 'fake_emi' if is_emi else 'fake'
+                note = (
+                    f"EMI Payment successful - {emi_plan} plan (MOCK MODE)" if is_emi
+                    else "Payment successful (MOCK MODE - Test payment)"
+                )
+                order = build_order(
+                    request.user, address, cart_items,
+                    status='confirmed',
+                    payment_status='success',
+                    history=[('confirmed', note)],
+                    hold=False,
+                    razorpay_order_id=f"{prefix}_order_{uuid.uuid4().hex[:12]}",
+                    razorpay_payment_id=f"{prefix}_pay_{uuid.uuid4().hex[:12]}",
+                    **order_kwargs,
                 )
                 
-                if payment_method == 'online':
-                    logger.info(f"Processing online payment for order {order.id}, amount: ₹{total_amount}")
-                    
-                    # Check if Razorpay credentials are configured
-                    razorpay_client = get_razorpay_client()
-                    is_fake_payment = (
-                        not razorpay_client or
-                        'SAMPLE' in settings.RAZORPAY_KEY_ID or
-                        'REPLACE_ME' in settings.RAZORPAY_KEY_ID or
-                        len(settings.RAZORPAY_KEY_ID) < 20
-                    )
-                    
-                    if is_fake_payment:
-                        # MOCK PAYMENT MODE - For testing without Razorpay credentials
-                        logger.info(f"[Order {order.id}] Using MOCK payment mode (Razorpay not configured)")
-                        
-                        # Generate fake payment IDs for simulation
-                        fake_order_id = f"fake_order_{uuid.uuid4().hex[:12]}"
-                        fake_payment_id = f"fake_pay_{uuid.uuid4().hex[:12]}"
-                        
-                        # Mark order as paid (simulating successful payment)
-                        order.razorpay_order_id = fake_order_id
-                        order.razorpay_payment_id = fake_payment_id
-                        order.payment_method = 'online'
-                        order.payment_status = 'success'
-                        order.status = 'confirmed'
-                        order.save()
-                        
-                        # Create status history
-                        OrderStatusHistory.objects.create(
-                            order=order,
-                            status='confirmed',
-                            updated_by=request.user,
-                            notes="Payment successful (MOCK MODE - Test payment)"
-                        )
-                        
-                        # Clear checkout session
-                        for key in ['checkout_address_id', 'checkout_payment_method', 'checkout_emi_plan', 'checkout_step', 'buy_now_product_id', 'buy_now_options']:
-                            request.session.pop(key, None)
-                        
-                        # Send notifications (async)
-                        try:
-                            send_order_notifications.delay(order.id, 'payment_successful')
-                            send_order_notifications.delay(order.id, 'order_confirmed')
-                        except Exception as notification_error:
-                            logger.warning(f"Failed to send notifications: {notification_error}")
-                        
-                        messages.success(request, f'✅ Payment successful! Order #{order.order_number} has been confirmed. (Test Mode)')
-                        logger.info(f"[Order {order.id}] MOCK payment completed successfully")
-                        return redirect('orders:order_confirmation', order_id=order.id)
-                    
-                    else:
-                        # REAL RAZORPAY PAYMENT MODE
-                        try:
-                            logger.info(f"[Order {order.id}] Calling Razorpay order.create with amount={int(total_amount * 100)} paise")
-                            razorpay_order = razorpay_client.order.create({
-                                'amount': int(total_amount * 100),
-                                'currency': 'INR',
-                                'receipt': order_number,
-                                'notes': {
-                                    'order_id': str(order.id),
-                                    'user_id': str(request.user.id),
-                                }
-                            })
-                            logger.info(f"[Order {order.id}] Razorpay order created successfully: {razorpay_order['id']}")
-                            
-                            order.razorpay_order_id = razorpay_order['id']
-                            order.payment_status = 'pending'
-                            order.save()
-                            
-                            request.session['current_order_id'] = order.id
-                            logger.info(f"[Order {order.id}] Redirecting to payment gateway")
-                            return redirect('orders:payment_gateway', order_id=order.id)
-                        except Exception as razorpay_error:
-                            logger.exception(f"[Order {order.id}] Razorpay API failed: {str(razorpay_error)}")
-                            # Re-raise to trigger transaction rollback
-                        raise
-                
-                elif payment_method == 'emi':
-                    logger.info(f"Processing EMI for order {order.id}, plan: {emi_plan}")
-                    
-                    # Check if Razorpay credentials are configured
-                    razorpay_client = get_razorpay_client()
-                    is_fake_payment = (
-                        not razorpay_client or
-                        'SAMPLE' in settings.RAZORPAY_KEY_ID or
-                        'REPLACE_ME' in settings.RAZORPAY_KEY_ID or
-                        len(settings.RAZORPAY_KEY_ID) < 20
-                    )
-                    
-                    if is_fake_payment:
-                        # MOCK EMI PAYMENT MODE
-                        logger.info(f"[Order {order.id}] Using MOCK EMI payment mode")
-                        
-                        fake_order_id = f"fake_emi_order_{uuid.uuid4().hex[:12]}"
-                        fake_payment_id = f"fake_emi_pay_{uuid.uuid4().hex[:12]}"
-                        
-                        order.razorpay_order_id = fake_order_id
-                        order.razorpay_payment_id = fake_payment_id
-                        order.payment_method = 'emi'
-                        order.payment_status = 'success'
-                        order.status = 'confirmed'
-                        order.save()
-                        
-                        OrderStatusHistory.objects.create(
-                            order=order,
-                            status='confirmed',
-                            updated_by=request.user,
-                            notes=f"EMI Payment successful - {emi_plan} plan (MOCK MODE)"
-                        )
-                        
-                        # Clear checkout session
-                        for key in ['checkout_address_id', 'checkout_payment_method', 'checkout_emi_plan', 'checkout_step', 'buy_now_product_id', 'buy_now_options']:
-                            request.session.pop(key, None)
-                        
-                        try:
-                            send_order_notifications.delay(order.id, 'payment_successful')
-                            send_order_notifications.delay(order.id, 'order_confirmed')
-                        except Exception as notification_error:
-                            logger.warning(f"Failed to send notifications: {notification_error}")
-                        
-                        messages.success(request, f'✅ EMI Payment successful! Order #{order.order_number} confirmed with {emi_plan} plan. (Test Mode)')
-                        logger.info(f"[Order {order.id}] MOCK EMI payment completed")
-                        return redirect('orders:order_confirmation', order_id=order.id)
-                    
-                    else:
-                        # REAL RAZORPAY EMI PAYMENT
-                        try:
-                            logger.info(f"[Order {order.id}] Calling Razorpay order.create for EMI with amount={int(total_amount * 100)} paise")
-                            razorpay_order = razorpay_client.order.create({
-                                'amount': int(total_amount * 100),
-                                'currency': 'INR',
-                                'receipt': order_number,
-                                'notes': {
-                                    'order_id': str(order.id),
-                                    'user_id': str(request.user.id),
-                                    'payment_type': 'emi',
-                                    'emi_plan': emi_plan,
-                                }
-                            })
-                            logger.info(f"[Order {order.id}] Razorpay EMI order created: {razorpay_order['id']}")
-                            
-                            order.razorpay_order_id = razorpay_order['id']
-                            order.payment_status = 'pending'
-                            order.save()
-                            
-                            request.session['current_order_id'] = order.id
-                            logger.info(f"[Order {order.id}] Redirecting to EMI payment gateway")
-                            return redirect('orders:payment_gateway', order_id=order.id)
-                        except Exception as razorpay_error:
-                            logger.exception(f"[Order {order.id}] EMI Razorpay API failed: {str(razorpay_error)}")
-                            raise  # Transaction rollback
+                # Clear checkout session
+                for key in ['checkout_address_id', 'checkout_payment_method', 'checkout_emi_plan', 'checkout_step', 'buy_now_product_id', 'buy_now_options']:
+                    request.session.pop(key, None)
                 
-                else:  # COD
-                    logger.info(f"Processing COD (Cash on Delivery) for order {order.id}")
-                    order.payment_method = 'cod'
-                    order.payment_status = 'cod_pending'
-                    order.status = 'confirmed'
-                    order.save()
-                    
-                    OrderStatusHistory.objects.create(
-                        order=order,
-                        status='confirmed',
-                        updated_by=request.user,
-                        notes="COD order confirmed - awaiting delivery"
-                    )
-                    logger.info(f"[Order {order.id}] COD order confirmed successfully")
+                # Send notifications (async)
+                try:
+                    send_notifications([(order.id, 'payment_successful'), (order.id, 'order_confirmed')])
+                except Exception as notification_error:
+                    logger.warning(f"Failed to send notifications: {notification_error}")
                 
-                if is_buy_now:
-                    request.session.pop('buy_now_product_id', None)
-                    request.session.pop('buy_now_options', None)
+                if is_emi:
+                    messages.success(request, f'✅ EMI Payment successful! Order #{order.order_number} confirmed with {emi_plan} plan. (Test Mode)')
                 else:
-                    cart.clear()
+                    messages.success(request, f'✅ Payment successful! Order #{order.order_number} has been confirmed. (Test Mode)')
+                logger.info(f"[Order {order.id}] MOCK payment completed successfully")
+                return redirect('orders:order_confirmation', order_id=order.id)
+            
+            else:
+                # REAL RAZORPAY PAYMENT MODE - stock is held until payment_callback confirms it
+                logger.info(f"Processing {payment_method} payment for order {order_number}, amount: ₹{total_amount}")
+                order = build_order(request.user, address, cart_items, **order_kwargs)
                 
-                request.session.pop('checkout_address_id', None)
-                request.session.pop('checkout_payment_method', None)
-                request.session.pop('checkout_emi_plan', None)
-                request.session.pop('checkout_step', None)
+                notes = {
+                    'order_id': str(order.id),
+                    'user_id': str(request.user.id),
+                }
+                if payment_method == 'emi':
+                    notes.update({'payment_type': 'emi', 'emi_plan': emi_plan})
+                try:
+                    logger.info(f"[Order {order.id}] Calling Razorpay order.create with amount={int(total_amount * 100)} paise")
+                    razorpay_order = razorpay_client.create_order({
+                        'amount': int(total_amount * 100),
+                        'currency': 'INR',
+                        'receipt': order_number,
+                        'notes': notes,
+                    })
+                except Exception as razorpay_error:
+                    logger.exception(f"[Order {order.id}] Razorpay API failed: {str(razorpay_error)}")
+                    discard_order(order, 'payment gateway order creation failed')
+                    raise
+                logger.info(f"[Order {order.id}] Razorpay order created successfully: {razorpay_order['id']}")
                 
-                logger.info(f"Order {order.id} workflow completed successfully, redirecting to confirmation")
-                return redirect('orders:order_confirmation', order_id=order.id)
+                # Only the gateway reference changes; no status transition to signal
+                Order.objects.filter(pk=order.pk).update(razorpay_order_id=razorpay_order['id'])
+                
+                request.session['current_order_id'] = order.id
+                logger.info(f"[Order {order.id}] Redirecting to payment gateway")
+                return redirect('orders:payment_gateway', order_id=order.id)
+            
+            if is_buy_now:
+                request.session.pop('buy_now_product_id', None)
+                request.session.pop('buy_now_options', None)
+            else:
+                cart.clear()
+            
+            request.session.pop('checkout_address_id', None)
+            request.session.pop('checkout_payment_method', None)
+            request.session.pop('checkout_emi_plan', None)
+            request.session.pop('checkout_step', None)
+            
+            logger.info(f"Order {order.id} workflow completed successfully, redirecting to confirmation")
+            return redirect('orders:order_confirmation', order_id=order.id)
         
         except Exception as e:
             logger.exception(f"Order creation/processing failed for user {request.user.id}: {str(e)}")
@@ -609,16 +498,7 @@ def payment_callback(request):
         if not hmac.compare_digest(expected_signature, signature):
             logger.error(f"[PAYMENT_SECURITY] Signature verification failed for order {order.id}")
             logger.error(f"[FRAUD_ALERT] Invalid signature. Possible tampering detected.")
-            # Update order status to failed
-            with transaction.atomic():
-                order.payment_status = 'failed'
-                order.save()
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='payment_failed',
-                    updated_by=order.user,
-                    notes="Payment signature verification failed - SECURITY ALERT"
-                )
+            # Anyone can post here: leave the order and its stock holds to the webhook and reconciliation
             return JsonResponse({
                 'status': 'error',
                 'message': 'Payment verification failed. Invalid signature. Contact support.'
@@ -626,6 +506,15 @@ def payment_callback(request):
         
         logger.info(f"[PAYMENT] Signature verified for order {order.id}")
         
+        if settings.RAZORPAY_WEBHOOK_SECRET:
+            # The payment.captured webhook checks the amount and confirms the order off the request path
+            logger.info(f"[PAYMENT] Order {order.id} left pending for the payment.captured webhook")
+            return JsonResponse({
+                'status': 'success',
+                'order_id': order.id,
+                'message': 'Payment received. Your order will be confirmed shortly.'
+            })
+        
         # ============================================
         # STEP 6: AMOUNT VERIFICATION
         # ============================================
@@ -636,7 +525,7 @@ def payment_callback(request):
         try:
             razorpay_client = get_razorpay_client()
             if razorpay_client:
-                payment_details = razorpay_client.payment.fetch(payment_id)
+                payment_details = razorpay_client.fetch_payment(payment_id)
                 actual_amount_paise = payment_details.get('amount', 0)
                 actual_order_id = payment_details.get('order_id', '')
                 actual_status = payment_details.get('status', '')
@@ -648,14 +537,7 @@ def payment_callback(request):
                     logger.error(f"[PAYMENT_SECURITY] Amount mismatch - Expected: {expected_amount_paise}, Got: {actual_amount_paise}")
                     logger.error(f"[FRAUD_ALERT] Possible tampering: Amount mismatch detected")
                     with transaction.atomic():
-                        order.payment_status = 'failed'
-                        order.save()
-                        OrderStatusHistory.objects.create(
-                            order=order,
-                            status='payment_failed',
-                            updated_by=order.user,
-                            notes=f"Payment amount mismatch - FRAUD ALERT"
-                        )
+                        apply_failed(order, f"Payment amount mismatch - FRAUD ALERT").save()
                     return JsonResponse({
                         'status': 'error',
                         'message': 'Payment amount verification failed. Possible fraud.'
@@ -674,14 +556,7 @@ def payment_callback(request):
                 if actual_status not in ['captured', 'authorized']:
                     logger.error(f"[PAYMENT] Payment not captured - Status: {actual_status}")
                     with transaction.atomic():
-                        order.payment_status = 'failed'
-                        order.save()
-                        OrderStatusHistory.objects.create(
-                            order=order,
-                            status='payment_failed',
-                            updated_by=order.user,
-                            notes=f"Payment not captured - Status: {actual_status}"
-                        )
+                        apply_failed(order, f"Payment not captured - Status: {actual_status}").save()
                     return JsonResponse({
                         'status': 'error',
                         'message': 'Payment not completed. Please try again.'
@@ -707,24 +582,8 @@ def payment_callback(request):
                         'message': 'Payment already verified'
                     })
                 
-                # Update order with payment details
-                order.razorpay_payment_id = payment_id
-                order.razorpay_signature = signature
-                order.payment_status = 'success'
-                order.status = 'confirmed'
-                order.save()
-                
-                logger.info(f"[PAYMENT] Order {order.id} marked as payment_successful")
-                
-                # Create status history
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    status='confirmed',
-                    updated_by=order.user,
-                    notes=f"Payment captured: {payment_id}"
-                )
-                
-                logger.info(f"[PAYMENT] Payment confirmed for order {order.id}")
+                # Same transition as the webhook worker and the reconciliation job
+                apply_captured(order, payment_id, signature).save()
         except Exception as db_error:
             logger.exception(f"[PAYMENT] Database error during payment confirmation: {str(db_error)}")
             return JsonResponse({
@@ -736,20 +595,9 @@ def payment_callback(request):
         # STEP 8: SEND NOTIFICATIONS (ASYNC)
         # ============================================
         try:
-            from .tasks import send_order_notifications
-            try:
-                # Queue notifications asynchronously
-                send_order_notifications.delay(order.id, 'payment_successful')
-                send_order_notifications.delay(order.id, 'order_confirmed')
-                send_order_notifications.delay(order.id, 'invoice_sent')
-                logger.info(f"[NOTIFICATION] Notification tasks queued for order {order.id}")
-            except Exception as celery_error:
-                # Fallback to synchronous if Celery unavailable
-                logger.warning(f"[NOTIFICATION] Celery unavailable, sending synchronously: {str(celery_error)}")
-                send_order_notifications(order.id, 'payment_successful')
-                send_order_notifications(order.id, 'order_confirmed')
-                send_order_notifications(order.id, 'invoice_sent')
-                logger.info(f"[NOTIFICATION] Notifications sent synchronously for order {order.id}")
+            # Queued asynchronously, sent inline if Celery is unavailable
+            send_notifications([(order.id, event) for event in CONFIRMATION_EVENTS])
+            logger.info(f"[NOTIFICATION] Notification tasks queued for order {order.id}")
         except Exception as notif_error:
             logger.error(f"[NOTIFICATION] Failed to send notifications for order {order.id}: {str(notif_error)}")
             # Don't fail the payment callback due to notification errors
@@ -772,6 +620,40 @@ def payment_callback(request):
         }, status=500)
 
 
+@require_POST
+@csrf_exempt
+def razorpay_webhook(request):
+    """Razorpay webhook receiver
+    
+    Verifies X-Razorpay-Signature, stores the event in the webhook inbox and
+    acknowledges at once. orders.services.webhooks applies it to the order.
+    """
+    if not verify_webhook_signature(
+        request.body,
+        request.headers.get('X-Razorpay-Signature', ''),
+        settings.RAZORPAY_WEBHOOK_SECRET,
+    ):
+        logger.error("[WEBHOOK_SECURITY] Invalid or missing webhook signature")
+        return JsonResponse({'status': 'error', 'message': 'Invalid signature'}, status=400)
+    
+    try:
+        event = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid payload'}, status=400)
+    
+    # Razorpay reuses the event id on redelivery; fall back to the body hash
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(request.body).hexdigest()
+    record_event(event_id, event)
+    
+    try:
+        process_payment_webhooks.delay()
+    except Exception as e:
+        # Celery beat picks the event up on its next run
+        logger.warning(f"[WEBHOOK] Could not queue webhook processing: {str(e)}")
+    
+    return JsonResponse({'status': 'ok'})
+
+
 @login_required
 @require_POST
 def cancel_order(request, order_id):
@@ -791,32 +673,20 @@ def cancel_order(request, order_id):
             order.status = 'cancelled'
             order.cancelled_at = timezone.now()
             
+            refund = None
             if order.payment_method == 'online' and order.razorpay_payment_id:
-                razorpay_client = get_razorpay_client()
-                if razorpay_client:
-                    refund = razorpay_client.payment.refund(
-                        order.razorpay_payment_id,
-                        {'amount': int(order.total_amount * 100)}
-                    )
-                    order.refund_id = refund['id']
-                    order.refund_status = refund['status']
-                    order.refund_amount = order.total_amount
-                    order.payment_status = 'refunded'
+                # Sent to Razorpay by a worker after commit; see orders.services.refunds
+                refund = request_refund(order, reason='Cancelled by customer')
+                order.refund_status = 'pending'
             
             order.save()
-            
-            # Trigger refund notification
-            try:
-                if order.refund_id:
-                    send_order_notifications.delay(order.id, 'refund_processed')
-            except Exception as e:
-                logger.error(f"Failed to queue refund notification for order {order.id}: {str(e)}")
+            release_reservations(order)
             
             OrderStatusHistory.objects.create(
                 order=order,
                 status='cancelled',
                 updated_by=request.user,
-                notes=f"Cancelled by customer. Refund: {order.refund_id or 'N/A'}"
+                notes=f"Cancelled by customer. Refund: {'requested' if refund else 'N/A'}"
             )
             
             messages.success(request, 'Order cancelled successfully.')
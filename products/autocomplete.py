@@ -0,0 +1,204 @@
+"""
+In-memory autocomplete for the header search box.
+
+Certified product names are tokenized into a sorted term array; a keystroke is
+answered with bisect range lookups instead of a database query. Tokens with no
+prefix match fall back to terms one edit away, and results are ordered by
+units sold so popular products surface first. The index is reloaded in the
+background (see products.indexing), never inside a keystroke request.
+"""
+import bisect
+import heapq
+import logging
+import time
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from .indexing import RefreshingIndex
+from .models import Product
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 8
+# Shortest token that may be corrected by one edit
+TYPO_MIN_LENGTH = 4
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or swap"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        # adjacent transposition
+        return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    if la > lb:
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+class _Terms:
+    """One build of the suggestion index: sorted term array and postings"""
+
+    def __init__(self, popularity=None):
+        self.names = {}  # pk -> display name
+        self.popularity = popularity or {}  # pk -> units sold
+        self.postings = defaultdict(set)  # term -> {pk}
+        self.doc_terms = {}
+        self.terms = []
+        self.dirty = False
+
+    def add(self, pk, name):
+        self.names[pk] = name
+        terms = set(tokenize(name))
+        for term in terms:
+            if term not in self.postings:
+                self.dirty = True
+            self.postings[term].add(pk)
+        self.doc_terms[pk] = terms
+
+    def remove(self, pk):
+        self.names.pop(pk, None)
+        for term in self.doc_terms.pop(pk, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.discard(pk)
+                if not postings:
+                    del self.postings[term]
+                    self.dirty = True
+
+    def sort(self):
+        if self.dirty:
+            self.terms = sorted(self.postings)
+            self.dirty = False
+
+
+class SuggestionIndex(RefreshingIndex):
+    """Sorted term array over certified product names"""
+
+    name = 'search suggestion index'
+
+    def __init__(self):
+        super().__init__()
+        self._data = _Terms()
+        self._hits = 0
+        self._misses = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    # ----- maintenance -----
+
+    def _load(self):
+        from orders.models import OrderItem
+
+        rows = Product.objects.filter(certification_status='certified').values_list('id', 'name')
+        sold = OrderItem.objects.values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        data = _Terms(dict(sold))
+        for pk, name in rows.iterator(chunk_size=2000):
+            data.add(pk, name)
+        data.sort()
+        return data
+
+    def _install(self, data):
+        self._data = data
+        logger.info(f"Search suggestion index built with {len(data.names)} products")
+
+    def _index(self, product):
+        if product.certification_status == 'certified':
+            self._data.add(product.pk, product.name)
+
+    def _unindex(self, pk):
+        self._data.remove(pk)
+
+    # ----- querying -----
+
+    def _prefix_matches(self, token):
+        data = self._data
+        terms = data.terms
+        matched = set()
+        i = bisect.bisect_left(terms, token)
+        while i < len(terms) and terms[i].startswith(token):
+            matched |= data.postings[terms[i]]
+            i += 1
+        return matched
+
+    def _fuzzy_matches(self, token):
+        """Terms sharing the first letter and within one edit of the token or its prefix"""
+        data = self._data
+        terms = data.terms
+        matched = set()
+        i = bisect.bisect_left(terms, token[0])
+        while i < len(terms) and terms[i][0] == token[0]:
+            term = terms[i]
+            if _within_one_edit(token, term[:len(token)]) or _within_one_edit(token, term):
+                matched |= data.postings[term]
+            i += 1
+        return matched
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        started = time.perf_counter()
+        self.ensure_fresh()
+        with self._lock:
+            self._data.sort()
+            candidates = None
+            for token in tokenize(query):
+                matched = self._prefix_matches(token)
+                if not matched and len(token) >= TYPO_MIN_LENGTH:
+                    matched = self._fuzzy_matches(token)
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    break
+
+            results = []
+            if candidates:
+                query_key = query.strip().lower()
+                names = self._data.names
+                popularity = self._data.popularity
+                ranked = heapq.nsmallest(
+                    limit,
+                    candidates,
+                    key=lambda pk: (
+                        not names[pk].lower().startswith(query_key),
+                        -popularity.get(pk, 0),
+                        names[pk].lower(),
+                    ),
+                )
+                results = [{'id': pk, 'name': names[pk]} for pk in ranked]
+
+            elapsed = time.perf_counter() - started
+            if results:
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+        return results
+
+    def stats(self):
+        """Hit/miss and latency counters since process start"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'products': len(self._data.names),
+                'hits': self._hits,
+                'misses': self._misses,
+                'avg_latency_ms': round(self._latency_total / lookups * 1000, 3) if lookups else 0.0,
+                'max_latency_ms': round(self._latency_max * 1000, 3),
+            }
+
+
+suggestion_index = SuggestionIndex()
+
+
+def warm_up():
+    """Start building the index in the background at worker start, so the first keystroke finds it ready"""
+    suggestion_index.start_refresh()
@@ -0,0 +1,124 @@
+"""
+Refresh plumbing shared by the per-process in-memory product indexes
+(products.search.InMemorySearchBackend and products.autocomplete.SuggestionIndex).
+
+An index is built once, kept current by products.signals, and reloaded
+every PRODUCT_SEARCH_INDEX_TTL seconds to pick up writes made by other
+processes. The reload runs on a background thread: requests keep reading
+the stale index until the new one is swapped in, and product changes made
+while it loads are replayed onto it. Only a process that has never built
+its index makes a request wait, and start_refresh() at worker start (see
+certibuy.wsgi) normally has it ready before the first request.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshingIndex:
+    """Subclasses implement _load() (query, no lock held), _install(state), _index(product) and _unindex(pk)"""
+
+    name = 'index'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held by whoever is loading, so a cold request waits for a warm-up already under way
+        self._build_lock = threading.Lock()
+        self._built_at = None
+        self._refresh_thread = None
+        self._replay = None  # (pk, product or None) changes seen while a load is running
+
+    # ----- subclass hooks -----
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _install(self, state):
+        raise NotImplementedError
+
+    def _index(self, product):
+        raise NotImplementedError
+
+    def _unindex(self, pk):
+        raise NotImplementedError
+
+    # ----- building -----
+
+    def rebuild(self):
+        """Load a fresh index and swap it in"""
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._replay = []
+        try:
+            state = self._load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._install(state)
+            for pk, product in replay:
+                self._unindex(pk)
+                if product is not None:
+                    self._index(product)
+            self._built_at = time.monotonic()
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.warning(f"Background rebuild of the {self.name} failed: {str(e)}")
+            with self._lock:
+                if self._built_at is not None:
+                    # Keep serving the old index and try again after another TTL
+                    self._built_at = time.monotonic()
+        finally:
+            connection.close()
+
+    def start_refresh(self):
+        """Rebuild on a background thread unless one is already running"""
+        with self._lock:
+            thread = self._refresh_thread
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._refresh, name=f'{self.name}-refresh', daemon=True)
+            self._refresh_thread = thread
+        thread.start()
+
+    def ensure_fresh(self):
+        """Build a never-built index now; start a background rebuild of a stale one"""
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild()
+            return
+        ttl = getattr(settings, 'PRODUCT_SEARCH_INDEX_TTL', 300)
+        if time.monotonic() - self._built_at > ttl:
+            self.start_refresh()
+
+    # ----- incremental updates, called after commit by products.signals -----
+
+    def index_product(self, product):
+        """Add, refresh or drop a single product after it was saved"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((product.pk, product))
+            if self._built_at is not None:
+                self._unindex(product.pk)
+                self._index(product)
+
+    def remove_product(self, pk):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((pk, None))
+            if self._built_at is not None:
+                self._unindex(pk)
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+SEARCH_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS products_product_search_idx ON products_product USING GIN (("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+    "))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index backing products.search.PostgresSearchBackend (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SEARCH_INDEX_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_product_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_default_warranty_months_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 23:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['id']},
+        ),
+    ]
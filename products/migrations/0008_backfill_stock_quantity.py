@@ -0,0 +1,38 @@
+# Data migration: give listed products their unit of stock
+
+from django.db import migrations
+
+# Orders that hold on to their unit (paid or cash on delivery, not cancelled)
+SELLING_PAYMENT_STATUSES = ('success', 'cod_pending')
+
+
+def backfill_stock_quantity(apps, schema_editor):
+    """Set stock_quantity=1 on certified products still at the old default of 0
+
+    stock_quantity used to be informational and was left at 0, but checkout
+    now reserves stock. Each listing is one refurbished unit (as for products
+    created from an inspection), unless an order has already bought it.
+    """
+    Product = apps.get_model('products', 'Product')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    sold = (
+        OrderItem.objects.filter(order__payment_status__in=SELLING_PAYMENT_STATUSES)
+        .exclude(order__status='cancelled')
+        .values('product_id')
+    )
+    Product.objects.filter(certification_status='certified', stock_quantity=0).exclude(
+        pk__in=sold
+    ).update(stock_quantity=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_productimage_ordering'),
+        ('orders', '0010_notification_log_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stock_quantity, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.urls import reverse
 from django.conf import settings
 from core.validators import validate_image_file, validate_image_content_type, secure_filename
+from core.tracking import TrackedFieldsMixin
 
 
 def product_image_upload_path(instance, filename):
@@ -11,7 +12,9 @@ def product_image_upload_path(instance, filename):
     return f'products/{product_id}/{secure_name}'
 
 
-class Product(models.Model):
+class Product(TrackedFieldsMixin, models.Model):
+    tracked_fields = ('stock_quantity', 'low_stock_threshold')
+    
     CONDITION_CHOICES = [
         ('new', 'New'),
         ('excellent', 'Excellent'),
@@ -56,6 +59,10 @@ class ProductImage(models.Model):
         validators=[validate_image_file, validate_image_content_type]
     )
     
+    class Meta:
+        # Ordered so images.first() is answered from a prefetch_related cache
+        ordering = ['id']
+    
     def __str__(self):
         return f"{self.product.name} - Image"
 
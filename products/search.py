@@ -0,0 +1,414 @@
+"""
+Catalog search for the shop page.
+
+Two backends expose the same ``search()`` interface:
+- PostgresSearchBackend: full-text search ranked with ts_rank (used on PostgreSQL)
+- InMemorySearchBackend: per-process inverted index over certified products (SQLite / local dev)
+
+Both return the ranked product list together with facet counts for category,
+condition grade and price buckets, so the shop view needs no extra queries.
+"""
+import bisect
+import logging
+import re
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import BooleanField, Case, CharField, Count, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .indexing import RefreshingIndex
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+SORT_OPTIONS = ('relevance', 'newest', 'price_low', 'price_high', 'name')
+
+# Database ordering of each sort; pk last so ties keep a stable order between pages
+SORT_ORDERING = {
+    'relevance': ('-rank', '-created_at', '-pk'),
+    'newest': ('-created_at', '-pk'),
+    'price_low': ('price', 'pk'),
+    'price_high': ('-price', 'pk'),
+    'name': ('name', 'pk'),
+}
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('under_10k', 'Under ₹10,000', None, Decimal('10000')),
+    ('10k_25k', '₹10,000 – ₹25,000', Decimal('10000'), Decimal('25000')),
+    ('25k_50k', '₹25,000 – ₹50,000', Decimal('25000'), Decimal('50000')),
+    ('over_50k', 'Over ₹50,000', Decimal('50000'), None),
+]
+
+# Relative weight of a term hit in each indexed field
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _ordering(sort, ranked):
+    if sort == 'relevance' and not ranked:
+        sort = 'newest'
+    return SORT_ORDERING.get(sort, SORT_ORDERING['newest'])
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric terms"""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def price_bucket(price):
+    """Return the PRICE_BUCKETS key a price falls into"""
+    for key, _label, low, high in PRICE_BUCKETS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return key
+    return PRICE_BUCKETS[-1][0]
+
+
+class SearchResult:
+    """Ordered products for one search plus facet counts"""
+
+    __slots__ = ('object_list', 'facets', 'ordering')
+
+    def __init__(self, object_list, facets, ordering=SORT_ORDERING['newest']):
+        self.object_list = object_list
+        self.facets = facets
+        self.ordering = ordering
+
+    @property
+    def count(self):
+        """Number of matching products, taken from the price facet (no COUNT query)"""
+        return sum(n for _key, _label, n in self.facets['price'])
+
+
+class ProductResults:
+    """Lazy sequence of products for an ordered id list.
+
+    Only the slice requested by the paginator is loaded from the database.
+    """
+
+    def __init__(self, ids):
+        self._ids = ids
+        self._positions = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def position(self, pk):
+        """Index of a product in the results, or None (used by keyset cursors)"""
+        if self._positions is None:
+            self._positions = {product_id: i for i, product_id in enumerate(self._ids)}
+        return self._positions.get(pk)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            page_ids = self._ids[index]
+            products = Product.objects.prefetch_related('images').in_bulk(page_ids)
+            return [products[pk] for pk in page_ids if pk in products]
+        return Product.objects.prefetch_related('images').get(pk=self._ids[index])
+
+
+class _FacetCounter:
+    """Disjunctive facet counts: each facet ignores its own filter"""
+
+    def __init__(self, category, condition):
+        self.category_filter = category
+        self.condition_filter = condition
+        self.category = defaultdict(int)
+        self.condition = defaultdict(int)
+        self.price = defaultdict(int)
+
+    def add(self, category, condition, bucket, count=1):
+        category_ok = not self.category_filter or category == self.category_filter
+        condition_ok = not self.condition_filter or condition == self.condition_filter
+        if condition_ok:
+            self.category[category] += count
+        if category_ok:
+            self.condition[condition] += count
+        if category_ok and condition_ok:
+            self.price[bucket] += count
+        return category_ok and condition_ok
+
+    def as_dict(self):
+        return {
+            'category': sorted(self.category.items()),
+            'condition': [
+                (value, label, self.condition.get(value, 0))
+                for value, label in Product.CONDITION_CHOICES
+            ],
+            'price': [
+                (key, label, self.price.get(key, 0))
+                for key, label, _low, _high in PRICE_BUCKETS
+            ],
+        }
+
+
+class _IndexedProduct:
+    __slots__ = ('pk', 'name_key', 'category', 'condition_grade', 'price', 'bucket', 'created_ts')
+
+    def __init__(self, pk, name, category, condition_grade, price, created_at):
+        self.pk = pk
+        self.name_key = (name or '').lower()
+        self.category = category
+        self.condition_grade = condition_grade
+        self.price = price
+        self.bucket = price_bucket(price)
+        self.created_ts = created_at.timestamp() if created_at else 0.0
+
+
+class _Documents:
+    """One build of the in-memory search index"""
+
+    def __init__(self):
+        self.docs = {}
+        self.postings = defaultdict(dict)  # term -> {pk: weight}
+        self.doc_terms = {}  # pk -> terms, for removal
+        self.sorted_terms = None
+        self.sorted_ids = {}
+
+    def add(self, pk, name, category, condition_grade, price, created_at, description):
+        self.docs[pk] = _IndexedProduct(pk, name, category, condition_grade, Decimal(str(price)), created_at)
+        weights = defaultdict(float)
+        for field, text in (('name', name), ('category', category), ('description', description)):
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+        for term, weight in weights.items():
+            self.postings[term][pk] = weight
+        self.doc_terms[pk] = tuple(weights)
+        self.invalidate()
+
+    def remove(self, pk):
+        self.docs.pop(pk, None)
+        for term in self.doc_terms.pop(pk, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(pk, None)
+                if not postings:
+                    del self.postings[term]
+        self.invalidate()
+
+    def invalidate(self):
+        self.sorted_terms = None
+        self.sorted_ids = {}
+
+
+class InMemorySearchBackend(RefreshingIndex):
+    """Inverted index over certified products held in process memory.
+
+    Built on first search, kept current by products.signals and reloaded in
+    the background after PRODUCT_SEARCH_INDEX_TTL seconds, so writes made by
+    other worker processes are eventually picked up without a shop request
+    paying for the rebuild (see products.indexing).
+    """
+
+    name = 'product search index'
+    _INDEX_FIELDS = ('id', 'name', 'category', 'condition_grade', 'price', 'created_at', 'description')
+
+    def __init__(self):
+        super().__init__()
+        self._data = _Documents()
+
+    # ----- maintenance -----
+
+    def _load(self):
+        rows = Product.objects.filter(certification_status='certified').values_list(*self._INDEX_FIELDS)
+        data = _Documents()
+        for row in rows.iterator(chunk_size=2000):
+            data.add(*row)
+        return data
+
+    def _install(self, data):
+        self._data = data
+        logger.info(f"Product search index built with {len(data.docs)} products")
+
+    def _index(self, product):
+        if product.certification_status == 'certified':
+            self._data.add(
+                product.pk, product.name, product.category, product.condition_grade,
+                product.price, product.created_at, product.description,
+            )
+
+    def _unindex(self, pk):
+        self._data.remove(pk)
+
+    # ----- querying -----
+
+    def _match_term(self, token):
+        """Scores for every document containing a term starting with token"""
+        data = self._data
+        if data.sorted_terms is None:
+            data.sorted_terms = sorted(data.postings)
+        terms = data.sorted_terms
+        scores = defaultdict(float)
+        i = bisect.bisect_left(terms, token)
+        while i < len(terms) and terms[i].startswith(token):
+            # Exact term hits outrank prefix hits
+            factor = 1.0 if terms[i] == token else 0.5
+            for pk, weight in data.postings[terms[i]].items():
+                scores[pk] = max(scores[pk], weight * factor)
+            i += 1
+        return scores
+
+    def _ordered(self, sort):
+        data = self._data
+        order = data.sorted_ids.get(sort)
+        if order is None:
+            docs = data.docs.values()
+            if sort == 'price_low':
+                docs = sorted(docs, key=lambda d: (d.price, d.pk))
+            elif sort == 'price_high':
+                docs = sorted(docs, key=lambda d: (-d.price, d.pk))
+            elif sort == 'name':
+                docs = sorted(docs, key=lambda d: (d.name_key, d.pk))
+            else:
+                docs = sorted(docs, key=lambda d: (-d.created_ts, -d.pk))
+            order = data.sorted_ids[sort] = [d.pk for d in docs]
+        return order
+
+    def search(self, text='', category='', condition='', min_price=None, max_price=None, sort='newest'):
+        self.ensure_fresh()
+        with self._lock:
+            all_docs = self._data.docs
+
+            scores = None
+            for token in set(tokenize(text)):
+                term_scores = self._match_term(token)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: s + term_scores[pk] for pk, s in scores.items() if pk in term_scores}
+                if not scores:
+                    break
+
+            candidates = all_docs.keys() if scores is None else scores.keys()
+            facets = _FacetCounter(category, condition)
+            matched = set()
+            for pk in candidates:
+                doc = all_docs[pk]
+                if min_price is not None and doc.price < min_price:
+                    continue
+                if max_price is not None and doc.price > max_price:
+                    continue
+                if facets.add(doc.category, doc.condition_grade, doc.bucket):
+                    matched.add(pk)
+
+            ordering = _ordering(sort, ranked=scores is not None)
+            if sort == 'relevance' and scores is not None:
+                ids = sorted(matched, key=lambda pk: (-scores[pk], -all_docs[pk].created_ts, -pk))
+            elif len(matched) == len(all_docs):
+                ids = list(self._ordered(sort))
+            else:
+                ids = [pk for pk in self._ordered(sort) if pk in matched]
+
+        return SearchResult(ProductResults(ids), facets.as_dict(), ordering)
+
+
+class PostgresSearchBackend:
+    """Full-text search using PostgreSQL tsvector / ts_rank.
+
+    The document expression matches the GIN index created in
+    products/migrations/0006_product_search_index.py so the planner can use it.
+    """
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('english', coalesce(products_product.name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(products_product.category, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(products_product.description, '')), 'C')"
+    )
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, pk):
+        pass
+
+    def _bucket_expression(self):
+        whens = []
+        for key, _label, low, high in PRICE_BUCKETS:
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            whens.append(When(condition, then=Value(key)))
+        return Case(*whens, default=Value(PRICE_BUCKETS[-1][0]), output_field=CharField())
+
+    def search(self, text='', category='', condition='', min_price=None, max_price=None, sort='newest'):
+        base = Product.objects.filter(certification_status='certified')
+        text = (text or '').strip()
+        if text:
+            query_sql = "websearch_to_tsquery('english', %s)"
+            base = base.filter(
+                RawSQL(f"({self.DOCUMENT_SQL}) @@ {query_sql}", [text], output_field=BooleanField())
+            )
+        if min_price is not None:
+            base = base.filter(price__gte=min_price)
+        if max_price is not None:
+            base = base.filter(price__lte=max_price)
+
+        # One grouped query feeds all three facets
+        facets = _FacetCounter(category, condition)
+        rows = (
+            base.annotate(bucket=self._bucket_expression())
+            .order_by()
+            .values_list('category', 'condition_grade', 'bucket')
+            .annotate(n=Count('pk'))
+        )
+        for row_category, row_condition, bucket, n in rows:
+            facets.add(row_category, row_condition, bucket, n)
+
+        products = base.prefetch_related('images')
+        if category:
+            products = products.filter(category=category)
+        if condition:
+            products = products.filter(condition_grade=condition)
+
+        if sort == 'relevance' and text:
+            products = products.annotate(
+                rank=RawSQL(f"ts_rank({self.DOCUMENT_SQL}, {query_sql})", [text], output_field=FloatField())
+            )
+        ordering = _ordering(sort, ranked=bool(text))
+        products = products.order_by(*ordering)
+
+        return SearchResult(products, facets.as_dict(), ordering)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide search backend for the configured database"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if connection.vendor == 'postgresql':
+                    _backend = PostgresSearchBackend()
+                else:
+                    _backend = InMemorySearchBackend()
+    return _backend
+
+
+def warm_up():
+    """Start loading the in-memory backend in the background at worker start"""
+    backend = get_backend()
+    if isinstance(backend, RefreshingIndex):
+        backend.start_refresh()
+
+
+def search_products(text='', category='', condition='', min_price=None, max_price=None, sort='newest'):
+    """Search certified products; see SearchResult"""
+    if sort not in SORT_OPTIONS:
+        sort = 'newest'
+    return get_backend().search(
+        text=text,
+        category=category,
+        condition=condition,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+    )
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import suggestion_index
+from .models import Product
+from .search import get_backend
+
+
+@receiver(post_save, sender=Product)
+def _sync_search_index(sender, instance, **kwargs):
+    """Keep the shop search and suggestion indexes in step with product saves"""
+    def sync():
+        get_backend().index_product(instance)
+        suggestion_index.index_product(instance)
+
+    transaction.on_commit(sync)
+
+
+@receiver(post_delete, sender=Product)
+def _drop_from_search_index(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def sync():
+        get_backend().remove_product(pk)
+        suggestion_index.remove_product(pk)
+
+    transaction.on_commit(sync)
@@ -1,13 +1,19 @@
 from django.shortcuts import render, get_object_or_404
 from django.views.generic import ListView, DetailView
+from core.pagination import KeysetPaginator
 from .models import Product
+from .search import SORT_ORDERING
 from orders.models import WarrantyPlan
 
 class ProductListView(ListView):
     model = Product
     template_name = 'products/product_list.html'
     context_object_name = 'products'
-    paginate_by = 12
+    per_page = 12
+    
+    def get_sort(self):
+        sort = self.request.GET.get('sort', 'newest')
+        return sort if sort in SORT_ORDERING and sort != 'relevance' else 'newest'
     
     def get_queryset(self):
         queryset = Product.objects.filter(certification_status='certified').prefetch_related('images')
@@ -15,6 +21,19 @@ class ProductListView(ListView):
         if category:
             queryset = queryset.filter(category=category)
         return queryset
+    
+    def get_context_data(self, **kwargs):
+        # Keyset pages instead of paginate_by: no COUNT(*) over the catalog and no OFFSET
+        sort = self.get_sort()
+        paginator = KeysetPaginator(self.object_list, SORT_ORDERING[sort], self.per_page)
+        page_obj = paginator.get_page(self.request.GET.get('cursor'))
+        kwargs.update({
+            'page_obj': page_obj,
+            'is_paginated': page_obj.has_other_pages(),
+            'sort_by': sort,
+            'object_list': page_obj.object_list,
+        })
+        return super().get_context_data(**kwargs)
 
 class ProductDetailView(DetailView):
     model = Product
@@ -65,7 +65,7 @@ print("\n4. TEST ORDER CREATION")
 print("-" * 60)
 if client:
     try:
-        test_order = client.order.create({
+        test_order = client.create_order({
             'amount': 100,  # 1 INR in paise
             'currency': 'INR',
             'receipt': 'test-001',
@@ -74,7 +74,7 @@ else:
 print("\n4. TESTING API CONNECTION...")
 print("-" * 60)
 try:
-    test_order = client.order.create({
+    test_order = client.create_order({
         'amount': 100,  # ₹1.00 in paise
         'currency': 'INR',
         'receipt': 'test-config-check',